@@ -0,0 +1,118 @@
+"""
+Paridad y latencia de los backends de emoción (ver src/emocion_backends.py).
+
+Compara cada backend candidato contra la referencia (PyTorch fp32, el
+comportamiento original) sobre una muestra etiquetada:
+
+- exactitud contra las etiquetas y acuerdo de etiqueta con la referencia
+- diferencia máxima de probabilidades
+- latencia p50/p95 por mensaje (batch 1) y por lote, y RSS pico
+
+    python benchmarks/paridad_emocion.py --backends pytorch_int8,onnx,onnx_int8 --min-acuerdo 0.95
+
+Sale con código 1 si algún candidato queda por debajo de --min-acuerdo.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+
+import numpy as np
+
+DIR_BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(DIR_BENCHMARKS), "src"))
+
+from emocion_backends import BACKENDS, crear_backend
+
+MUESTRA = os.path.join(DIR_BENCHMARKS, "fixtures", "emociones_etiquetadas.jsonl")
+
+
+def cargar_muestra(ruta=MUESTRA):
+    with open(ruta, encoding="utf-8") as f:
+        return [json.loads(linea) for linea in f if linea.strip()]
+
+
+def medir(backend, textos, repeticiones, tam_lote):
+    # una pasada de calentamiento (asignación de buffers, optimización del grafo ONNX)
+    backend.probabilidades(textos[:tam_lote])
+    individuales = []
+    for _ in range(repeticiones):
+        for texto in textos:
+            inicio = time.perf_counter()
+            backend.probabilidades([texto])
+            individuales.append((time.perf_counter() - inicio) * 1000)
+    lotes = []
+    for _ in range(repeticiones):
+        for i in range(0, len(textos), tam_lote):
+            inicio = time.perf_counter()
+            backend.probabilidades(textos[i:i + tam_lote])
+            lotes.append((time.perf_counter() - inicio) * 1000)
+    probas = np.vstack([backend.probabilidades(textos[i:i + tam_lote]) for i in range(0, len(textos), tam_lote)])
+    return probas, {
+        "mensaje_p50_ms": float(np.percentile(individuales, 50)),
+        "mensaje_p95_ms": float(np.percentile(individuales, 95)),
+        f"lote{tam_lote}_p50_ms": float(np.percentile(lotes, 50)),
+        f"lote{tam_lote}_p95_ms": float(np.percentile(lotes, 95)),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Paridad y latencia de los backends de emoción")
+    parser.add_argument("--muestra", default=MUESTRA)
+    parser.add_argument("--referencia", default="pytorch", choices=BACKENDS)
+    parser.add_argument("--backends", default="pytorch_int8,onnx,onnx_int8")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--tam-lote", type=int, default=16)
+    parser.add_argument("--min-acuerdo", type=float, default=0.95, help="Acuerdo mínimo de etiqueta con la referencia")
+    parser.add_argument("--salida", default=os.path.join(DIR_BENCHMARKS, "resultados", "paridad_emocion.json"))
+    args = parser.parse_args(argv)
+
+    import wevently_langchain as wl
+
+    muestra = cargar_muestra(args.muestra)
+    textos = [m["texto"] for m in muestra]
+    etiquetas = np.array([m["emocion"] for m in muestra])
+    tokenizer = wl.REGISTRO.obtener("tokenizer")
+    cargar_modelo = lambda: wl.REGISTRO.obtener("emo_model")
+    id2label = np.array([wl.emotion_id2label[i] for i in sorted(wl.emotion_id2label)])
+
+    resultados = {}
+    ref_probas = None
+    for nombre in [args.referencia] + [b for b in args.backends.split(",") if b and b != args.referencia]:
+        inicio = time.perf_counter()
+        backend = crear_backend(nombre, tokenizer, cargar_modelo)
+        carga_ms = (time.perf_counter() - inicio) * 1000
+        probas, latencias = medir(backend, textos, args.repeticiones, args.tam_lote)
+        predichas = id2label[probas.argmax(axis=1)]
+        fila = {
+            "carga_ms": carga_ms,
+            "exactitud": float((predichas == etiquetas).mean()),
+            **latencias,
+            "rss_pico_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        }
+        if ref_probas is None:
+            ref_probas, ref_predichas = probas, predichas
+        else:
+            fila["acuerdo_con_referencia"] = float((predichas == ref_predichas).mean())
+            fila["max_diff_probabilidad"] = float(np.abs(probas - ref_probas).max())
+        resultados[nombre] = fila
+        print(f"{nombre:<13} exactitud={fila['exactitud']:.3f} "
+              f"acuerdo={fila.get('acuerdo_con_referencia', 1.0):.3f} "
+              f"p50={fila['mensaje_p50_ms']:.1f}ms p95={fila['mensaje_p95_ms']:.1f}ms "
+              f"lote p50={fila[f'lote{args.tam_lote}_p50_ms']:.1f}ms")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.salida)), exist_ok=True)
+    with open(args.salida, "w", encoding="utf-8") as f:
+        json.dump({"referencia": args.referencia, "muestra": len(muestra), "backends": resultados}, f, ensure_ascii=False, indent=2)
+
+    fallidos = [n for n, r in resultados.items() if r.get("acuerdo_con_referencia", 1.0) < args.min_acuerdo]
+    if fallidos:
+        print(f"Backends por debajo del acuerdo mínimo ({args.min_acuerdo}): {', '.join(fallidos)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+"""
+Perfil del plan de la consulta de recuperación contra un Neo4j local sembrado.
+
+Siembra el subgrafo del fixture (benchmarks/fixtures/kg_fixture.json) más
+PalabraClave sintéticas para simular una base de conocimiento grande, crea el
+esquema (ver src/esquema_kg.py) y ejecuta PROFILE de la consulta indexada y de
+la original con toLower para varios conjuntos de keywords. Falla (código 1) si
+la consulta indexada usa operadores que recorren la etiqueta completa, deja de
+usar NodeIndexSeek o sus db hits superan la base guardada más la tolerancia.
+
+Usar sólo contra una instancia descartable (p. ej. un contenedor local):
+
+    python benchmarks/perfil_kg.py --sembrar --palabras-extra 20000 --guardar-base benchmarks/resultados/perfil_kg_base.json
+    python benchmarks/perfil_kg.py --base benchmarks/resultados/perfil_kg_base.json --tolerancia 0.2
+"""
+import os
+import sys
+import json
+import argparse
+
+DIR_BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(DIR_BENCHMARKS), "src"))
+
+from recuperacion_kg import CYPHER_RECUPERACION, CYPHER_RECUPERACION_INDEXADA, parametros_recuperacion
+from esquema_kg import crear_esquema, perfilar, regresiones
+
+FIXTURE_KG = os.path.join(DIR_BENCHMARKS, "fixtures", "kg_fixture.json")
+
+CYPHER_SEMBRAR = """
+    UNWIND $categorias AS cat
+    MERGE (c:CategoriaProblema {id: cat.id})
+    SET c.nombre = cat.id, c.confianzaDecision = cat.confianzaDecision
+    FOREACH (palabra IN cat.palabras_clave |
+        MERGE (k:PalabraClave {nombre: palabra})
+        SET k.nombre_lower = toLower(palabra)
+        MERGE (k)-[:DISPARA]->(c))
+    FOREACH (rol IN cat.tipos_usuario |
+        MERGE (tu:TipoUsuario {nombre: rol})
+        MERGE (c)-[:TIENE_UN]->(tu))
+    FOREACH (tipo IN cat.tipos_problema |
+        MERGE (t:TipoProblema {nombre: tipo.nombre})
+        MERGE (c)-[:AGRUPA]->(t)
+        FOREACH (accion IN tipo.soluciones |
+            MERGE (s:Solucion {accion: accion})
+            MERGE (t)-[:RESUELTO_POR]->(s)))
+    """
+CYPHER_SEMBRAR_SINTETICAS = """
+    UNWIND range($desde, $hasta) AS i
+    MERGE (k:PalabraClave {nombre: 'Sintetica_' + toString(i)})
+    SET k.nombre_lower = toLower(k.nombre)
+    """
+
+
+def cargar_fixture(ruta=FIXTURE_KG):
+    with open(ruta, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def conjuntos_keywords(datos):
+    """Un conjunto por categoría (sus 3 primeras keywords), uno mixto y uno sin coincidencias."""
+    conjuntos = {c["id"]: c["palabras_clave"][:3] for c in datos["categorias"]}
+    conjuntos["mixto"] = [c["palabras_clave"][0] for c in datos["categorias"]]
+    conjuntos["sin_coincidencias"] = ["zzz", "inexistente"]
+    return conjuntos
+
+
+def sembrar(graph, datos, palabras_extra, lote=5000):
+    graph.query(CYPHER_SEMBRAR, {"categorias": datos["categorias"]})
+    for desde in range(1, palabras_extra + 1, lote):
+        graph.query(CYPHER_SEMBRAR_SINTETICAS, {"desde": desde, "hasta": min(desde + lote - 1, palabras_extra)})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PROFILE de la consulta de recuperación con umbrales de regresión")
+    parser.add_argument("--fixture-kg", default=FIXTURE_KG)
+    parser.add_argument("--sembrar", action="store_true", help="Siembra el fixture en el Neo4j configurado (instancia descartable)")
+    parser.add_argument("--palabras-extra", type=int, default=20000, help="PalabraClave sintéticas a sembrar")
+    parser.add_argument("--tipo-usuario", default="Organizador")
+    parser.add_argument("--base", default=None, help="JSON de perfil base para detectar regresiones")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="Aumento de db hits tolerado sobre la base")
+    parser.add_argument("--guardar-base", default=None, help="Guarda este perfil como nueva base")
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+    from neo4j_connection import get_graph
+    load_dotenv()
+    graph = get_graph()
+    datos = cargar_fixture(args.fixture_kg)
+    if args.sembrar:
+        sembrar(graph, datos, args.palabras_extra)
+    esquema = crear_esquema(graph)
+    if not esquema["ok"]:
+        print(f"Esquema incompleto: {json.dumps(esquema, ensure_ascii=False)}")
+        return 1
+
+    base = None
+    if args.base:
+        with open(args.base, encoding="utf-8") as f:
+            base = json.load(f)["conjuntos"]
+    resultado, problemas = {}, []
+    for nombre, keywords in conjuntos_keywords(datos).items():
+        params = parametros_recuperacion(keywords, args.tipo_usuario)
+        indexada = perfilar(graph, CYPHER_RECUPERACION_INDEXADA, params)
+        original = perfilar(graph, CYPHER_RECUPERACION, params)
+        resultado[nombre] = {"db_hits": indexada["db_hits"], "operadores": indexada["operadores"],
+                             "db_hits_tolower": original["db_hits"]}
+        print(f"{nombre:<22} db hits indexada={indexada['db_hits']:>8} toLower={original['db_hits']:>8} "
+              f"operadores={','.join(indexada['operadores'])}")
+        problemas += [f"{nombre}: {p}" for p in regresiones(indexada, (base or {}).get(nombre), args.tolerancia)]
+
+    if args.guardar_base:
+        os.makedirs(os.path.dirname(os.path.abspath(args.guardar_base)), exist_ok=True)
+        with open(args.guardar_base, "w", encoding="utf-8") as f:
+            json.dump({"palabras_extra": args.palabras_extra, "conjuntos": resultado}, f, ensure_ascii=False, indent=2)
+    for problema in problemas:
+        print(f"REGRESIÓN {problema}")
+    return 1 if problemas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,400 @@
+"""
+Benchmark offline del pipeline completo de Wevently.
+
+Reproduce un corpus de mensajes de soporte contra `wevently_langchain` usando los
+modelos locales reales (spaCy, BETO, RandomForest + TF-IDF, lógica difusa) y
+dobles locales para lo remoto:
+
+- GraphFixture: reemplaza a Neo4jGraph; responde la consulta de recuperación
+  desde un fixture del grafo de conocimiento (benchmarks/fixtures/kg_fixture.json)
+  con latencia configurable.
+- LLMFalso: reemplaza a OllamaLLM (invoke/ainvoke/stream); respuestas
+  determinísticas con latencia y ritmo de tokens configurables.
+- SinkMemoria: reemplaza a SinkResultados para leer el desglose `tiempos`
+  de cada consulta.
+
+Reporta p50/p95/p99 por etapa (keywords, emoción, fuzzy, neo4j, llm, total),
+throughput para cada nivel de concurrencia y RSS pico, y guarda todo en JSON
+para comparar entre commits:
+
+    python benchmarks/replay_pipeline.py --concurrencia 1,4,8 --repeticiones 5
+    python benchmarks/replay_pipeline.py --comparar benchmarks/resultados/replay_abc1234.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import resource
+import platform
+import threading
+import subprocess
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+DIR_BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+DIR_REPO = os.path.dirname(DIR_BENCHMARKS)
+sys.path.insert(0, os.path.join(DIR_REPO, "src"))
+
+from recuperacion_kg import CYPHER_RECUPERACION, CYPHER_RECUPERACION_INDEXADA
+from snapshot_kg import (
+    SnapshotConocimiento,
+    CYPHER_SNAPSHOT_DISPARA,
+    CYPHER_SNAPSHOT_CATEGORIAS,
+    CYPHER_SNAPSHOT_TIPOS_USUARIO,
+)
+from esquema_kg import INDICES, CYPHER_ESTADO_INDICES, CYPHER_PENDIENTES_NORMALIZAR
+
+FIXTURE_KG = os.path.join(DIR_BENCHMARKS, "fixtures", "kg_fixture.json")
+CORPUS = os.path.join(DIR_BENCHMARKS, "fixtures", "corpus_soporte.jsonl")
+DIR_RESULTADOS = os.path.join(DIR_BENCHMARKS, "resultados")
+
+ETAPAS = ("keywords_ms", "emocion_ms", "fuzzy_ms", "neo4j_ms", "llm_ms", "total_ms")
+PERCENTILES = (50, 95, 99)
+
+
+class Latencia:
+    """Latencia simulada: base + jitter uniforme, con semilla fija (thread-safe)."""
+    def __init__(self, base_ms, jitter_ms=0.0, semilla=0):
+        self.base_ms = base_ms
+        self.jitter_ms = jitter_ms
+        self._rnd = random.Random(semilla)
+        self._lock = threading.Lock()
+
+    def muestrear_s(self):
+        with self._lock:
+            extra = self._rnd.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+        return max(0.0, self.base_ms + extra) / 1000
+
+
+# --- Neo4j local ---
+def filas_desde_fixture(datos):
+    """Convierte el fixture del grafo en las filas que devuelven las consultas del snapshot."""
+    filas_dispara, filas_categorias, filas_tipos = [], [], []
+    for categoria in datos["categorias"]:
+        cid = categoria["id"]
+        for palabra in categoria["palabras_clave"]:
+            filas_dispara.append({"palabra": palabra, "categoria": cid})
+        filas_categorias.append({
+            "categoria": cid,
+            "confianza": categoria.get("confianzaDecision", 0),
+            "soluciones": [[t["nombre"], s] for t in categoria["tipos_problema"] for s in t["soluciones"]],
+        })
+        filas_tipos.append({"categoria": cid, "tipos_usuario": list(categoria["tipos_usuario"])})
+    return filas_dispara, filas_categorias, filas_tipos
+
+
+class GraphFixture:
+    """
+    Doble de Neo4jGraph con la misma interfaz `query(cypher, params)`.
+    La consulta de recuperación se resuelve con SnapshotConocimiento, que
+    reproduce su semántica (orden por has_type, matched_count, confianza).
+    """
+    def __init__(self, ruta=FIXTURE_KG, latencia=None):
+        with open(ruta, encoding="utf-8") as f:
+            datos = json.load(f)
+        self.filas_dispara, self.filas_categorias, self.filas_tipos = filas_desde_fixture(datos)
+        self._snapshot = SnapshotConocimiento(None, ttl_s=float("inf"))
+        self._snapshot.cargar_desde_filas(self.filas_dispara, self.filas_categorias, self.filas_tipos)
+        self.latencia = latencia or Latencia(0)
+        self.consultas = Counter()
+
+    def query(self, cypher, params=None):
+        time.sleep(self.latencia.muestrear_s())
+        params = params or {}
+        if cypher in (CYPHER_RECUPERACION, CYPHER_RECUPERACION_INDEXADA):
+            self.consultas["recuperacion"] += 1
+            return self._snapshot.consultar(params["kws"], params["tipo_usuario"])
+        respuestas = {
+            CYPHER_SNAPSHOT_DISPARA: self.filas_dispara,
+            CYPHER_SNAPSHOT_CATEGORIAS: self.filas_categorias,
+            CYPHER_SNAPSHOT_TIPOS_USUARIO: self.filas_tipos,
+            # esquema con el índice de nombre_lower listo: el recuperador usa la consulta indexada
+            CYPHER_ESTADO_INDICES: [{"name": nombre, "state": "ONLINE"} for nombre in INDICES],
+            CYPHER_PENDIENTES_NORMALIZAR: [{"pendientes": 0}],
+        }
+        self.consultas["otras"] += 1
+        if cypher in respuestas:
+            return [dict(f) for f in respuestas[cypher]]
+        if cypher.strip().startswith("RETURN 1"):
+            return [{"ok": 1}]
+        raise ValueError(f"Consulta no soportada por GraphFixture: {cypher.strip()[:80]}")
+
+
+# --- LLM local ---
+RESPUESTA_FALSA = (
+    "Gracias por escribirnos. Revisamos tu consulta y la solución sugerida es la indicada en la base de "
+    "conocimiento. Si el inconveniente persiste, responde este mensaje con el detalle y te ayudamos."
+)
+
+
+class LLMFalso:
+    """
+    Doble determinístico de OllamaLLM. `invoke`/`ainvoke` esperan la latencia
+    hasta el primer token más `ms_por_token` por cada token; `stream` entrega
+    la respuesta palabra por palabra con ese mismo ritmo.
+    """
+    def __init__(self, latencia=None, ms_por_token=0.0):
+        self.latencia = latencia or Latencia(0)
+        self.ms_por_token = ms_por_token
+        self.llamadas = Counter()
+        self._lock = threading.Lock()
+
+    def _responder(self, prompt):
+        if "Responde SOLO con un objeto JSON" in prompt:
+            tipo = "seleccion_y_respuesta"
+            texto = json.dumps({"opcion": 1, "respuesta": RESPUESTA_FALSA}, ensure_ascii=False)
+        elif "Responde exactamente con 'Opción X:'" in prompt:
+            tipo = "seleccion"
+            texto = "Opción 1: es la que mejor coincide con las keywords y la emoción del usuario."
+        else:
+            tipo = "respuesta"
+            texto = RESPUESTA_FALSA
+        with self._lock:
+            self.llamadas[tipo] += 1
+        return texto
+
+    def _duracion_s(self, texto):
+        return self.latencia.muestrear_s() + len(texto.split()) * self.ms_por_token / 1000
+
+    def invoke(self, prompt, **_):
+        texto = self._responder(prompt)
+        time.sleep(self._duracion_s(texto))
+        return texto
+
+    async def ainvoke(self, prompt, **_):
+        texto = self._responder(prompt)
+        await asyncio.sleep(self._duracion_s(texto))
+        return texto
+
+    def stream(self, prompt, **_):
+        texto = self._responder(prompt)
+        time.sleep(self.latencia.muestrear_s())
+        palabras = texto.split(" ")
+        for i, palabra in enumerate(palabras):
+            if i:
+                time.sleep(self.ms_por_token / 1000)
+            yield palabra if i == len(palabras) - 1 else palabra + " "
+
+
+class SinkMemoria:
+    """Doble de SinkResultados: guarda los registros en memoria."""
+    def __init__(self):
+        self.registros = []
+        self._lock = threading.Lock()
+
+    def registrar(self, registro):
+        with self._lock:
+            self.registros.append(registro)
+        return True
+
+    def vaciar(self):
+        with self._lock:
+            registros, self.registros = self.registros, []
+        return registros
+
+    def cerrar(self, timeout=None):
+        pass
+
+    def estadisticas(self):
+        return {"encolados": len(self.registros)}
+
+
+# --- Ejecución ---
+def cargar_corpus(ruta=CORPUS):
+    with open(ruta, encoding="utf-8") as f:
+        return [json.loads(linea) for linea in f if linea.strip()]
+
+
+def _llamar(wl, modo, mensaje, tipo_usuario):
+    if modo == "stream":
+        stream = wl.generar_respuesta_stream(mensaje, tipo_usuario)
+        for _ in stream:
+            pass
+        return stream.resultado
+    if modo == "async":
+        return asyncio.run(wl.agenerar_respuesta(mensaje, tipo_usuario))
+    return wl.generar_respuesta_streamlit(mensaje, tipo_usuario)
+
+
+def percentiles(valores):
+    if not valores:
+        return {"n": 0}
+    p = np.percentile(np.array(valores, dtype=float), PERCENTILES)
+    return {"n": len(valores), **{f"p{q}": float(v) for q, v in zip(PERCENTILES, p)},
+            "media": float(np.mean(valores))}
+
+
+def rss_pico_mb():
+    # ru_maxrss está en KB en Linux y en bytes en macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024) if platform.system() == "Darwin" else maxrss / 1024
+
+
+def ejecutar_nivel(wl, sink, corpus, concurrencia, repeticiones, modo):
+    if wl.cache_respuestas is not None:
+        wl.cache_respuestas.invalidar()
+    sink.vaciar()
+    trabajos = [(m["mensaje"], m["tipo_usuario"]) for _ in range(repeticiones) for m in corpus]
+    latencias_ms, errores = [], 0
+    lock = threading.Lock()
+
+    def _uno(trabajo):
+        nonlocal errores
+        inicio = time.perf_counter()
+        try:
+            _llamar(wl, modo, *trabajo)
+        except Exception:
+            with lock:
+                errores += 1
+            return
+        with lock:
+            latencias_ms.append((time.perf_counter() - inicio) * 1000)
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+        list(pool.map(_uno, trabajos))
+    duracion_s = time.perf_counter() - inicio
+
+    registros = sink.vaciar()
+    completos = [r for r in registros if r.get("tiempos")]
+    etapas = {etapa: percentiles([r["tiempos"][etapa] for r in completos if etapa in r["tiempos"]]) for etapa in ETAPAS}
+    return {
+        "concurrencia": concurrencia,
+        "solicitudes": len(trabajos),
+        "errores": errores,
+        "duracion_s": duracion_s,
+        "throughput_rps": len(latencias_ms) / duracion_s if duracion_s else 0.0,
+        "latencia_llamada_ms": percentiles(latencias_ms),
+        "etapas": etapas,
+        "fallbacks_dominio": len(registros) - len(completos),
+        "rutas_seleccion": dict(Counter(r.get("ruta_seleccion") for r in completos)),
+        "rss_pico_mb": rss_pico_mb(),
+    }
+
+
+def commit_actual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=DIR_REPO, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar(base, actual):
+    """Diferencias relativas (%) de p50/p95/p99 por etapa y de throughput entre dos corridas."""
+    niveles_base = {n["concurrencia"]: n for n in base["niveles"]}
+    comparacion = []
+    for nivel in actual["niveles"]:
+        anterior = niveles_base.get(nivel["concurrencia"])
+        if anterior is None:
+            continue
+        fila = {"concurrencia": nivel["concurrencia"], "etapas": {}}
+        for etapa in ETAPAS + ("latencia_llamada_ms",):
+            antes = anterior["latencia_llamada_ms"] if etapa == "latencia_llamada_ms" else anterior["etapas"].get(etapa, {})
+            ahora = nivel["latencia_llamada_ms"] if etapa == "latencia_llamada_ms" else nivel["etapas"].get(etapa, {})
+            fila["etapas"][etapa] = {
+                f"p{q}_delta_pct": _delta_pct(antes.get(f"p{q}"), ahora.get(f"p{q}")) for q in PERCENTILES
+            }
+        fila["throughput_delta_pct"] = _delta_pct(anterior["throughput_rps"], nivel["throughput_rps"])
+        comparacion.append(fila)
+    return {"base_commit": base.get("commit"), "niveles": comparacion}
+
+
+def _delta_pct(antes, ahora):
+    if not antes or ahora is None:
+        return None
+    return (ahora - antes) / antes * 100
+
+
+def imprimir(resultado):
+    print(f"Commit {resultado['commit']} | modo {resultado['config']['modo']} | RSS pico {resultado['rss_pico_mb']:.0f} MB")
+    for nivel in resultado["niveles"]:
+        print(f"\nConcurrencia {nivel['concurrencia']}: {nivel['throughput_rps']:.2f} req/s, "
+              f"{nivel['solicitudes']} solicitudes, {nivel['errores']} errores, {nivel['fallbacks_dominio']} fallbacks")
+        for etapa, stats in list(nivel["etapas"].items()) + [("llamada_ms", nivel["latencia_llamada_ms"])]:
+            if stats.get("n"):
+                print(f"  {etapa:<12} p50={stats['p50']:9.1f}  p95={stats['p95']:9.1f}  p99={stats['p99']:9.1f}")
+    if "comparacion" in resultado:
+        print(f"\nContra {resultado['comparacion']['base_commit']}:")
+        for fila in resultado["comparacion"]["niveles"]:
+            total = fila["etapas"]["total_ms"]
+            print(f"  concurrencia {fila['concurrencia']}: total p50 {_fmt(total['p50_delta_pct'])}, "
+                  f"p95 {_fmt(total['p95_delta_pct'])}, throughput {_fmt(fila['throughput_delta_pct'])}")
+
+
+def _fmt(delta):
+    return "n/a" if delta is None else f"{delta:+.1f}%"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--corpus", default=CORPUS)
+    parser.add_argument("--fixture-kg", default=FIXTURE_KG)
+    parser.add_argument("--concurrencia", default="1,4,8", help="Niveles de llamadores concurrentes, separados por coma")
+    parser.add_argument("--repeticiones", type=int, default=3, help="Veces que se reproduce el corpus por nivel")
+    parser.add_argument("--modo", choices=("sync", "stream", "async"), default="sync")
+    parser.add_argument("--llm-latencia-ms", type=float, default=800.0)
+    parser.add_argument("--llm-jitter-ms", type=float, default=200.0)
+    parser.add_argument("--llm-ms-por-token", type=float, default=0.0)
+    parser.add_argument("--neo4j-latencia-ms", type=float, default=5.0)
+    parser.add_argument("--neo4j-jitter-ms", type=float, default=2.0)
+    parser.add_argument("--semilla", type=int, default=13)
+    parser.add_argument("--salida", default=None, help="Archivo JSON de resultados (por defecto benchmarks/resultados/replay_<commit>.json)")
+    parser.add_argument("--comparar", default=None, help="JSON de una corrida anterior para calcular diferencias")
+    args = parser.parse_args(argv)
+
+    import wevently_langchain as wl
+
+    sink = SinkMemoria()
+    graph = GraphFixture(args.fixture_kg, Latencia(args.neo4j_latencia_ms, args.neo4j_jitter_ms, args.semilla))
+    llm = LLMFalso(Latencia(args.llm_latencia_ms, args.llm_jitter_ms, args.semilla + 1), args.llm_ms_por_token)
+    wl.REGISTRO.fijar("graph", graph)
+    wl.REGISTRO.fijar("llm", llm)
+    wl.REGISTRO.fijar("llm_estructurado", llm)
+    wl.REGISTRO.fijar("sink_resultados", sink)
+    carga_ms = wl.warmup(list(wl.RECURSOS_LOCALES) + ["recuperador"])
+
+    corpus = cargar_corpus(args.corpus)
+    # Una pasada sin medir para estabilizar cachés de los modelos
+    for m in corpus[:5]:
+        _llamar(wl, args.modo, m["mensaje"], m["tipo_usuario"])
+    sink.vaciar()
+
+    niveles = [ejecutar_nivel(wl, sink, corpus, int(c), args.repeticiones, args.modo)
+               for c in args.concurrencia.split(",") if c.strip()]
+    resultado = {
+        "commit": commit_actual(),
+        "fecha": datetime.now().isoformat(),
+        "config": {
+            **{k: v for k, v in vars(args).items() if k not in ("salida", "comparar")},
+            "corpus_mensajes": len(corpus),
+            "entorno": {k: v for k, v in os.environ.items() if k.startswith("WEVENTLY_")},
+            "python": platform.python_version(),
+        },
+        "carga_modelos_ms": carga_ms,
+        "niveles": niveles,
+        "llm_llamadas": dict(llm.llamadas),
+        "neo4j_consultas": dict(graph.consultas),
+        "rss_pico_mb": rss_pico_mb(),
+    }
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            resultado["comparacion"] = comparar(json.load(f), resultado)
+
+    salida = args.salida or os.path.join(DIR_RESULTADOS, f"replay_{resultado['commit'] or 'sin_commit'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(salida)), exist_ok=True)
+    with open(salida, "w", encoding="utf-8") as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=2)
+    imprimir(resultado)
+    print(f"\nResultados guardados en {salida}")
+    return resultado
+
+
+if __name__ == "__main__":
+    main()
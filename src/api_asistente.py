@@ -0,0 +1,198 @@
+"""
+API HTTP del asistente (Módulo 9): expone el pipeline de wevently_langchain
+sin Streamlit.
+
+Los modelos viven en un pool de procesos pre-forkeado (WEVENTLY_API_WORKERS):
+el proceso de la API recibe requests, los coalesce, acota la concurrencia y la
+cola, y aplica timeouts y load shedding (503). Antes de llegar al 503, el
+controlador de degradación (ver degradacion.py) baja el nivel de servicio de
+las consultas según las pendientes y la latencia observada acá. Con WEVENTLY_API_PRECARGA (por
+defecto con fork) el proceso de la API carga los modelos una vez antes de
+forkear y los workers los comparten copy-on-write (ver prefork.py); si no,
+cada worker carga su propia copia.
+
+Los workers no escriben archivos: mandan el log y los registros de resultados
+por colas multiprocessing al proceso de la API, único escritor. Si un worker
+muere, el pool se reconstruye y /api/health responde 503 mientras tanto.
+
+    uvicorn api_asistente:app --app-dir src --host 0.0.0.0 --port 8000
+"""
+import os
+import sys
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Literal
+
+from dotenv import load_dotenv
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, JSONResponse
+from pydantic import BaseModel, Field
+
+load_dotenv()
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from despachador import DespachadorConsultas, ServicioSaturado, TiempoAgotado, PoolReiniciando
+from degradacion import ControladorDegradacion
+from prefork import precargar, reanudar_gc, reporte_memoria, publicar_metricas
+from trazas import METRICAS, METRICA_API, span
+
+logger = logging.getLogger(__name__)
+
+WORKERS = int(os.getenv("WEVENTLY_API_WORKERS", "2"))
+MAX_CONCURRENCIA = int(os.getenv("WEVENTLY_API_MAX_CONCURRENCIA", str(WORKERS)))
+MAX_COLA = int(os.getenv("WEVENTLY_API_MAX_COLA", str(4 * WORKERS)))
+TIMEOUT_S = float(os.getenv("WEVENTLY_API_TIMEOUT", "60"))
+MAX_CARACTERES = int(os.getenv("WEVENTLY_API_MAX_CARACTERES", "2000"))
+CONTEXTO_MP = os.getenv("WEVENTLY_API_MP_CONTEXTO", "fork" if sys.platform.startswith("linux") else "spawn")
+MAX_COLA_RESULTADOS = int(os.getenv("WEVENTLY_SINK_MAX_COLA", "10000"))
+# Sólo tiene sentido con fork: con spawn los workers no heredan la memoria del padre
+PRECARGA = os.getenv("WEVENTLY_API_PRECARGA", "1") == "1" and CONTEXTO_MP == "fork"
+# Las pendientes incluyen la cola: en cuanto empieza a llenarse se degradan las consultas nuevas
+CONTROLADOR_DEGRADACION = ControladorDegradacion(
+    max_en_vuelo=int(os.getenv("WEVENTLY_DEGRADACION_MAX_EN_VUELO", str(MAX_CONCURRENCIA))), nombre="api")
+
+
+# --- Funciones que corren en los workers ---
+def _inicializar_worker(cola_logs, cola_resultados):
+    from prefork import inicializar_worker
+    inicializar_worker(cola_logs, cola_resultados)
+
+def _worker_listo():
+    return os.getpid()
+
+def _procesar(mensaje, tipo_usuario, nivel_servicio):
+    import wevently_langchain as wl
+    return wl.generar_respuesta_streamlit(mensaje, tipo_usuario=tipo_usuario, nivel_servicio=nivel_servicio)
+
+
+# --- Esquema ---
+class ChatRequest(BaseModel):
+    mensaje: str = Field(..., min_length=1, max_length=MAX_CARACTERES)
+    tipo_usuario: Literal["Organizador", "Prestador", "Propietario"] = "Prestador"
+
+class ChatResponse(BaseModel):
+    respuesta: str
+    keywords: list[str]
+    emocion: str
+    confianza: float
+    timestamp: str
+    coalescida: bool = False
+    nivel_servicio: str = "completo"
+
+
+# --- Ciclo de vida ---
+estado = {"despachador": None, "listo": False, "workers": []}
+
+async def _crear_pool(contexto, colas):
+    """Levanta el pool y precalienta todos sus workers antes de aceptar tráfico (también al reconstruirlo)."""
+    ejecutor = ProcessPoolExecutor(max_workers=WORKERS, mp_context=contexto, initializer=_inicializar_worker, initargs=colas)
+    loop = asyncio.get_running_loop()
+    estado["workers"] = sorted(set(await asyncio.gather(*(loop.run_in_executor(ejecutor, _worker_listo) for _ in range(WORKERS)))))
+    return ejecutor
+
+@asynccontextmanager
+async def lifespan(app):
+    import wevently_langchain as wl
+    from sink_resultados import ReceptorResultados
+    from trazas import configurar_observabilidad
+    wl.configurar_logging()
+    configurar_observabilidad()
+    contexto = multiprocessing.get_context(CONTEXTO_MP)
+    cola_logs, cola_resultados = contexto.Queue(), contexto.Queue(MAX_COLA_RESULTADOS)
+    listener_logs = wl.escuchar_logs_workers(cola_logs)
+    receptor = ReceptorResultados(cola_resultados, wl.REGISTRO.obtener("sink_resultados"))
+    if PRECARGA:
+        precargar()
+    ejecutor = await _crear_pool(contexto, (cola_logs, cola_resultados))
+    estado["despachador"] = DespachadorConsultas(ejecutor, _procesar, MAX_CONCURRENCIA, MAX_COLA, TIMEOUT_S,
+                                                 reconstruir=lambda: _crear_pool(contexto, (cola_logs, cola_resultados)))
+    if PRECARGA:
+        # Con fork el pool crea todos sus workers en el primer submit: ya no quedan forks pendientes
+        reanudar_gc()
+    estado["listo"] = True
+    logger.info(f"API lista con {WORKERS} workers (pids {estado['workers']}, precarga {'sí' if PRECARGA else 'no'}), "
+                f"concurrencia {MAX_CONCURRENCIA}, cola {MAX_COLA}")
+    try:
+        yield
+    finally:
+        estado["listo"] = False
+        estado["despachador"].ejecutor.shutdown(wait=False, cancel_futures=True)
+        receptor.cerrar()
+        listener_logs.stop()
+
+app = FastAPI(title="Wevently Chatbot API", version="1.0", lifespan=lifespan)
+
+
+@app.post("/api/chat", response_model=ChatResponse)
+async def chat_endpoint(request: ChatRequest):
+    """Endpoint principal: recibe la consulta y devuelve la respuesta del pipeline."""
+    despachador = estado["despachador"]
+    if not estado["listo"]:
+        raise HTTPException(status_code=503, detail="El servicio está iniciando.", headers={"Retry-After": "5"})
+    if not despachador.disponible:
+        raise HTTPException(status_code=503, detail="Reiniciando workers, reintente en unos segundos.", headers={"Retry-After": "5"})
+    with span("api_chat"), CONTROLADOR_DEGRADACION.solicitud() as nivel:
+        try:
+            (respuesta, keywords, emocion, confianza), coalescida = await despachador.resolver(request.mensaje, request.tipo_usuario, nivel)
+        except ServicioSaturado:
+            METRICAS.contar(METRICA_API, estado="saturado")
+            raise HTTPException(status_code=503, detail="Servicio saturado, reintente en unos segundos.", headers={"Retry-After": "2"})
+        except PoolReiniciando:
+            METRICAS.contar(METRICA_API, estado="pool_reiniciando")
+            raise HTTPException(status_code=503, detail="Reiniciando workers, reintente en unos segundos.", headers={"Retry-After": "5"})
+        except TiempoAgotado:
+            METRICAS.contar(METRICA_API, estado="timeout")
+            raise HTTPException(status_code=504, detail=f"La consulta superó el tiempo máximo ({TIMEOUT_S:.0f}s).")
+        except Exception as e:
+            METRICAS.contar(METRICA_API, estado="error")
+            logger.error(f"Error procesando consulta en la API: {e}", exc_info=True)
+            raise HTTPException(status_code=500, detail="Error interno procesando la consulta.")
+    METRICAS.contar(METRICA_API, estado="ok")
+    return ChatResponse(
+        respuesta=respuesta,
+        keywords=list(keywords),
+        emocion=emocion,
+        confianza=float(confianza),
+        timestamp=datetime.now().isoformat(),
+        coalescida=coalescida,
+        nivel_servicio=nivel,
+    )
+
+
+@app.get("/api/health")
+async def health_check():
+    """Health check / readiness: 503 hasta que todos los workers cargaron los modelos y mientras se reconstruye el pool."""
+    despachador = estado["despachador"]
+    listo = estado["listo"] and despachador.disponible
+    cuerpo = {
+        "status": "healthy" if listo else ("starting" if not estado["listo"] else "recovering"),
+        "service": "wevently-chatbot",
+        "workers": estado["workers"],
+        "despachador": despachador.estadisticas() if despachador else None,
+        "degradacion": CONTROLADOR_DEGRADACION.estadisticas(),
+        "memoria": _memoria_workers(),
+    }
+    return JSONResponse(cuerpo, status_code=200 if listo else 503)
+
+
+def _memoria_workers():
+    if not estado["workers"] or not sys.platform.startswith("linux"):
+        return None
+    reporte = reporte_memoria(estado["workers"])
+    publicar_metricas(reporte)
+    return reporte
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metricas():
+    _memoria_workers()
+    return METRICAS.exportar_prometheus()
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host=os.getenv("WEVENTLY_API_HOST", "127.0.0.1"), port=int(os.getenv("WEVENTLY_API_PUERTO", "8000")))
@@ -0,0 +1,161 @@
+import os
+import sys
+import time
+import threading
+from collections import OrderedDict
+
+# Agrupación de emociones para la clave: emociones con tono de respuesta parecido
+# comparten entrada de cache.
+BUCKET_EMOCION = {
+    "alegría": "positiva",
+    "sorpresa": "neutra",
+    "enojo": "negativa_activa",
+    "asco": "negativa_activa",
+    "miedo": "negativa_pasiva",
+    "tristeza": "negativa_pasiva",
+}
+
+
+def clave_intencion(tipo_usuario, categoria_ml, keywords, emocion):
+    """Clave normalizada de intención: rol, categoría ML, lemas ordenados y bucket de emoción."""
+    return (
+        tipo_usuario,
+        categoria_ml,
+        tuple(sorted(set(keywords))),
+        BUCKET_EMOCION.get(emocion, "neutra"),
+    )
+
+
+def _tamano_aproximado(valor, vector):
+    tamano = sys.getsizeof(valor)
+    for v in valor.values():
+        tamano += len(v.encode("utf-8")) if isinstance(v, str) else sys.getsizeof(v)
+    if vector is not None:
+        tamano += vector.data.nbytes + vector.indices.nbytes + vector.indptr.nbytes
+    return tamano
+
+
+class CacheRespuestas:
+    """
+    Cache LRU con TTL y tope de memoria para respuestas completas del pipeline.
+
+    Nivel exacto: misma clave de intención. Nivel aproximado (opcional): entre
+    las entradas con igual rol, categoría y bucket de emoción, la de mayor coseno
+    entre vectores TF-IDF (filas normalizadas L2, el coseno es el producto punto)
+    si supera `umbral_similitud`. El coseno se calcula fuera del lock, sobre una
+    copia del grupo.
+
+    Con `vigilar(snapshot)` la cache se vacía cuando cambia la huella del grafo
+    de conocimiento, y cada consulta dispara su refresco si está vencido (si
+    todo sale de la cache, nadie más consulta el grafo).
+    """
+    def __init__(self, max_entradas=None, ttl_s=None, max_bytes=None, umbral_similitud=None):
+        self.max_entradas = int(os.getenv("WEVENTLY_CACHE_MAX_ENTRADAS", "5000")) if max_entradas is None else max_entradas
+        self.ttl_s = float(os.getenv("WEVENTLY_CACHE_TTL", "3600")) if ttl_s is None else ttl_s
+        self.max_bytes = int(os.getenv("WEVENTLY_CACHE_MAX_BYTES", str(64 * 1024 * 1024))) if max_bytes is None else max_bytes
+        if umbral_similitud is None:
+            umbral = os.getenv("WEVENTLY_CACHE_UMBRAL_SIMILITUD", "")
+            umbral_similitud = float(umbral) if umbral else None
+        self.umbral_similitud = umbral_similitud
+        self._entradas = OrderedDict()  # clave -> (valor, vector, creado_en, tamano)
+        self._grupos = {}  # (rol, categoría, bucket) -> set(claves)
+        self._lock = threading.Lock()
+        self.bytes_usados = 0
+        self.aciertos_exactos = 0
+        self.aciertos_similares = 0
+        self.fallos = 0
+        self.invalidaciones = 0
+        self.vigia = None
+
+    def vigilar(self, snapshot):
+        """Invalida la cache cuando cambia la versión de `snapshot` (un SnapshotConocimiento)."""
+        self.vigia = snapshot
+        snapshot.observadores.append(self.invalidar)
+
+    @staticmethod
+    def _grupo(clave):
+        return (clave[0], clave[1], clave[3])
+
+    def obtener(self, clave, vector=None):
+        """Devuelve (valor, tipo_acierto) o (None, None)."""
+        if self.vigia is not None and not self.vigia.vigente:
+            self.vigia.refrescar_en_segundo_plano()
+        ahora = time.time()
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None:
+                if ahora - entrada[2] < self.ttl_s:
+                    self._entradas.move_to_end(clave)
+                    self.aciertos_exactos += 1
+                    return entrada[0], "exacto"
+                self._quitar(clave)
+            if self.umbral_similitud is None or vector is None:
+                self.fallos += 1
+                return None, None
+            candidatas = [(otra, self._entradas[otra]) for otra in self._grupos.get(self._grupo(clave), ())]
+        mejor, mejor_entrada, mejor_sim = None, None, self.umbral_similitud
+        vencidas = []
+        for otra, entrada in candidatas:
+            if ahora - entrada[2] >= self.ttl_s:
+                vencidas.append((otra, entrada))
+                continue
+            if entrada[1] is None:
+                continue
+            sim = float(vector.multiply(entrada[1]).sum())
+            if sim >= mejor_sim:
+                mejor, mejor_entrada, mejor_sim = otra, entrada, sim
+        with self._lock:
+            # entre tanto otro hilo pudo reemplazar o quitar las entradas: sólo se tocan si siguen iguales
+            for otra, entrada in vencidas:
+                if self._entradas.get(otra) is entrada:
+                    self._quitar(otra)
+            if mejor is not None and self._entradas.get(mejor) is mejor_entrada:
+                self._entradas.move_to_end(mejor)
+                self.aciertos_similares += 1
+                return mejor_entrada[0], "similar"
+            self.fallos += 1
+            return None, None
+
+    def guardar(self, clave, valor, vector=None):
+        vector = vector if self.umbral_similitud is not None else None
+        tamano = _tamano_aproximado(valor, vector)
+        if tamano > self.max_bytes:
+            return
+        with self._lock:
+            if clave in self._entradas:
+                self._quitar(clave)
+            self._entradas[clave] = (valor, vector, time.time(), tamano)
+            self._grupos.setdefault(self._grupo(clave), set()).add(clave)
+            self.bytes_usados += tamano
+            while self._entradas and (len(self._entradas) > self.max_entradas or self.bytes_usados > self.max_bytes):
+                self._quitar(next(iter(self._entradas)))
+
+    def _quitar(self, clave):
+        _, _, _, tamano = self._entradas.pop(clave)
+        self.bytes_usados -= tamano
+        grupo = self._grupos.get(self._grupo(clave))
+        if grupo is not None:
+            grupo.discard(clave)
+            if not grupo:
+                del self._grupos[self._grupo(clave)]
+
+    def invalidar(self, *_):
+        """Vacía la cache (p. ej. cuando cambia la versión del grafo de conocimiento)."""
+        with self._lock:
+            self._entradas.clear()
+            self._grupos.clear()
+            self.bytes_usados = 0
+            self.invalidaciones += 1
+
+    def estadisticas(self):
+        with self._lock:
+            consultas = self.aciertos_exactos + self.aciertos_similares + self.fallos
+            return {
+                "entradas": len(self._entradas),
+                "bytes_usados": self.bytes_usados,
+                "aciertos_exactos": self.aciertos_exactos,
+                "aciertos_similares": self.aciertos_similares,
+                "fallos": self.fallos,
+                "tasa_aciertos": ((self.aciertos_exactos + self.aciertos_similares) / consultas) if consultas else 0.0,
+                "invalidaciones": self.invalidaciones,
+            }
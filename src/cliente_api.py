@@ -0,0 +1,34 @@
+import json
+import urllib.request
+import urllib.error
+
+
+class ErrorAPI(Exception):
+    def __init__(self, mensaje, estado=None):
+        super().__init__(mensaje)
+        self.estado = estado
+
+
+MENSAJES_ERROR = {
+    503: "El asistente está ocupado en este momento, intenta de nuevo en unos segundos.",
+    504: "El asistente tardó demasiado en responder, intenta de nuevo.",
+}
+
+
+def consultar_api(url_base, mensaje, tipo_usuario, timeout_s=90):
+    """
+    Envía la consulta a la API del asistente (api_asistente.py) y devuelve la
+    misma tupla que generar_respuesta_streamlit: (respuesta, keywords, emoción, confianza).
+    """
+    cuerpo = json.dumps({"mensaje": mensaje, "tipo_usuario": tipo_usuario}).encode("utf-8")
+    request = urllib.request.Request(
+        url_base.rstrip("/") + "/api/chat", data=cuerpo,
+        headers={"Content-Type": "application/json"}, method="POST")
+    try:
+        with urllib.request.urlopen(request, timeout=timeout_s) as respuesta:
+            datos = json.loads(respuesta.read().decode("utf-8"))
+    except urllib.error.HTTPError as e:
+        raise ErrorAPI(MENSAJES_ERROR.get(e.code, f"Error del asistente (HTTP {e.code})."), e.code) from e
+    except (urllib.error.URLError, TimeoutError, OSError) as e:
+        raise ErrorAPI("No se pudo contactar al asistente.") from e
+    return datos["respuesta"], datos["keywords"], datos["emocion"], datos["confianza"]
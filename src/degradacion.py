@@ -0,0 +1,172 @@
+"""
+Degradación adaptativa del pipeline bajo carga.
+
+En vez de que todas las consultas se vuelvan lentas juntas en un pico, el
+controlador mira las consultas en vuelo y la latencia reciente (EWMA) y baja
+por niveles de servicio, cada uno más barato que el anterior:
+
+- completo:           pipeline completo (spaCy, BETO, difuso, Neo4j, 2 llamadas LLM)
+- sin_emocion:        sin BETO; tono neutral del rol (role_details)
+- sin_seleccion_llm:  además, sin la llamada de selección: el candidato mejor rankeado
+- plantilla:          sin LLM: la solución mejor rankeada del grafo en una plantilla
+
+La carga es el máximo entre (en vuelo / max_en_vuelo) y (latencia EWMA /
+latencia objetivo). Se baja de nivel apenas la carga supera el umbral (puede
+saltar varios niveles); se sube de a uno, cuando la carga cae por debajo del
+umbral menos la histéresis y pasó el enfriamiento desde el último cambio. Las
+respuestas degradadas son más rápidas, bajan la EWMA y el controlador vuelve
+solo al nivel completo.
+
+Arranque en frío: las primeras consultas del proceso (carga perezosa de
+modelos, conexiones) no entran a la EWMA, la latencia no cuenta hasta juntar
+`muestras_minimas` y cada muestra se recorta a `tope_muestra` veces el objetivo.
+Así una sola consulta lenta no lleva un proceso ocioso a `plantilla`.
+"""
+import os
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from trazas import METRICAS, METRICA_NIVEL_SERVICIO
+
+logger = logging.getLogger(__name__)
+
+NIVELES = ("completo", "sin_emocion", "sin_seleccion_llm", "plantilla")
+# Carga por encima de la cual se entra a cada nivel degradado
+UMBRALES = (1.0, 1.5, 2.0)
+# Una muestra pesa a lo sumo este múltiplo de la latencia objetivo
+TOPE_MUESTRA = 3.0
+
+
+def nivel_al_menos(nivel, minimo):
+    """True si `nivel` está igual o más degradado que `minimo`."""
+    return NIVELES.index(nivel) >= NIVELES.index(minimo)
+
+
+class ControladorDegradacion:
+    def __init__(self, max_en_vuelo=None, latencia_objetivo_s=None, alfa=None, histeresis=None,
+                 enfriamiento_s=None, activo=None, muestras_minimas=None, descartar_iniciales=None,
+                 tope_muestra=TOPE_MUESTRA, umbrales=UMBRALES, nombre="pipeline", reloj=time.monotonic):
+        self.max_en_vuelo = int(os.getenv("WEVENTLY_DEGRADACION_MAX_EN_VUELO", "4")) if max_en_vuelo is None else max_en_vuelo
+        self.latencia_objetivo_s = float(os.getenv("WEVENTLY_DEGRADACION_LATENCIA_OBJETIVO", "8")) if latencia_objetivo_s is None else latencia_objetivo_s
+        self.alfa = float(os.getenv("WEVENTLY_DEGRADACION_ALFA", "0.2")) if alfa is None else alfa
+        self.histeresis = float(os.getenv("WEVENTLY_DEGRADACION_HISTERESIS", "0.3")) if histeresis is None else histeresis
+        self.enfriamiento_s = float(os.getenv("WEVENTLY_DEGRADACION_ENFRIAMIENTO", "10")) if enfriamiento_s is None else enfriamiento_s
+        self.activo = os.getenv("WEVENTLY_DEGRADACION", "1") == "1" if activo is None else activo
+        self.muestras_minimas = int(os.getenv("WEVENTLY_DEGRADACION_MUESTRAS_MINIMAS", "5")) if muestras_minimas is None else muestras_minimas
+        self.descartar_iniciales = int(os.getenv("WEVENTLY_DEGRADACION_DESCARTAR_INICIALES", "2")) if descartar_iniciales is None else descartar_iniciales
+        self.tope_muestra = tope_muestra
+        self.umbrales = tuple(umbrales)
+        self.nombre = nombre
+        self._reloj = reloj
+        self._lock = threading.Lock()
+        self._nivel = 0
+        self._ultimo_cambio = reloj()
+        self.en_vuelo = 0
+        self.latencia_ewma_s = None
+        self.terminadas = 0
+        self.muestras = 0
+        self.cambios = 0
+        self.por_nivel = dict.fromkeys(NIVELES, 0)
+
+    @property
+    def nivel(self):
+        return NIVELES[self._nivel]
+
+    def carga(self):
+        if self.muestras < self.muestras_minimas:
+            latencia = 0.0
+        else:
+            latencia = (self.latencia_ewma_s or 0.0) / self.latencia_objetivo_s
+        return max(self.en_vuelo / self.max_en_vuelo, latencia)
+
+    def _actualizar(self):
+        if not self.activo:
+            return
+        carga = self.carga()
+        objetivo = sum(carga > umbral for umbral in self.umbrales)
+        ahora = self._reloj()
+        if objetivo > self._nivel:
+            nuevo = objetivo
+        elif (self._nivel > 0 and carga < self.umbrales[self._nivel - 1] * (1 - self.histeresis)
+              and ahora - self._ultimo_cambio >= self.enfriamiento_s):
+            nuevo = self._nivel - 1
+        else:
+            return
+        logger.warning(f"Degradación {self.nombre}: {NIVELES[self._nivel]} -> {NIVELES[nuevo]} "
+                       f"(carga {carga:.2f}, en vuelo {self.en_vuelo}, latencia EWMA {self.latencia_ewma_s or 0:.2f}s)")
+        self._nivel = nuevo
+        self._ultimo_cambio = ahora
+        self.cambios += 1
+        METRICAS.fijar(METRICA_NIVEL_SERVICIO, nuevo, controlador=self.nombre)
+
+    def entrar(self):
+        """Registra una consulta en vuelo y devuelve el nivel con el que debe servirse."""
+        with self._lock:
+            self.en_vuelo += 1
+            self._actualizar()
+            nivel = self.nivel
+            self.por_nivel[nivel] += 1
+            return nivel
+
+    def salir(self, duracion_s):
+        with self._lock:
+            self.en_vuelo -= 1
+            self.terminadas += 1
+            if self.terminadas > self.descartar_iniciales:
+                muestra = min(duracion_s, self.tope_muestra * self.latencia_objetivo_s)
+                if self.latencia_ewma_s is None:
+                    self.latencia_ewma_s = muestra
+                else:
+                    self.latencia_ewma_s += self.alfa * (muestra - self.latencia_ewma_s)
+                self.muestras += 1
+            self._actualizar()
+
+    @contextmanager
+    def solicitud(self):
+        """Envuelve una consulta: entrega su nivel y al terminar (bien o con error) registra su latencia."""
+        nivel = self.entrar()
+        inicio = time.perf_counter()
+        try:
+            yield nivel
+        finally:
+            self.salir(time.perf_counter() - inicio)
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "activo": self.activo,
+                "nivel": self.nivel,
+                "carga": round(self.carga(), 3),
+                "en_vuelo": self.en_vuelo,
+                "latencia_ewma_s": self.latencia_ewma_s,
+                "muestras_latencia": self.muestras,
+                "cambios": self.cambios,
+                "por_nivel": dict(self.por_nivel),
+            }
+
+
+# --- Nivel de la consulta actual ---
+_nivel_actual = contextvars.ContextVar("wevently_nivel_servicio", default=NIVELES[0])
+
+
+def nivel_actual():
+    return _nivel_actual.get()
+
+
+@contextmanager
+def servir_con_nivel(nivel):
+    """Fija el nivel de servicio de la consulta en curso (lo leen las etapas y el registro del resultado)."""
+    if nivel not in NIVELES:
+        raise ValueError(f"Nivel de servicio desconocido: {nivel} (usar {', '.join(NIVELES)})")
+    token = _nivel_actual.set(nivel)
+    try:
+        yield nivel
+    finally:
+        try:
+            _nivel_actual.reset(token)
+        except ValueError:
+            # generador de streaming cerrado desde otro contexto
+            pass
@@ -0,0 +1,145 @@
+import asyncio
+import logging
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+
+class ServicioSaturado(Exception):
+    """No hay lugar ni en ejecución ni en la cola de espera (load shedding)."""
+
+
+class TiempoAgotado(Exception):
+    """La consulta no terminó dentro del timeout (incluye la espera en cola)."""
+
+
+class PoolReiniciando(Exception):
+    """Un worker murió (BrokenProcessPool) y el pool se está reconstruyendo."""
+
+
+def clave_consulta(mensaje, tipo_usuario):
+    # Mismo texto salvo espacios sobrantes -> misma consulta en vuelo
+    return tipo_usuario, " ".join(mensaje.split())
+
+
+class DespachadorConsultas:
+    """
+    Envía consultas a un executor (p. ej. el pool de procesos de la API) con:
+
+    - concurrencia acotada: como mucho `max_concurrencia` ejecutándose a la vez;
+    - cola acotada: hasta `max_cola` esperando; más allá se rechaza con ServicioSaturado;
+    - timeout por consulta (TiempoAgotado); la ejecución sigue en el worker y
+      su lugar se libera recién cuando termina;
+    - coalescencia: consultas idénticas en vuelo comparten una sola ejecución;
+    - recuperación: si un worker muere el pool queda roto (BrokenProcessPool);
+      con `reconstruir` (corrutina que devuelve un executor nuevo) se levanta
+      otro en segundo plano y mientras tanto `disponible` es False y las
+      consultas se rechazan con PoolReiniciando.
+    """
+    def __init__(self, ejecutor, funcion, max_concurrencia, max_cola, timeout_s, reconstruir=None):
+        self.ejecutor = ejecutor
+        self.reconstruir = reconstruir
+        self.funcion = funcion
+        self.max_concurrencia = max_concurrencia
+        self.max_cola = max_cola
+        self.timeout_s = timeout_s
+        self._semaforo = asyncio.Semaphore(max_concurrencia)
+        self._en_vuelo = {}
+        self.pendientes = 0
+        self.ejecutando = 0
+        self.completadas = 0
+        self.coalescidas = 0
+        self.rechazadas = 0
+        self.timeouts = 0
+        self.errores = 0
+        self.disponible = True
+        self.reconstrucciones = 0
+        self._reconstruccion = None
+
+    async def resolver(self, mensaje, tipo_usuario, *args):
+        """Devuelve (resultado, coalescida). `args` extra se pasan a la función (una consulta coalescida usa los de la primera)."""
+        if not self.disponible:
+            # reintenta si la reconstrucción anterior falló
+            self._reconstruir_pool(self.ejecutor)
+            raise PoolReiniciando("el pool de workers se está reconstruyendo")
+        clave = clave_consulta(mensaje, tipo_usuario)
+        tarea = self._en_vuelo.get(clave)
+        coalescida = tarea is not None
+        if coalescida:
+            self.coalescidas += 1
+        else:
+            if self.pendientes >= self.max_concurrencia + self.max_cola:
+                self.rechazadas += 1
+                raise ServicioSaturado(f"{self.pendientes} consultas pendientes")
+            self.pendientes += 1
+            tarea = asyncio.ensure_future(self._ejecutar(mensaje, tipo_usuario, *args))
+            self._en_vuelo[clave] = tarea
+            tarea.add_done_callback(lambda t: self._terminar(clave, t))
+        try:
+            # shield: un timeout o una desconexión no cancela la ejecución compartida
+            resultado = await asyncio.wait_for(asyncio.shield(tarea), self.timeout_s)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise TiempoAgotado(f"sin respuesta en {self.timeout_s}s") from None
+        return resultado, coalescida
+
+    async def _ejecutar(self, mensaje, tipo_usuario, *args):
+        async with self._semaforo:
+            self.ejecutando += 1
+            ejecutor = self.ejecutor
+            try:
+                return await asyncio.get_running_loop().run_in_executor(ejecutor, self.funcion, mensaje, tipo_usuario, *args)
+            except BrokenProcessPool:
+                if self.reconstruir is None:
+                    raise
+                # la consulta no se reintenta: pudo ser la que tiró abajo al worker
+                self._reconstruir_pool(ejecutor)
+                raise PoolReiniciando("un worker del pool terminó de forma abrupta") from None
+            finally:
+                self.ejecutando -= 1
+
+    def _reconstruir_pool(self, ejecutor_roto):
+        if self._reconstruccion is not None or ejecutor_roto is not self.ejecutor:
+            return
+        self.disponible = False
+        self._reconstruccion = asyncio.ensure_future(self._reemplazar_ejecutor(ejecutor_roto))
+
+    async def _reemplazar_ejecutor(self, ejecutor_roto):
+        logger.error("Pool de workers roto; se reconstruye.")
+        try:
+            ejecutor_roto.shutdown(wait=False, cancel_futures=True)
+            self.ejecutor = await self.reconstruir()
+            self.reconstrucciones += 1
+            self.disponible = True
+            logger.warning("Pool de workers reconstruido.")
+        except Exception:
+            logger.error("No se pudo reconstruir el pool de workers.", exc_info=True)
+        finally:
+            self._reconstruccion = None
+
+    def _terminar(self, clave, tarea):
+        self.pendientes -= 1
+        self._en_vuelo.pop(clave, None)
+        if tarea.cancelled():
+            return
+        if tarea.exception() is not None:
+            # se consulta siempre la excepción para que no quede como "never retrieved" tras un timeout
+            self.errores += 1
+        else:
+            self.completadas += 1
+
+    def estadisticas(self):
+        return {
+            "pendientes": self.pendientes,
+            "ejecutando": self.ejecutando,
+            "en_cola": self.pendientes - self.ejecutando,
+            "max_concurrencia": self.max_concurrencia,
+            "max_cola": self.max_cola,
+            "completadas": self.completadas,
+            "coalescidas": self.coalescidas,
+            "rechazadas": self.rechazadas,
+            "timeouts": self.timeouts,
+            "errores": self.errores,
+            "disponible": self.disponible,
+            "reconstrucciones": self.reconstrucciones,
+        }
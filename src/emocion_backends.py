@@ -0,0 +1,129 @@
+import os
+import time
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# pytorch: checkpoint original en fp32 (comportamiento previo).
+# pytorch_int8: cuantización dinámica int8 de las capas Linear (CPU).
+# onnx / onnx_int8: export ONNX del mismo checkpoint ejecutado con ONNX Runtime (fp32 o int8 dinámico).
+BACKENDS = ("pytorch", "pytorch_int8", "onnx", "onnx_int8")
+MAX_LENGTH = 128
+RUTA_ONNX_DEFAULT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "beto_emocion_onnx", "model.onnx")
+
+
+def _softmax(logits):
+    logits = logits - logits.max(axis=-1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+def hilos_configurados():
+    """Hilos intra-op (WEVENTLY_EMOCION_HILOS) o None para dejar el default de la librería."""
+    hilos = os.getenv("WEVENTLY_EMOCION_HILOS", "")
+    return int(hilos) if hilos else None
+
+
+def configurar_hilos_torch(hilos=None):
+    import torch
+    hilos = hilos_configurados() if hilos is None else hilos
+    if hilos:
+        torch.set_num_threads(hilos)
+    interop = os.getenv("WEVENTLY_TORCH_INTEROP_HILOS", "")
+    if interop:
+        try:
+            torch.set_num_interop_threads(int(interop))
+        except RuntimeError:
+            # sólo se puede fijar antes de la primera operación paralela
+            logger.warning("No se pudo fijar WEVENTLY_TORCH_INTEROP_HILOS: torch ya inició su pool inter-op.")
+
+
+class BackendPyTorch:
+    """Modelo HF en PyTorch (CPU), opcionalmente con cuantización dinámica int8 de las capas Linear."""
+    def __init__(self, tokenizer, modelo, cuantizar=False):
+        import torch
+        configurar_hilos_torch()
+        modelo.eval()
+        if cuantizar:
+            modelo = torch.quantization.quantize_dynamic(modelo, {torch.nn.Linear}, dtype=torch.qint8)
+        self.nombre = "pytorch_int8" if cuantizar else "pytorch"
+        self.tokenizer = tokenizer
+        self.modelo = modelo
+
+    def probabilidades(self, textos):
+        import torch
+        inputs = self.tokenizer(list(textos), return_tensors="pt", truncation=True, max_length=MAX_LENGTH, padding=True)
+        with torch.inference_mode():
+            logits = self.modelo(**inputs).logits
+        return torch.softmax(logits, dim=-1).cpu().numpy()
+
+
+class BackendONNX:
+    """Export ONNX del checkpoint ejecutado con ONNX Runtime en CPU."""
+    def __init__(self, tokenizer, ruta_onnx, hilos=None):
+        import onnxruntime as ort
+        opciones = ort.SessionOptions()
+        opciones.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        hilos = hilos_configurados() if hilos is None else hilos
+        if hilos:
+            opciones.intra_op_num_threads = hilos
+        self.nombre = "onnx_int8" if ruta_onnx.endswith(".int8.onnx") else "onnx"
+        self.tokenizer = tokenizer
+        self.sesion = ort.InferenceSession(ruta_onnx, sess_options=opciones, providers=["CPUExecutionProvider"])
+        self._entradas = [e.name for e in self.sesion.get_inputs()]
+
+    def probabilidades(self, textos):
+        inputs = self.tokenizer(list(textos), return_tensors="np", truncation=True, max_length=MAX_LENGTH, padding=True)
+        feed = {nombre: inputs[nombre].astype(np.int64) for nombre in self._entradas if nombre in inputs}
+        logits = self.sesion.run(None, feed)[0]
+        return _softmax(logits)
+
+
+def exportar_onnx(tokenizer, modelo, ruta_onnx):
+    """Exporta el checkpoint a ONNX con ejes dinámicos de batch y secuencia."""
+    import torch
+    os.makedirs(os.path.dirname(os.path.abspath(ruta_onnx)), exist_ok=True)
+    modelo.eval()
+    ejemplo = tokenizer(["Texto de ejemplo para exportar el modelo."], return_tensors="pt")
+    nombres = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in ejemplo]
+    ejes = {n: {0: "batch", 1: "secuencia"} for n in nombres}
+    ejes["logits"] = {0: "batch"}
+    inicio = time.time()
+    with torch.inference_mode():
+        torch.onnx.export(
+            modelo, tuple(ejemplo[n] for n in nombres), ruta_onnx,
+            input_names=nombres, output_names=["logits"], dynamic_axes=ejes, opset_version=17,
+        )
+    logger.info(f"Modelo de emoción exportado a ONNX en {ruta_onnx} ({(time.time() - inicio):.1f}s)")
+    return ruta_onnx
+
+
+def cuantizar_onnx(ruta_onnx):
+    """Cuantización dinámica int8 (pesos) del export ONNX; devuelve la ruta del modelo cuantizado."""
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    ruta_int8 = ruta_onnx[:-len(".onnx")] + ".int8.onnx"
+    quantize_dynamic(ruta_onnx, ruta_int8, weight_type=QuantType.QInt8)
+    return ruta_int8
+
+
+def crear_backend(nombre, tokenizer, cargar_modelo, ruta_onnx=None):
+    """
+    Construye el backend de inferencia de emoción. `cargar_modelo` es un callable
+    que devuelve el modelo PyTorch; con ONNX sólo se invoca si hay que exportar.
+    """
+    if nombre not in BACKENDS:
+        raise ValueError(f"Backend de emoción no soportado: {nombre} (usar {', '.join(BACKENDS)})")
+    if nombre in ("pytorch", "pytorch_int8"):
+        return BackendPyTorch(tokenizer, cargar_modelo(), cuantizar=(nombre == "pytorch_int8"))
+    try:
+        import onnxruntime  # noqa: F401
+    except ImportError as e:
+        raise ImportError(f"El backend '{nombre}' requiere el paquete opcional 'onnxruntime'.") from e
+    ruta_onnx = ruta_onnx or os.getenv("WEVENTLY_EMOCION_ONNX_RUTA", RUTA_ONNX_DEFAULT)
+    if not os.path.exists(ruta_onnx):
+        exportar_onnx(tokenizer, cargar_modelo(), ruta_onnx)
+    if nombre == "onnx_int8":
+        ruta_int8 = ruta_onnx[:-len(".onnx")] + ".int8.onnx"
+        ruta_onnx = ruta_int8 if os.path.exists(ruta_int8) else cuantizar_onnx(ruta_onnx)
+    return BackendONNX(tokenizer, ruta_onnx)
@@ -0,0 +1,166 @@
+"""
+Esquema del grafo de conocimiento: índices que necesita la consulta de
+recuperación y perfil de su plan de ejecución.
+
+La consulta original filtra con `toLower(k.nombre) = kw`, que no puede usar
+un índice y recorre todas las PalabraClave por cada keyword. Con la propiedad
+normalizada `nombre_lower` y su índice, cada keyword es un NodeIndexSeek:
+
+    python src/esquema_kg.py crear       # índices + backfill de nombre_lower
+    python src/esquema_kg.py verificar   # estado de índices y nodos sin normalizar
+
+El recuperador (ver consulta_recuperacion) usa la consulta indexada sólo si el
+índice está ONLINE y todas las PalabraClave tienen `nombre_lower` al día; si
+no, sigue con `toLower`. La elección se repite cada WEVENTLY_KG_REVISION_ESQUEMA
+segundos (por defecto, el TTL del snapshot). Requisito de la ingesta: toda
+PalabraClave nueva o renombrada se escribe con `nombre_lower = toLower(nombre)`;
+hasta la próxima revisión, una keyword cargada sin esa propiedad no se
+encuentra con la consulta indexada. El perfil y los umbrales de regresión contra un grafo
+sembrado están en benchmarks/perfil_kg.py.
+"""
+import sys
+import json
+import logging
+
+from recuperacion_kg import CYPHER_RECUPERACION, CYPHER_RECUPERACION_INDEXADA
+
+logger = logging.getLogger(__name__)
+
+INDICE_NOMBRE_LOWER = "palabra_clave_nombre_lower"
+INDICES = {
+    INDICE_NOMBRE_LOWER: "CREATE INDEX palabra_clave_nombre_lower IF NOT EXISTS FOR (k:PalabraClave) ON (k.nombre_lower)",
+    "palabra_clave_nombre": "CREATE INDEX palabra_clave_nombre IF NOT EXISTS FOR (k:PalabraClave) ON (k.nombre)",
+    "tipo_usuario_nombre": "CREATE INDEX tipo_usuario_nombre IF NOT EXISTS FOR (tu:TipoUsuario) ON (tu.nombre)",
+}
+CYPHER_ESTADO_INDICES = """
+    SHOW INDEXES YIELD name, state
+    RETURN name, state
+    """
+CYPHER_PENDIENTES_NORMALIZAR = """
+    MATCH (k:PalabraClave)
+    WHERE k.nombre_lower IS NULL OR k.nombre_lower <> toLower(k.nombre)
+    RETURN count(k) AS pendientes
+    """
+# Las PalabraClave nuevas deben cargarse con nombre_lower; esto completa las existentes
+CYPHER_NORMALIZAR = """
+    MATCH (k:PalabraClave)
+    WHERE k.nombre_lower IS NULL OR k.nombre_lower <> toLower(k.nombre)
+    SET k.nombre_lower = toLower(k.nombre)
+    RETURN count(k) AS actualizadas
+    """
+CYPHER_ESPERAR_INDICES = "CALL db.awaitIndexes($timeout_s)"
+
+# Operadores que no deben aparecer en el plan de recuperación: recorren la etiqueta completa
+OPERADORES_PROHIBIDOS = ("AllNodesScan", "NodeByLabelScan")
+OPERADOR_REQUERIDO = "NodeIndexSeek"
+
+
+# --- Índices ---
+def estado_indices(graph):
+    """Estado (ONLINE, POPULATING, FAILED...) de cada índice requerido; None si no existe."""
+    existentes = {fila["name"]: fila["state"] for fila in graph.query(CYPHER_ESTADO_INDICES)}
+    return {nombre: existentes.get(nombre) for nombre in INDICES}
+
+
+def verificar_esquema(graph):
+    indices = estado_indices(graph)
+    pendientes = graph.query(CYPHER_PENDIENTES_NORMALIZAR)[0]["pendientes"]
+    return {
+        "indices": indices,
+        "pendientes_normalizar": pendientes,
+        "ok": all(estado == "ONLINE" for estado in indices.values()) and pendientes == 0,
+    }
+
+
+def crear_esquema(graph, timeout_s=120):
+    for crear in INDICES.values():
+        graph.query(crear)
+    actualizadas = graph.query(CYPHER_NORMALIZAR)[0]["actualizadas"]
+    graph.query(CYPHER_ESPERAR_INDICES, {"timeout_s": timeout_s})
+    logger.info(f"Esquema KG: índices creados, {actualizadas} PalabraClave normalizadas")
+    return verificar_esquema(graph)
+
+
+def consulta_recuperacion(graph):
+    """
+    Consulta de recuperación a usar contra este grafo: la indexada por
+    nombre_lower si el índice está listo y no hay nodos sin normalizar
+    (si no, keywords nuevas quedarían fuera), o la original con toLower.
+    """
+    try:
+        estado = estado_indices(graph).get(INDICE_NOMBRE_LOWER)
+        pendientes = graph.query(CYPHER_PENDIENTES_NORMALIZAR)[0]["pendientes"] if estado == "ONLINE" else None
+    except Exception:
+        logger.warning("No se pudo inspeccionar el esquema de Neo4j; se usa la consulta con toLower.", exc_info=True)
+        return CYPHER_RECUPERACION
+    if estado != "ONLINE":
+        logger.warning(f"Índice {INDICE_NOMBRE_LOWER} no disponible ({estado}); la recuperación recorre todas las "
+                       f"PalabraClave. Crear con: python src/esquema_kg.py crear")
+        return CYPHER_RECUPERACION
+    if pendientes:
+        logger.warning(f"{pendientes} PalabraClave sin nombre_lower al día; se usa la consulta con toLower. "
+                       f"Normalizar con: python src/esquema_kg.py crear")
+        return CYPHER_RECUPERACION
+    logger.info(f"Recuperación por índice {INDICE_NOMBRE_LOWER}")
+    return CYPHER_RECUPERACION_INDEXADA
+
+
+# --- Perfil del plan ---
+def _operador(nodo):
+    # el driver devuelve p. ej. "NodeIndexSeek@neo4j"
+    return nodo.get("operatorType", "").split("@")[0]
+
+
+def resumir_perfil(perfil):
+    """Total de db hits y filas por operador a partir del `summary.profile` del driver."""
+    operadores = []
+    pendientes = [perfil]
+    while pendientes:
+        nodo = pendientes.pop()
+        operadores.append({"operador": _operador(nodo), "db_hits": int(nodo.get("dbHits", 0)), "filas": int(nodo.get("rows", 0))})
+        pendientes.extend(nodo.get("children", []))
+    return {
+        "db_hits": sum(o["db_hits"] for o in operadores),
+        "operadores": sorted({o["operador"] for o in operadores}),
+        "detalle": operadores,
+    }
+
+
+def perfilar(graph, cypher, params):
+    """Ejecuta PROFILE con el driver de Neo4jGraph y devuelve el resumen del plan."""
+    _, summary, _ = graph._driver.execute_query("PROFILE " + cypher, parameters_=params, database_=graph._database)
+    return resumir_perfil(summary.profile)
+
+
+def regresiones(perfil, base=None, tolerancia=0.2):
+    """Lista de problemas del perfil: forma del plan y db hits por encima de la base (+tolerancia)."""
+    problemas = [f"operador prohibido en el plan: {op}" for op in perfil["operadores"] if op in OPERADORES_PROHIBIDOS]
+    if OPERADOR_REQUERIDO not in perfil["operadores"]:
+        problemas.append(f"el plan no usa {OPERADOR_REQUERIDO}")
+    if base is not None:
+        limite = base["db_hits"] * (1 + tolerancia)
+        if perfil["db_hits"] > limite:
+            problemas.append(f"db hits {perfil['db_hits']} > {limite:.0f} (base {base['db_hits']} + {tolerancia:.0%})")
+        nuevos = set(perfil["operadores"]) - set(base["operadores"])
+        if nuevos:
+            problemas.append(f"operadores nuevos respecto de la base: {', '.join(sorted(nuevos))}")
+    return problemas
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in ("crear", "verificar"):
+        print("Uso: python src/esquema_kg.py crear|verificar")
+        return 2
+    from dotenv import load_dotenv
+    from neo4j_connection import get_graph
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    graph = get_graph()
+    reporte = crear_esquema(graph) if argv[0] == "crear" else verificar_esquema(graph)
+    print(json.dumps(reporte, ensure_ascii=False, indent=2))
+    return 0 if reporte["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
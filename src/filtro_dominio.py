@@ -0,0 +1,97 @@
+import re
+import unicodedata
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+# Terminaciones que se recortan para quedarse con la raíz (de la más larga a la más corta)
+_TERMINACIONES = ("aciones", "acion", "ciones", "cion", "ando", "ado", "ada", "aron", "ar", "er", "ir",
+                  "es", "os", "as", "an", "o", "a", "e")
+# Con raíces más cortas "pag", "and" o "cobr" aceptaban "página", "andamio" o "cobra"
+LARGO_MINIMO_RAIZ = 5
+_INFINITIVOS = ("ar", "er", "ir")
+# Lo que puede seguir a una raíz: el token tiene que ser raíz + terminación, no
+# alcanza con que empiece con la raíz ("servici" no acepta "servicial")
+FLEXIONES_NOMINALES = frozenset({"", "s", "es", "o", "a", "e", "os", "as", "ar", "er", "ir",
+                                 "cion", "ciones", "acion", "aciones", "ado", "ada", "ados", "adas"})
+# Conjugación regular desde la raíz verbal (infinitivo sin -ar/-er/-ir), ya plegada:
+# presente, subjuntivo (con la "u" de pague/paguen), pretéritos, futuro, condicional,
+# formas no personales y enclíticos (pagarle, pagándole, acreditarselo, págale)
+_CONJUGACION = (
+    "o", "as", "a", "amos", "ais", "an", "es", "e", "emos", "eis", "en", "imos", "is",
+    "ue", "ues", "uemos", "uen",
+    "aste", "asteis", "aron", "i", "iste", "io", "isteis", "ieron",
+    "aba", "abas", "abamos", "abais", "aban", "ia", "ias", "iamos", "iais", "ian",
+    "ara", "aras", "aramos", "arais", "aran", "ase", "ases", "asemos", "asen",
+    "iera", "ieras", "ieramos", "ierais", "ieran", "iese", "ieses", "iesen",
+    "are", "aremos", "areis", "ere", "eras", "era", "eremos", "ereis", "eran",
+    "ire", "iras", "ira", "iremos", "ireis", "iran",
+    "aria", "arias", "ariamos", "ariais", "arian", "eria", "erias", "eriamos", "eriais", "erian",
+    "iria", "irias", "iriamos", "iriais", "irian",
+    "ar", "er", "ir", "ado", "ada", "ados", "adas", "ido", "ida", "idos", "idas", "ando", "iendo",
+)
+_ENCLITICOS = ("me", "te", "se", "nos", "le", "les", "lo", "la", "los", "las",
+               "melo", "mela", "telo", "tela", "selo", "sela", "selos", "selas")
+FLEXIONES_VERBALES = frozenset(_CONJUGACION) | frozenset(
+    base + clitico for base in ("ar", "er", "ir", "ando", "iendo", "a", "e") for clitico in _ENCLITICOS)
+
+
+def plegar(texto):
+    """Minúsculas y sin tildes/diéresis (la ñ queda como n)."""
+    descompuesto = unicodedata.normalize("NFKD", texto.lower())
+    return "".join(c for c in descompuesto if not unicodedata.combining(c))
+
+
+def raiz(palabra):
+    palabra = plegar(palabra)
+    for terminacion in _TERMINACIONES:
+        if palabra.endswith(terminacion) and len(palabra) - len(terminacion) >= LARGO_MINIMO_RAIZ:
+            return palabra[:-len(terminacion)]
+    return palabra
+
+
+class AutomataDominio:
+    """
+    Filtro de dominio en dos formas:
+
+    - `coincidencias_texto`: trie de raíces sobre el texto crudo plegado, sin
+      spaCy. Un token coincide si es una raíz seguida de una terminación
+      flexiva (pagó, pagos, pagaron, rechazaron). Sólo sirve para rechazar
+      barato: lo que pasa se confirma después con los lemas.
+    - `coincidencias`: pertenencia exacta de lemas plegados al conjunto de
+      palabras clave ("transacción"/"transaccion" coinciden, "servicial" no).
+
+    Los infinitivos aportan además su raíz verbal, que admite sólo terminaciones
+    verbales ("pag" + "aron", pero no "pag" + "ina").
+    """
+    def __init__(self, palabras, excluir=()):
+        excluir = {plegar(p) for p in excluir}
+        self.formas = frozenset(plegar(p) for p in palabras) - excluir
+        flexiones = {}
+        for forma in self.formas:
+            flexiones.setdefault(raiz(forma), set()).update(FLEXIONES_NOMINALES)
+            if forma.endswith(_INFINITIVOS):
+                flexiones.setdefault(forma[:-2], set()).update(FLEXIONES_VERBALES)
+        self.raices = sorted(flexiones)
+        self._trie = {}
+        for r, terminaciones in flexiones.items():
+            nodo = self._trie
+            for c in r:
+                nodo = nodo.setdefault(c, {})
+            nodo[None] = frozenset(terminaciones)
+
+    def _coincide_token(self, token):
+        nodo = self._trie
+        for i, c in enumerate(token):
+            nodo = nodo.get(c)
+            if nodo is None:
+                return False
+            if None in nodo and token[i + 1:] in nodo[None]:
+                return True
+        return False
+
+    def coincidencias(self, tokens):
+        """Tokens (ya separados, p. ej. lemas) cuya forma plegada es una palabra clave del dominio."""
+        return {t for t in tokens if plegar(t) in self.formas}
+
+    def coincidencias_texto(self, texto):
+        """Tokens del texto crudo formados por una raíz del dominio y una terminación flexiva."""
+        return {t for t in _TOKEN.findall(plegar(texto)) if self._coincide_token(t)}
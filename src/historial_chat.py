@@ -0,0 +1,89 @@
+import re
+from collections import deque
+
+_TAG_HTML = re.compile(r'<[^>]+>')
+
+
+def strip_html_tags(text):
+    return _TAG_HTML.sub('', text)
+
+
+class LimpiadorHTMLIncremental:
+    """Aplica strip_html_tags a un texto que llega por fragmentos.
+
+    Retiene desde el primer '<' que todavía no tiene su '>' para no mostrar
+    etiquetas partidas entre fragmentos; el resultado acumulado es idéntico a
+    aplicar strip_html_tags al texto completo. Un '<' que sigue sin cerrar tras
+    `max_retenido` caracteres no es una etiqueta y se libera como texto.
+    Llamar a `flush` al terminar el stream.
+    """
+    def __init__(self, max_retenido=200):
+        self.max_retenido = max_retenido
+        self.pendiente = ''
+
+    def feed(self, fragmento):
+        texto = self.pendiente + fragmento
+        corte = len(texto)
+        ultimo_cierre = texto.rfind('>')
+        abierto = texto.find('<', ultimo_cierre + 1)
+        while abierto != -1 and len(texto) - abierto > self.max_retenido:
+            abierto = texto.find('<', abierto + 1)
+        if abierto != -1:
+            corte = abierto
+        self.pendiente = texto[corte:]
+        return strip_html_tags(texto[:corte])
+
+    def flush(self):
+        resto, self.pendiente = self.pendiente, ''
+        return strip_html_tags(resto)
+
+
+def html_burbujas(msg):
+    """HTML de un intercambio (burbuja del usuario y del asistente), ya sanitizado."""
+    # Sanitiza para evitar render HTML accidental y muestra sólo texto plano
+    user_text = strip_html_tags(str(msg['mensaje']))
+    assistant_text = strip_html_tags(str(msg['respuesta']))
+    return f"""
+    <div class='chat-row right'>
+        <div class='bubble-user'>
+            {user_text}
+            <div class='meta-info' style='text-align:right;'>{msg['hora']} | {msg['usuario']}</div>
+        </div>
+    </div>
+    <div class='chat-row left'>
+        <div class='bubble-assistant'>
+            {assistant_text}
+            <div class='meta-info'>
+                {msg['hora']} | Asistente<br>
+                <span style='font-size:9.5px'>KW: {', '.join(msg['keywords'])} — Emo: {msg['emocion']} — Confianza: {msg['confianza']:.2f}</span>
+            </div>
+        </div>
+    </div>
+    """
+
+
+class HistorialChat:
+    """
+    Historial acotado del chat: guarda cada mensaje junto con su HTML ya
+    sanitizado, calculado una sola vez al agregarlo. Al superar `max_mensajes`
+    se descartan los más antiguos, así el costo de cada rerun depende sólo de
+    la ventana que se muestra y no del largo de la conversación.
+    """
+    def __init__(self, max_mensajes=200, mensajes=()):
+        self._entradas = deque(maxlen=max_mensajes)
+        for msg in mensajes:
+            self.agregar(msg)
+
+    def agregar(self, msg):
+        self._entradas.append((msg, html_burbujas(msg)))
+
+    def __len__(self):
+        return len(self._entradas)
+
+    def mensajes(self):
+        return [msg for msg, _ in self._entradas]
+
+    def html_ventana(self, cantidad):
+        """HTML de los últimos `cantidad` intercambios, del más antiguo al más reciente."""
+        inicio = max(0, len(self._entradas) - cantidad)
+        return ''.join(self._entradas[i][1] for i in range(inicio, len(self._entradas)))
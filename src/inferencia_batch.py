@@ -0,0 +1,140 @@
+import os
+import queue
+import threading
+import time
+import logging
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_SIZE = int(os.getenv("WEVENTLY_BATCH_MAX_SIZE", "16"))
+MAX_WAIT_MS = float(os.getenv("WEVENTLY_BATCH_MAX_WAIT_MS", "5"))
+
+
+class MicroBatcher:
+    """
+    Agrupa pedidos concurrentes de inferencia y los procesa juntos.
+
+    `procesar_lote` recibe una lista de entradas y debe devolver una lista de
+    resultados del mismo largo y en el mismo orden. Cada `submit` devuelve un
+    Future que se resuelve cuando se procesa el lote que lo contiene. Un lote se
+    dispara al llegar a `max_batch_size` o al vencer `max_wait_ms` desde el
+    primer pedido pendiente.
+    """
+    def __init__(self, procesar_lote, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS, nombre="batcher"):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size debe ser >= 1")
+        self.procesar_lote = procesar_lote
+        self.max_batch_size = max_batch_size
+        self.max_wait_s = max_wait_ms / 1000
+        self.nombre = nombre
+        self._cola = queue.Queue()
+        self._cerrado = False
+        self.lotes_procesados = 0
+        self.items_procesados = 0
+        self._hilo = threading.Thread(target=self._loop, name=f"microbatch-{nombre}", daemon=True)
+        self._hilo.start()
+
+    def submit(self, entrada):
+        if self._cerrado:
+            raise RuntimeError(f"{self.nombre}: el batcher está cerrado")
+        futuro = Future()
+        self._cola.put((entrada, futuro))
+        return futuro
+
+    def _recolectar_lote(self):
+        primero = self._cola.get()
+        if primero is None:
+            return None
+        lote = [primero]
+        limite = time.monotonic() + self.max_wait_s
+        while len(lote) < self.max_batch_size:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                item = self._cola.get(timeout=restante)
+            except queue.Empty:
+                break
+            if item is None:
+                # cierre pedido: procesamos lo juntado y luego salimos
+                self._cola.put(None)
+                break
+            lote.append(item)
+        return lote
+
+    def _loop(self):
+        while True:
+            lote = self._recolectar_lote()
+            if lote is None:
+                return
+            lote = [(entrada, futuro) for entrada, futuro in lote if futuro.set_running_or_notify_cancel()]
+            if not lote:
+                continue
+            try:
+                resultados = self.procesar_lote([entrada for entrada, _ in lote])
+                if len(resultados) != len(lote):
+                    raise RuntimeError(f"{self.nombre}: el lote devolvió {len(resultados)} resultados para {len(lote)} entradas")
+            except Exception as e:
+                logger.error(f"{self.nombre}: fallo procesando lote de {len(lote)}", exc_info=True)
+                for _, futuro in lote:
+                    futuro.set_exception(e)
+                continue
+            for (_, futuro), resultado in zip(lote, resultados):
+                futuro.set_result(resultado)
+            self.lotes_procesados += 1
+            self.items_procesados += len(lote)
+
+    def cerrar(self, timeout=None):
+        self._cerrado = True
+        self._cola.put(None)
+        self._hilo.join(timeout)
+
+    def estadisticas(self):
+        lotes = self.lotes_procesados
+        return {
+            "lotes": lotes,
+            "items": self.items_procesados,
+            "tamano_medio_lote": (self.items_procesados / lotes) if lotes else 0.0,
+            "pendientes": self._cola.qsize(),
+        }
+
+
+class MotorInferencia:
+    """
+    Servicio de micro-batching para las etapas locales del pipeline:
+    emoción BETO (batch con padding), parseo spaCy (`nlp.pipe`) y clasificador
+    RandomForest (una sola `transform` dispersa por lote).
+    """
+    def __init__(self, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+        import wevently_langchain as wl
+        self.emocion = MicroBatcher(wl.detect_emotion_batch, max_batch_size, max_wait_ms, nombre="emocion")
+        self.spacy = MicroBatcher(lambda textos: list(wl.nlp.pipe(textos)), max_batch_size, max_wait_ms, nombre="spacy")
+        self.clasificador = MicroBatcher(wl.clasificar_categoria_ml_batch, max_batch_size, max_wait_ms, nombre="clasificador")
+
+    def detect_emotion(self, texto):
+        return self.emocion.submit(texto)
+
+    def parse(self, texto):
+        return self.spacy.submit(texto)
+
+    def clasificar(self, texto):
+        return self.clasificador.submit(texto)
+
+    def cerrar(self):
+        for batcher in (self.emocion, self.spacy, self.clasificador):
+            batcher.cerrar()
+
+    def estadisticas(self):
+        return {b.nombre: b.estadisticas() for b in (self.emocion, self.spacy, self.clasificador)}
+
+
+_motor = None
+_motor_lock = threading.Lock()
+
+def get_motor_inferencia():
+    global _motor
+    with _motor_lock:
+        if _motor is None:
+            _motor = MotorInferencia()
+        return _motor
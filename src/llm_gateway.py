@@ -0,0 +1,384 @@
+"""
+Gateway del cliente LLM: plazo por llamada, circuit breaker, hedging y respaldo.
+
+- Plazo: cada llamada tiene un tiempo máximo (WEVENTLY_LLM_PLAZO); al vencer se
+  pasa al respaldo aunque el request remoto siga en curso.
+- Circuit breaker: tras N fallos consecutivos deja de llamar al endpoint remoto
+  durante un enfriamiento; después deja pasar una única llamada de prueba.
+- Hedging: si la llamada tarda más que el p95 reciente, se envía un duplicado
+  y se usa la primera respuesta (con un presupuesto máximo de duplicados y
+  nunca con el circuito abierto o semiabierto).
+- Respaldo: un modelo Ollama local opcional y, como último recurso, una
+  plantilla construida por quien llama (p. ej. a partir de la solución elegida).
+
+Dentro de `registrar_origenes()` cada respuesta anota de dónde salió
+("primario", "respaldo", "plantilla" o "cortada"); quien llama lo consulta con
+`respondio_el_primario()` (p. ej. para no cachear respuestas de respaldo).
+"""
+import os
+import time
+import queue
+import asyncio
+import logging
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+
+from trazas import METRICAS, METRICA_LLM_EVENTOS, METRICA_LLM_CIRCUITO
+
+logger = logging.getLogger(__name__)
+
+CERRADO, SEMIABIERTO, ABIERTO = "cerrado", "semiabierto", "abierto"
+_VALOR_ESTADO = {CERRADO: 0, SEMIABIERTO: 1, ABIERTO: 2}
+_FIN = object()
+
+_origenes_actuales = contextvars.ContextVar("wevently_origenes_llm", default=None)
+
+
+@contextmanager
+def registrar_origenes():
+    """Abre el registro de orígenes de las respuestas del LLM para una consulta."""
+    origenes = []
+    token = _origenes_actuales.set(origenes)
+    try:
+        yield origenes
+    finally:
+        try:
+            _origenes_actuales.reset(token)
+        except ValueError:
+            # generador de streaming cerrado desde otro contexto
+            pass
+
+
+def respondio_el_primario():
+    """True si todas las respuestas del LLM de la consulta actual vinieron del modelo primario."""
+    origenes = _origenes_actuales.get()
+    return origenes is not None and all(origen == "primario" for origen in origenes)
+
+
+def _anotar_origen(origen):
+    origenes = _origenes_actuales.get()
+    if origenes is not None:
+        origenes.append(origen)
+
+
+def plazo_configurado(respaldo=False):
+    """Plazo por llamada del entorno (WEVENTLY_LLM_PLAZO, o WEVENTLY_LLM_PLAZO_RESPALDO para el respaldo)."""
+    if respaldo:
+        return float(os.getenv("WEVENTLY_LLM_PLAZO_RESPALDO", "20"))
+    return float(os.getenv("WEVENTLY_LLM_PLAZO", "30"))
+
+
+class LLMNoDisponible(Exception):
+    """Fallaron el LLM remoto y el respaldo, y quien llama no dio una plantilla."""
+
+
+class PlazoVencido(TimeoutError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Se abre tras `umbral_fallos` fallos consecutivos. Pasado `enfriamiento_s`
+    queda semiabierto y deja pasar una sola llamada de prueba: si sale bien se
+    cierra, si falla se vuelve a abrir.
+    """
+    def __init__(self, umbral_fallos=None, enfriamiento_s=None, nombre="llm", reloj=time.monotonic):
+        self.umbral_fallos = int(os.getenv("WEVENTLY_LLM_CIRCUITO_FALLOS", "5")) if umbral_fallos is None else umbral_fallos
+        self.enfriamiento_s = float(os.getenv("WEVENTLY_LLM_CIRCUITO_ENFRIAMIENTO", "30")) if enfriamiento_s is None else enfriamiento_s
+        self.nombre = nombre
+        self._reloj = reloj
+        self._lock = threading.Lock()
+        self.estado = CERRADO
+        self.fallos_consecutivos = 0
+        self.aperturas = 0
+        self._abierto_en = None
+        self._prueba_en_curso = False
+        METRICAS.fijar(METRICA_LLM_CIRCUITO, _VALOR_ESTADO[CERRADO], circuito=nombre)
+
+    def permitir(self):
+        with self._lock:
+            if self.estado == ABIERTO and self._reloj() - self._abierto_en >= self.enfriamiento_s:
+                self._cambiar(SEMIABIERTO)
+            if self.estado == CERRADO:
+                return True
+            if self.estado == SEMIABIERTO and not self._prueba_en_curso:
+                self._prueba_en_curso = True
+                return True
+            return False
+
+    def cerrado(self):
+        """True si el circuito está cerrado (sin consumir la llamada de prueba del semiabierto)."""
+        with self._lock:
+            return self.estado == CERRADO
+
+    def registrar_exito(self):
+        with self._lock:
+            self.fallos_consecutivos = 0
+            self._prueba_en_curso = False
+            if self.estado != CERRADO:
+                self._cambiar(CERRADO)
+
+    def registrar_fallo(self):
+        with self._lock:
+            self.fallos_consecutivos += 1
+            self._prueba_en_curso = False
+            if self.estado == SEMIABIERTO or (self.estado == CERRADO and self.fallos_consecutivos >= self.umbral_fallos):
+                self.aperturas += 1
+                self._abierto_en = self._reloj()
+                self._cambiar(ABIERTO)
+
+    def _cambiar(self, estado):
+        logger.warning(f"Circuito LLM '{self.nombre}': {self.estado} -> {estado}")
+        self.estado = estado
+        METRICAS.fijar(METRICA_LLM_CIRCUITO, _VALOR_ESTADO[estado], circuito=self.nombre)
+
+
+class GatewayLLM:
+    """
+    Envuelve un cliente con `invoke`/`ainvoke`/`stream` (OllamaLLM) y expone la
+    misma interfaz. `plantilla` (texto o función sin argumentos, por llamada o
+    por defecto en el constructor) es la respuesta si fallan el remoto y el
+    respaldo; sin plantilla se lanza LLMNoDisponible.
+    """
+    def __init__(self, primario, respaldo=None, breaker=None, nombre="llm", plantilla=None, plazo_s=None, plazo_respaldo_s=None,
+                 hedge=None, hedge_minimo_s=None, max_fraccion_hedge=None, percentil_hedge=95, muestras_minimas=20,
+                 ventana_latencias=200, max_hilos=16):
+        self.primario = primario
+        self.respaldo = respaldo
+        self.nombre = nombre
+        self.plantilla = plantilla
+        self.breaker = breaker or CircuitBreaker(nombre=nombre)
+        self.plazo_s = plazo_configurado() if plazo_s is None else plazo_s
+        self.plazo_respaldo_s = plazo_configurado(respaldo=True) if plazo_respaldo_s is None else plazo_respaldo_s
+        self.hedge = os.getenv("WEVENTLY_LLM_HEDGE", "1") == "1" if hedge is None else hedge
+        self.hedge_minimo_s = float(os.getenv("WEVENTLY_LLM_HEDGE_MINIMO", "1.0")) if hedge_minimo_s is None else hedge_minimo_s
+        self.max_fraccion_hedge = (float(os.getenv("WEVENTLY_LLM_HEDGE_MAX_FRACCION", "0.1"))
+                                   if max_fraccion_hedge is None else max_fraccion_hedge)
+        self.percentil_hedge = percentil_hedge
+        self.muestras_minimas = muestras_minimas
+        self._latencias_s = deque(maxlen=ventana_latencias)
+        self._lock = threading.Lock()
+        self._ejecutor = ThreadPoolExecutor(max_hilos, thread_name_prefix=f"llm-{nombre}")
+        self.eventos = {}
+        self.llamadas = 0
+
+    # --- Estadísticas ---
+    def _evento(self, evento):
+        with self._lock:
+            self.eventos[evento] = self.eventos.get(evento, 0) + 1
+        METRICAS.contar(METRICA_LLM_EVENTOS, llm=self.nombre, evento=evento)
+
+    def retraso_hedge(self):
+        """Espera antes de enviar el duplicado: p95 de las latencias recientes (None sin historial suficiente)."""
+        with self._lock:
+            if not self.hedge or len(self._latencias_s) < self.muestras_minimas:
+                return None
+            return max(self.hedge_minimo_s, float(np.percentile(self._latencias_s, self.percentil_hedge)))
+
+    def _reservar_hedge(self):
+        # con el endpoint fallando un duplicado sólo suma carga (y en semiabierto pasa una única prueba)
+        if not self.breaker.cerrado():
+            return False
+        with self._lock:
+            if self.eventos.get("hedge_enviado", 0) >= self.max_fraccion_hedge * self.llamadas:
+                return False
+        self._evento("hedge_enviado")
+        return True
+
+    def _iniciar(self):
+        with self._lock:
+            self.llamadas += 1
+        return time.monotonic() + self.plazo_s
+
+    def _exito(self, inicio):
+        with self._lock:
+            self._latencias_s.append(time.monotonic() - inicio)
+        self.breaker.registrar_exito()
+        self._evento("exito")
+        _anotar_origen("primario")
+
+    def _fallo(self, error):
+        self.breaker.registrar_fallo()
+        self._evento("plazo_vencido" if isinstance(error, PlazoVencido) else "fallo")
+        logger.warning(f"LLM '{self.nombre}' falló ({type(error).__name__}: {error}); se usa el respaldo.")
+
+    def estadisticas(self):
+        with self._lock:
+            latencias = np.array(self._latencias_s)
+            stats = {"llamadas": self.llamadas, **self.eventos}
+        stats.update(circuito=self.breaker.estado, aperturas_circuito=self.breaker.aperturas,
+                     retraso_hedge_s=self.retraso_hedge())
+        if latencias.size:
+            stats.update(p50_s=float(np.percentile(latencias, 50)), p95_s=float(np.percentile(latencias, 95)))
+        return stats
+
+    # --- Respaldo ---
+    def _plantilla(self, plantilla, error=None):
+        plantilla = self.plantilla if plantilla is None else plantilla
+        if plantilla is None:
+            raise LLMNoDisponible(f"LLM '{self.nombre}' no disponible") from error
+        self._evento("plantilla")
+        _anotar_origen("plantilla")
+        return plantilla() if callable(plantilla) else plantilla
+
+    def _degradar(self, prompt, plantilla):
+        if self.respaldo is None:
+            return self._plantilla(plantilla)
+        try:
+            respuesta = self._ejecutor.submit(self.respaldo.invoke, prompt).result(timeout=self.plazo_respaldo_s)
+        except Exception as e:
+            logger.warning(f"Respaldo LLM '{self.nombre}' falló ({type(e).__name__}).")
+            return self._plantilla(plantilla, e)
+        self._evento("respaldo")
+        _anotar_origen("respaldo")
+        return respuesta
+
+    async def _adegradar(self, prompt, plantilla):
+        if self.respaldo is None:
+            return self._plantilla(plantilla)
+        try:
+            respuesta = await asyncio.wait_for(self.respaldo.ainvoke(prompt), self.plazo_respaldo_s)
+        except Exception as e:
+            logger.warning(f"Respaldo LLM '{self.nombre}' falló ({type(e).__name__}).")
+            return self._plantilla(plantilla, e)
+        self._evento("respaldo")
+        _anotar_origen("respaldo")
+        return respuesta
+
+    # --- Interfaz del cliente ---
+    def invoke(self, prompt, plantilla=None):
+        if not self.breaker.permitir():
+            self._evento("circuito_abierto")
+            return self._degradar(prompt, plantilla)
+        limite = self._iniciar()
+        inicio = time.monotonic()
+        try:
+            respuesta = self._invocar_con_hedge(prompt, limite)
+        except Exception as e:
+            self._fallo(e)
+            return self._degradar(prompt, plantilla)
+        self._exito(inicio)
+        return respuesta
+
+    def _invocar_con_hedge(self, prompt, limite):
+        futuros = [self._ejecutor.submit(self.primario.invoke, prompt)]
+        retraso = self.retraso_hedge()
+        if retraso is not None:
+            hechos, _ = wait(futuros, timeout=max(0.0, min(retraso, limite - time.monotonic())))
+            if not hechos and time.monotonic() < limite and self._reservar_hedge():
+                futuros.append(self._ejecutor.submit(self.primario.invoke, prompt))
+        pendientes, error = set(futuros), None
+        while pendientes:
+            restante = limite - time.monotonic()
+            hechos, pendientes = wait(pendientes, timeout=max(0.0, restante), return_when=FIRST_COMPLETED)
+            if not hechos:
+                # las llamadas siguen en sus hilos hasta el timeout HTTP del cliente; el resultado se descarta
+                raise PlazoVencido(f"sin respuesta del LLM en {self.plazo_s:.1f}s")
+            for futuro in hechos:
+                if futuro.exception() is None:
+                    if futuro is not futuros[0]:
+                        self._evento("hedge_ganador")
+                    return futuro.result()
+                error = futuro.exception()
+        raise error
+
+    async def ainvoke(self, prompt, plantilla=None):
+        if not self.breaker.permitir():
+            self._evento("circuito_abierto")
+            return await self._adegradar(prompt, plantilla)
+        limite = self._iniciar()
+        inicio = time.monotonic()
+        try:
+            respuesta = await self._ainvocar_con_hedge(prompt, limite)
+        except Exception as e:
+            self._fallo(e)
+            return await self._adegradar(prompt, plantilla)
+        self._exito(inicio)
+        return respuesta
+
+    async def _ainvocar_con_hedge(self, prompt, limite):
+        tareas = [asyncio.ensure_future(self.primario.ainvoke(prompt))]
+        try:
+            retraso = self.retraso_hedge()
+            if retraso is not None:
+                hechos, _ = await asyncio.wait(tareas, timeout=max(0.0, min(retraso, limite - time.monotonic())))
+                if not hechos and time.monotonic() < limite and self._reservar_hedge():
+                    tareas.append(asyncio.ensure_future(self.primario.ainvoke(prompt)))
+            pendientes, error = set(tareas), None
+            while pendientes:
+                hechos, pendientes = await asyncio.wait(pendientes, timeout=max(0.0, limite - time.monotonic()),
+                                                        return_when=asyncio.FIRST_COMPLETED)
+                if not hechos:
+                    raise PlazoVencido(f"sin respuesta del LLM en {self.plazo_s:.1f}s")
+                for tarea in hechos:
+                    if tarea.exception() is None:
+                        if tarea is not tareas[0]:
+                            self._evento("hedge_ganador")
+                        return tarea.result()
+                    error = tarea.exception()
+            raise error
+        finally:
+            for tarea in tareas:
+                tarea.cancel()
+
+    def stream(self, prompt, plantilla=None):
+        """
+        Fragmentos del LLM remoto con el mismo plazo total. Si falla antes del
+        primer fragmento se entrega el respaldo completo; si falla a mitad de la
+        respuesta, ésta se corta ahí (lo ya mostrado no se puede retirar).
+        """
+        if not self.breaker.permitir():
+            self._evento("circuito_abierto")
+            yield self._degradar(prompt, plantilla)
+            return
+        limite = self._iniciar()
+        inicio = time.monotonic()
+        entregado = False
+        try:
+            for fragmento in self._stream_con_plazo(prompt, limite):
+                entregado = True
+                yield fragmento
+        except Exception as e:
+            self._fallo(e)
+            if entregado:
+                _anotar_origen("cortada")
+            else:
+                yield self._degradar(prompt, plantilla)
+            return
+        # la duración total es comparable con la de invoke y alimenta el mismo p95
+        self._exito(inicio)
+
+    def _stream_con_plazo(self, prompt, limite):
+        # El stream remoto corre en un hilo propio; acá se espera cada fragmento con el plazo restante
+        cola = queue.Queue()
+        cancelado = threading.Event()
+
+        def producir():
+            try:
+                for fragmento in self.primario.stream(prompt):
+                    if cancelado.is_set():
+                        return
+                    cola.put(fragmento)
+                cola.put(_FIN)
+            except Exception as e:
+                cola.put(e)
+
+        threading.Thread(target=producir, daemon=True, name=f"llm-{self.nombre}-stream").start()
+        try:
+            while True:
+                try:
+                    item = cola.get(timeout=max(0.0, limite - time.monotonic()))
+                except queue.Empty:
+                    raise PlazoVencido(f"stream del LLM sin completar en {self.plazo_s:.1f}s") from None
+                if item is _FIN:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            cancelado.set()
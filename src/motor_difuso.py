@@ -0,0 +1,76 @@
+import threading
+import numpy as np
+import skfuzzy as fuzz
+from skfuzzy import control as ctrl
+
+# Universo de entrada: cantidad de keywords (0..5, se recorta fuera de rango)
+UNIVERSO_KEYWORDS = np.arange(0, 6, 1)
+UNIVERSO_CONFIANZA = np.arange(0, 1.1, 0.1)
+
+
+def construir_sistema_confianza():
+    """Base de reglas difusas keywords -> confianza (Módulo 3)."""
+    kw_input = ctrl.Antecedent(UNIVERSO_KEYWORDS, 'num_keywords')
+    conf_output = ctrl.Consequent(UNIVERSO_CONFIANZA, 'confianza')
+    kw_input['bajo'] = fuzz.trimf(kw_input.universe, [0, 0, 2])
+    kw_input['medio'] = fuzz.trimf(kw_input.universe, [1, 3, 5])
+    kw_input['alto'] = fuzz.trimf(kw_input.universe, [3, 5, 5])
+    conf_output['baja'] = fuzz.trimf(conf_output.universe, [0, 0, 0.7])
+    conf_output['alta'] = fuzz.trimf(conf_output.universe, [0.6, 1, 1])
+    rule1 = ctrl.Rule(kw_input['bajo'], conf_output['baja'])
+    rule2 = ctrl.Rule(kw_input['medio'], conf_output['baja'])
+    rule3 = ctrl.Rule(kw_input['alto'], conf_output['alta'])
+    return ctrl.ControlSystem([rule1, rule2, rule3])
+
+
+class MotorDifusoConfianza:
+    """
+    Controlador difuso compilado una sola vez.
+
+    La entrada es un conteo entero de keywords, así que la salida defuzzificada
+    se precalcula sobre todo el universo y cada consulta es un lookup en tabla.
+    Los valores fuera del universo se recortan igual que hace skfuzzy
+    (clip_to_bounds); los no enteros se simulan una vez y se memorizan.
+    """
+    def __init__(self):
+        self._sistema = construir_sistema_confianza()
+        self._sim = ctrl.ControlSystemSimulation(self._sistema)
+        self._lock = threading.Lock()
+        self._memo = {}
+        self.minimo = int(UNIVERSO_KEYWORDS[0])
+        self.maximo = int(UNIVERSO_KEYWORDS[-1])
+        self.tabla = np.array([self._simular(v) for v in UNIVERSO_KEYWORDS], dtype=float)
+
+    def _simular(self, valor):
+        with self._lock:
+            self._sim.input['num_keywords'] = valor
+            self._sim.compute()
+            return float(self._sim.output['confianza'])
+
+    def confianza(self, num_keywords):
+        valor = min(max(num_keywords, self.minimo), self.maximo)
+        if float(valor).is_integer():
+            return float(self.tabla[int(valor) - self.minimo])
+        if valor not in self._memo:
+            self._memo[valor] = self._simular(valor)
+        return self._memo[valor]
+
+    def confianza_batch(self, conteos):
+        """Confianza para un array de conteos enteros de keywords."""
+        conteos = np.clip(np.asarray(conteos), self.minimo, self.maximo)
+        if not np.issubdtype(conteos.dtype, np.integer):
+            if not np.all(np.mod(conteos, 1) == 0):
+                return np.array([self.confianza(c) for c in conteos.ravel()]).reshape(conteos.shape)
+            conteos = conteos.astype(int)
+        return self.tabla[conteos - self.minimo]
+
+
+_motor = None
+_motor_lock = threading.Lock()
+
+def get_motor_difuso():
+    global _motor
+    with _motor_lock:
+        if _motor is None:
+            _motor = MotorDifusoConfianza()
+        return _motor
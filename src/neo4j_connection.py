@@ -1,30 +1,52 @@
 import os
 import logging
 from langchain_neo4j import Neo4jGraph
+from neo4j import AsyncGraphDatabase
 
 logger = logging.getLogger(__name__)
 
+# Endpoint elegido por get_graph (Aura o local), reutilizado por el driver async
+_url_activa = None
+
+def get_pool_config():
+    """Driver pool settings for concurrent sessions, read from environment variables."""
+    return {
+        'max_connection_pool_size': int(os.getenv('NEO4J_MAX_POOL_SIZE', '50')),
+        'connection_acquisition_timeout': float(os.getenv('NEO4J_ACQUISITION_TIMEOUT', '10')),
+        'connection_timeout': float(os.getenv('NEO4J_CONNECTION_TIMEOUT', '5')),
+        'max_connection_lifetime': float(os.getenv('NEO4J_MAX_CONNECTION_LIFETIME', '3600')),
+    }
+
+def get_query_timeout():
+    """Per-transaction timeout in seconds (None disables it)."""
+    timeout = os.getenv('NEO4J_QUERY_TIMEOUT', '5')
+    return float(timeout) if timeout else None
+
 def get_graph():
     """Return a Neo4jGraph connected to Aura if available, otherwise fall back to local.
 
     Reads credentials from environment variables. Logs which endpoint is used
-    but never writes credentials to logs.
+    but never writes credentials to logs. The underlying driver keeps a bounded
+    connection pool (see get_pool_config) so concurrent sessions do not
+    serialize on a single connection.
     """
     # Read env vars
     aura_uri = os.getenv('NEO4J_URI') or os.getenv('NEO4J_URL_QUERY') or ''
     bolt_local = os.getenv('NEO4J_URL', 'bolt://localhost:7687')
     user = os.getenv('NEO4J_USERNAME', 'neo4j')
     pwd = os.getenv('NEO4J_PASSWORD', '')
+    graph_kwargs = {'timeout': get_query_timeout(), 'driver_config': get_pool_config()}
 
     # Try remote (Aura) first if a URI is provided
     if aura_uri:
         try:
             logger.info('Intentando conectar a Neo4j remoto (Aura)...')
-            graph = Neo4jGraph(url=aura_uri, username=user, password=pwd)
+            graph = Neo4jGraph(url=aura_uri, username=user, password=pwd, **graph_kwargs)
             # quick smoke-test query to validate connection
             try:
                 graph.query('RETURN 1 AS ok')
                 logger.info('Conexión Neo4j establecida en remoto (Aura).')
+                _set_url_activa(aura_uri)
                 return graph
             except Exception:
                 # remote driver created but query failed; close and fallback
@@ -35,11 +57,29 @@ def get_graph():
     # Fallback to local
     try:
         logger.info('Intentando conectar a Neo4j local...')
-        graph = Neo4jGraph(url=bolt_local, username=user, password=pwd)
+        graph = Neo4jGraph(url=bolt_local, username=user, password=pwd, **graph_kwargs)
         # test
         graph.query('RETURN 1 AS ok')
         logger.info('Conexión Neo4j establecida en local.')
+        _set_url_activa(bolt_local)
         return graph
     except Exception as e:
         logger.error('No fue posible conectar a Neo4j (remoto ni local). Revisa las instancias.', exc_info=True)
         raise
+
+
+def _set_url_activa(url):
+    global _url_activa
+    _url_activa = url
+
+def get_async_driver():
+    """Return an async Neo4j driver for the endpoint selected by get_graph.
+
+    Uses the same pool settings as the sync driver. Returns None if get_graph
+    has not connected yet.
+    """
+    if _url_activa is None:
+        return None
+    user = os.getenv('NEO4J_USERNAME', 'neo4j')
+    pwd = os.getenv('NEO4J_PASSWORD', '')
+    return AsyncGraphDatabase.driver(_url_activa, auth=(user, pwd), **get_pool_config())
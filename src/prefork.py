@@ -0,0 +1,241 @@
+"""
+Precarga y fork: un solo juego de modelos compartido copy-on-write entre workers.
+
+Sin precarga cada worker del pool carga su propia copia de BETO, spaCy, el
+RandomForest y el vocabulario TF-IDF. Con precarga el proceso padre carga los
+modelos locales una vez, los congela para inferencia y recién entonces se
+forkean los workers, que heredan esas páginas compartidas:
+
+- Los módulos PyTorch quedan en eval() y sin gradientes, y sus tensores pasan
+  a memoria compartida (`share_memory`): los pesos no se copian aunque algo
+  los toque.
+- Los arreglos NumPy del forest compacto quedan de sólo lectura.
+- El GC se deshabilita mientras se carga (no deja huecos en páginas que los
+  hijos reutilizarían) y `gc.freeze()` mueve todo lo cargado a la generación
+  permanente antes del fork: las colecciones de los hijos no escriben en los
+  encabezados de esos objetos. Cada worker rehabilita el GC al iniciar.
+
+Lo que no se puede evitar: los contadores de referencia de los objetos Python
+que se tocan al inferir (p. ej. los enteros del `vocabulary_` del TF-IDF, o los
+~100 árboles del RandomForest en pickle; el forest compacto son 7 arreglos).
+Esas páginas se copian de a una la primera vez que un worker las usa.
+
+No se precargan: las sesiones de ONNX Runtime (su pool de hilos no sobrevive a
+un fork; cada worker crea la suya) ni Neo4j/LLM (conexiones de red por worker).
+En el padre no se corre inferencia: los pools de hilos de torch/tokenizers
+deben crearse recién en los hijos.
+
+Memoria por worker (desde /proc/<pid>/smaps_rollup): única (USS, páginas
+privadas), compartida y PSS (compartida prorrateada entre procesos):
+
+    python src/prefork.py --workers 4              # precarga + fork
+    python src/prefork.py --workers 4 --sin-precarga
+    python src/prefork.py --pids 1234 1235         # workers ya corriendo
+"""
+import os
+import gc
+import sys
+import time
+import json
+import logging
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+logger = logging.getLogger(__name__)
+
+CAMPOS_SMAPS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty", "Swap")
+MENSAJES_PRUEBA = (
+    "Me rechazaron la tarjeta al pagar la reserva del salón",
+    "La app no me deja iniciar sesión, ya cambié la clave",
+    "El proveedor de catering no se presentó al evento",
+)
+
+
+# --- Congelado para inferencia ---
+def _modulos_torch(objeto):
+    """Módulos PyTorch dentro de un recurso (el modelo mismo o el `modelo` de BackendPyTorch)."""
+    if "torch" not in sys.modules:
+        return []
+    import torch
+    return [m for m in (objeto, getattr(objeto, "modelo", None)) if isinstance(m, torch.nn.Module)]
+
+
+def congelar_para_inferencia(objeto):
+    """eval + sin gradientes + tensores en memoria compartida; arreglos NumPy de sólo lectura."""
+    for modulo in _modulos_torch(objeto):
+        modulo.eval()
+        modulo.requires_grad_(False)
+        modulo.share_memory()
+    for valor in getattr(objeto, "__dict__", {}).values():
+        if isinstance(valor, np.ndarray):
+            valor.flags.writeable = False
+    return objeto
+
+
+def recursos_precargables(nombres):
+    """Descarta los recursos que no sobreviven a un fork (sesión de ONNX Runtime)."""
+    import wevently_langchain as wl
+    if wl.EMOCION_BACKEND.startswith("onnx"):
+        # el tokenizer sí se comparte; la sesión ORT se crea en cada worker
+        return [n for n in nombres if n != "emo_backend"]
+    return list(nombres)
+
+
+def precargar(nombres=None):
+    """
+    Carga los modelos locales en este proceso (el padre del pool), los congela
+    para inferencia y congela el heap para el fork. Devuelve los tiempos de
+    carga (ms). El GC queda deshabilitado: llamar a `reanudar_gc` cuando los
+    workers ya estén forkeados.
+    """
+    import wevently_langchain as wl
+    # Los tokenizers rápidos de HF no deben abrir su pool de hilos antes del fork
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    nombres = recursos_precargables(wl.RECURSOS_LOCALES if nombres is None else nombres)
+    gc.disable()
+    try:
+        tiempos = wl.warmup(nombres)
+        for nombre in list(nombres) + ["emo_model"]:
+            if wl.REGISTRO.cargado(nombre):
+                congelar_para_inferencia(wl.REGISTRO.obtener(nombre))
+    except Exception:
+        gc.enable()
+        raise
+    gc.freeze()
+    logger.info(f"Precarga para fork: {', '.join(nombres)}; {gc.get_freeze_count()} objetos congelados")
+    return tiempos
+
+
+def reanudar_gc():
+    gc.enable()
+
+
+def inicializar_worker(cola_logs=None, cola_resultados=None):
+    """
+    Al iniciar un worker forkeado: rehabilita el GC y carga lo que no heredó
+    del padre (todo sin precarga; la sesión ONNX con precarga). Con las colas,
+    el log y los registros de resultados van al proceso padre, que es el único
+    que escribe (y rota) esos archivos.
+    """
+    gc.enable()
+    if "torch" in sys.modules:
+        # el pool intra-op de torch se crea en el hijo con los hilos configurados
+        from emocion_backends import configurar_hilos_torch
+        configurar_hilos_torch()
+    import wevently_langchain as wl
+    if cola_logs is not None:
+        wl.configurar_logging(cola_logs)
+    if cola_resultados is not None:
+        from sink_resultados import SinkCola
+        wl.REGISTRO.fijar("sink_resultados", SinkCola(cola_resultados))
+    wl.warmup(wl.RECURSOS_LOCALES)
+
+
+# --- Memoria por proceso ---
+def parsear_smaps(texto):
+    """Suma (en kB) los campos de memoria de smaps_rollup (o de smaps, una entrada por mapeo)."""
+    totales = dict.fromkeys(CAMPOS_SMAPS, 0)
+    for linea in texto.splitlines():
+        campo, _, resto = linea.partition(":")
+        if campo in totales:
+            totales[campo] += int(resto.split()[0])
+    return totales
+
+
+def memoria_proceso(pid=None):
+    """RSS, PSS, única (USS) y compartida de un proceso, en MB."""
+    pid = os.getpid() if pid is None else pid
+    for archivo in ("smaps_rollup", "smaps"):
+        try:
+            with open(f"/proc/{pid}/{archivo}", encoding="utf-8") as f:
+                kb = parsear_smaps(f.read())
+            break
+        except FileNotFoundError:
+            continue
+    else:
+        raise OSError(f"No se puede leer la memoria del proceso {pid} (¿no es Linux o ya terminó?)")
+    return {
+        "pid": pid,
+        "rss_mb": round(kb["Rss"] / 1024, 1),
+        "pss_mb": round(kb["Pss"] / 1024, 1),
+        "unica_mb": round((kb["Private_Clean"] + kb["Private_Dirty"]) / 1024, 1),
+        "compartida_mb": round((kb["Shared_Clean"] + kb["Shared_Dirty"]) / 1024, 1),
+    }
+
+
+def reporte_memoria(pids):
+    """Memoria de cada worker y totales; la suma de PSS es la memoria real del pool."""
+    workers = []
+    for pid in pids:
+        try:
+            workers.append(memoria_proceso(pid))
+        except OSError:
+            logger.warning(f"Sin datos de memoria para el pid {pid}")
+    return {
+        "workers": workers,
+        "unica_total_mb": round(sum(w["unica_mb"] for w in workers), 1),
+        "pss_total_mb": round(sum(w["pss_mb"] for w in workers), 1),
+    }
+
+
+def publicar_metricas(reporte):
+    from trazas import METRICAS, METRICA_MEMORIA_WORKER
+    for worker in reporte["workers"]:
+        for tipo in ("unica", "compartida", "pss"):
+            METRICAS.fijar(METRICA_MEMORIA_WORKER, worker[f"{tipo}_mb"] * 1024 * 1024, pid=str(worker["pid"]), tipo=tipo)
+
+
+# --- CLI de medición ---
+def _inferir(mensajes, espera_s):
+    import wevently_langchain as wl
+    textos = list(mensajes)
+    wl.clasificar_categoria_ml_batch(textos)
+    wl.detect_keywords_batch(textos)
+    wl.detect_emotion_batch(textos)
+    # los workers quedan ocupados un momento para que cada uno reciba una tarea
+    time.sleep(espera_s)
+    return os.getpid()
+
+
+def medir(workers, precarga=True, mensajes=MENSAJES_PRUEBA, espera_s=0.5):
+    """Levanta un pool (con o sin precarga), corre inferencia en cada worker y devuelve su memoria."""
+    if precarga:
+        precargar()
+    contexto = multiprocessing.get_context("fork")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=contexto,
+                             initializer=inicializar_worker) as ejecutor:
+        if precarga:
+            reanudar_gc()
+        pids = set(ejecutor.map(_inferir, [mensajes] * workers, [espera_s] * workers))
+        reporte = reporte_memoria(sorted(pids))
+    reporte["padre"] = memoria_proceso()
+    reporte["precarga"] = precarga
+    return reporte
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Memoria única y compartida de los workers con precarga y fork")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--sin-precarga", action="store_true", help="Cada worker carga sus propios modelos")
+    parser.add_argument("--pids", type=int, nargs="*", help="Sólo reportar procesos ya corriendo")
+    args = parser.parse_args(argv)
+    if args.pids:
+        print(json.dumps(reporte_memoria(args.pids), ensure_ascii=False, indent=2))
+        return 0
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    reporte = medir(args.workers, precarga=not args.sin_precarga)
+    for w in reporte["workers"]:
+        print(f"pid {w['pid']:>7}: única {w['unica_mb']:>8.1f} MB  compartida {w['compartida_mb']:>8.1f} MB  "
+              f"pss {w['pss_mb']:>8.1f} MB")
+    print(f"Total workers: única {reporte['unica_total_mb']:.1f} MB, pss {reporte['pss_total_mb']:.1f} MB "
+          f"(padre: rss {reporte['padre']['rss_mb']:.1f} MB)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+import os
+import time
+import asyncio
+import threading
+import weakref
+import logging
+from collections import deque
+import numpy as np
+from neo4j import Query
+from neo4j.exceptions import ServiceUnavailable, SessionExpired, TransientError
+
+logger = logging.getLogger(__name__)
+
+# Consulta constante: las keywords y el rol viajan como parámetros, así Neo4j
+# reutiliza el plan cacheado y no hay riesgo de inyección por comillas.
+_CYPHER_CANDIDATOS = """
+    MATCH (k)-[:DISPARA]->(c:CategoriaProblema)
+    OPTIONAL MATCH (c)-[:AGRUPA]->(t:TipoProblema)-[:RESUELTO_POR]->(s:Solucion)
+    OPTIONAL MATCH (c)-[:TIENE_UN]->(tu:TipoUsuario {nombre: $tipo_usuario})
+    WITH c, t, s, tu, collect(DISTINCT k.nombre) AS matched_keywords
+    WITH c,t,s,tu,matched_keywords, size(matched_keywords) AS matched_count,
+         coalesce(c.confianzaDecision,0) AS confianza,
+         CASE WHEN tu IS NULL THEN 0 ELSE 1 END AS has_type
+    RETURN DISTINCT
+        t.nombre AS tipo_problema,
+        s.accion AS solucion,
+        confianza AS confianza,
+        matched_count AS matched_count,
+        matched_keywords AS matched_keywords,
+        has_type
+    ORDER BY has_type DESC, matched_count DESC, confianza DESC
+    """
+CYPHER_RECUPERACION = """
+    UNWIND $kws AS kw
+    MATCH (k:PalabraClave)
+    WHERE toLower(k.nombre) = kw""" + _CYPHER_CANDIDATOS
+# Misma consulta con búsqueda por índice sobre la propiedad normalizada (ver esquema_kg.py)
+CYPHER_RECUPERACION_INDEXADA = """
+    UNWIND $kws AS kw
+    MATCH (k:PalabraClave {nombre_lower: kw})""" + _CYPHER_CANDIDATOS
+
+# Errores de conexión/cluster que vale la pena reintentar
+ERRORES_REINTENTABLES = (ServiceUnavailable, SessionExpired, TransientError)
+
+
+def parametros_recuperacion(keywords, tipo_usuario):
+    return {"kws": [k.lower() for k in keywords], "tipo_usuario": tipo_usuario}
+
+
+async def _cerrar_al_terminar_el_loop(driver):
+    try:
+        yield
+    finally:
+        await driver.close()
+
+
+class RecuperadorCypher:
+    """
+    Ejecuta la consulta de recuperación sobre un Neo4jGraph (que ya maneja el
+    pool de conexiones del driver) con reintentos y registro de latencias.
+    `aconsultar` usa el driver async de Neo4j si se provee uno; si no, corre la
+    consulta síncrona en un executor. Un AsyncDriver queda atado al event loop
+    donde abrió sus conexiones: con `fabrica_driver_async` se crea uno por loop
+    (varios `asyncio.run` en el mismo proceso no comparten conexiones) y se cierra cuando el loop
+    termina (`asyncio.run` cierra los generadores async pendientes) o con `acerrar`. `cypher` permite usar la variante
+    indexada de la consulta; con `elegir_cypher` (p. ej. esquema_kg.consulta_recuperacion) la elección
+    se repite en segundo plano cada `revision_s`, así un índice que se cae o nodos cargados sin
+    `nombre_lower` vuelven a la consulta con toLower (y al revés) sin reiniciar el proceso.
+    """
+    def __init__(self, graph, reintentos=None, backoff_s=None, ventana_latencias=1000, driver_async=None, timeout_s=None,
+                 cypher=CYPHER_RECUPERACION, fabrica_driver_async=None, elegir_cypher=None, revision_s=None):
+        self.graph = graph
+        self.elegir_cypher = elegir_cypher
+        self.cypher = cypher if elegir_cypher is None else elegir_cypher()
+        self.revision_s = (float(os.getenv("WEVENTLY_KG_REVISION_ESQUEMA", os.getenv("WEVENTLY_KG_SNAPSHOT_TTL", "300")))
+                           if revision_s is None else revision_s)
+        self._revisado_en = time.monotonic()
+        self._revisando = False
+        self.driver_async = driver_async
+        self.fabrica_driver_async = fabrica_driver_async
+        # loop -> (driver, guardián que lo cierra); la entrada desaparece cuando el loop se libera
+        self._drivers_por_loop = weakref.WeakKeyDictionary()
+        self.timeout_s = timeout_s
+        self.reintentos = int(os.getenv("NEO4J_QUERY_RETRIES", "2")) if reintentos is None else reintentos
+        self.backoff_s = float(os.getenv("NEO4J_RETRY_BACKOFF", "0.2")) if backoff_s is None else backoff_s
+        self._latencias_ms = deque(maxlen=ventana_latencias)
+        self._lock = threading.Lock()
+        self.consultas = 0
+        self.reintentos_realizados = 0
+        self.errores = 0
+
+    def revisar_cypher(self):
+        """Dispara la nueva elección de la consulta si pasó `revision_s` (en un hilo: no demora la consulta en curso)."""
+        if self.elegir_cypher is None:
+            return
+        with self._lock:
+            if self._revisando or time.monotonic() - self._revisado_en < self.revision_s:
+                return
+            self._revisando = True
+
+        def _tarea():
+            try:
+                self.cypher = self.elegir_cypher()
+            except Exception:
+                logger.warning("No se pudo revisar la consulta de recuperación; se mantiene la actual.", exc_info=True)
+            finally:
+                with self._lock:
+                    self._revisado_en = time.monotonic()
+                    self._revisando = False
+
+        threading.Thread(target=_tarea, name="kg-revision-consulta", daemon=True).start()
+
+    def consultar(self, keywords, tipo_usuario):
+        self.revisar_cypher()
+        params = parametros_recuperacion(keywords, tipo_usuario)
+        intento = 0
+        while True:
+            inicio = time.time()
+            try:
+                resultado = self.graph.query(self.cypher, params)
+                self._registrar(time.time() - inicio)
+                return resultado
+            except ERRORES_REINTENTABLES as e:
+                if intento >= self.reintentos:
+                    with self._lock:
+                        self.errores += 1
+                    raise
+                espera = self.backoff_s * (2 ** intento)
+                logger.warning(f"Consulta Neo4j falló ({type(e).__name__}); reintento {intento + 1}/{self.reintentos} en {espera:.2f}s")
+                with self._lock:
+                    self.reintentos_realizados += 1
+                time.sleep(espera)
+                intento += 1
+            except Exception:
+                with self._lock:
+                    self.errores += 1
+                raise
+
+    async def _driver_del_loop(self):
+        if self.driver_async is not None or self.fabrica_driver_async is None:
+            return self.driver_async
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            entrada = self._drivers_por_loop.get(loop)
+            if entrada is None:
+                driver = self.fabrica_driver_async()
+                if driver is None:
+                    return None
+                entrada = (driver, _cerrar_al_terminar_el_loop(driver))
+                self._drivers_por_loop[loop] = entrada
+                nuevo = True
+            else:
+                nuevo = False
+        if nuevo:
+            # el primer paso lo registra en el loop: al apagarse, el loop lo cierra y cierra el driver
+            await entrada[1].__anext__()
+        return entrada[0]
+
+    async def acerrar(self):
+        """Cierra el driver async del loop actual (si lo hay); la próxima consulta abre otro."""
+        with self._lock:
+            entrada = self._drivers_por_loop.pop(asyncio.get_running_loop(), None)
+        if entrada is not None:
+            await entrada[1].aclose()
+
+    async def aconsultar(self, keywords, tipo_usuario):
+        driver = await self._driver_del_loop()
+        if driver is None:
+            return await asyncio.get_running_loop().run_in_executor(None, self.consultar, keywords, tipo_usuario)
+        self.revisar_cypher()
+        params = parametros_recuperacion(keywords, tipo_usuario)
+        intento = 0
+        while True:
+            inicio = time.time()
+            try:
+                records, _, _ = await driver.execute_query(
+                    Query(self.cypher, timeout=self.timeout_s), parameters_=params,
+                    database_=getattr(self.graph, "_database", None))
+                self._registrar(time.time() - inicio)
+                return [r.data() for r in records]
+            except ERRORES_REINTENTABLES as e:
+                if intento >= self.reintentos:
+                    with self._lock:
+                        self.errores += 1
+                    raise
+                espera = self.backoff_s * (2 ** intento)
+                logger.warning(f"Consulta Neo4j async falló ({type(e).__name__}); reintento {intento + 1}/{self.reintentos} en {espera:.2f}s")
+                with self._lock:
+                    self.reintentos_realizados += 1
+                await asyncio.sleep(espera)
+                intento += 1
+            except Exception:
+                with self._lock:
+                    self.errores += 1
+                raise
+
+    def _registrar(self, duracion):
+        duracion_ms = duracion * 1000
+        with self._lock:
+            self.consultas += 1
+            self._latencias_ms.append(duracion_ms)
+        logger.info(f"Consulta de recuperación Neo4j en {duracion_ms:.1f}ms")
+
+    def estadisticas(self):
+        with self._lock:
+            latencias = np.array(self._latencias_ms)
+            stats = {
+                "consultas": self.consultas,
+                "reintentos": self.reintentos_realizados,
+                "errores": self.errores,
+                "consulta_indexada": self.cypher == CYPHER_RECUPERACION_INDEXADA,
+            }
+        if latencias.size:
+            p50, p95, p99 = np.percentile(latencias, [50, 95, 99])
+            stats.update({"p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99)})
+        return stats
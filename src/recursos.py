@@ -0,0 +1,84 @@
+import time
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _en_streamlit():
+    try:
+        from streamlit import runtime
+        return runtime.exists()
+    except Exception:
+        return False
+
+
+class RegistroRecursos:
+    """
+    Registro de modelos y conexiones que se cargan de forma diferida.
+
+    Cada recurso se carga la primera vez que se pide con `obtener` (una sola
+    vez aunque lo pidan varios hilos a la vez) y queda compartido por todo el
+    proceso. Dentro de Streamlit el cargador se envuelve con `st.cache_resource`,
+    así todas las sesiones comparten la misma instancia aunque el script se
+    recargue. `warmup` carga todo por adelantado (readiness probes).
+    """
+    def __init__(self):
+        self._cargadores = {}
+        self._instancias = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self.tiempos_carga_ms = {}
+
+    def registrar(self, nombre, cargador):
+        with self._lock:
+            self._cargadores[nombre] = cargador
+            self._locks[nombre] = threading.Lock()
+
+    def obtener(self, nombre):
+        try:
+            return self._instancias[nombre]
+        except KeyError:
+            pass
+        if nombre not in self._cargadores:
+            raise KeyError(f"Recurso no registrado: {nombre}")
+        with self._locks[nombre]:
+            if nombre not in self._instancias:
+                cargador = self._cargadores[nombre]
+                if _en_streamlit():
+                    import streamlit as st
+                    cargador = st.cache_resource(show_spinner=False)(cargador)
+                inicio = time.time()
+                instancia = cargador()
+                self.tiempos_carga_ms[nombre] = (time.time() - inicio) * 1000
+                logger.info(f"Recurso '{nombre}' cargado en {self.tiempos_carga_ms[nombre]:.1f}ms")
+                self._instancias[nombre] = instancia
+        return self._instancias[nombre]
+
+    def fijar(self, nombre, instancia):
+        """Reemplaza un recurso por una instancia ya construida (dobles locales en benchmarks/pruebas)."""
+        with self._lock:
+            if nombre not in self._cargadores:
+                self._cargadores[nombre] = lambda: instancia
+                self._locks[nombre] = threading.Lock()
+        with self._locks[nombre]:
+            self._instancias[nombre] = instancia
+            self.tiempos_carga_ms[nombre] = 0.0
+
+    def cargado(self, nombre):
+        return nombre in self._instancias
+
+    def warmup(self, nombres=None):
+        """Carga los recursos indicados (todos por defecto) y devuelve el tiempo de carga de cada uno."""
+        for nombre in (nombres or list(self._cargadores)):
+            self.obtener(nombre)
+        return dict(self.tiempos_carga_ms)
+
+    def estado(self):
+        return {
+            nombre: {"cargado": nombre in self._instancias, "carga_ms": self.tiempos_carga_ms.get(nombre)}
+            for nombre in self._cargadores
+        }
+
+    def listo(self):
+        return all(nombre in self._instancias for nombre in self._cargadores)
@@ -0,0 +1,156 @@
+"""
+Evaluador compacto del RandomForest de categorías.
+
+Convierte el RandomForestClassifier entrenado (mejor_modelo_RandomForest.joblib)
+en arreglos planos de NumPy con los nodos de todos los árboles concatenados:
+
+- feature:  feature de cada nodo interno (-1 en las hojas)
+- umbral:   umbral de cada nodo interno (float64, igual que scikit-learn)
+- izq, der: índices absolutos de los hijos; en una hoja `izq` es el índice
+            de su fila en `valores_hoja`
+- valores_hoja: probabilidades de clase normalizadas de cada hoja
+- raices:   índice del nodo raíz de cada árbol
+
+La predicción recorre todos los árboles a la vez (un paso por nivel de
+profundidad) y lee los valores directamente de la fila dispersa TF-IDF, sin
+el overhead por llamada y por árbol de `predict_proba`. El artefacto .npz es
+más chico que el pickle y se carga sin unpickling:
+
+    python src/rf_compacto.py src/mejor_modelo_RandomForest.joblib src/mejor_modelo_RandomForest.npz
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+_HOJA = -1
+
+
+class ForestCompacto:
+    """Reemplazo de `predict_proba`/`classes_` del RandomForestClassifier sobre arreglos planos."""
+    def __init__(self, feature, umbral, izq, der, valores_hoja, raices, classes_, n_features):
+        self.feature = feature
+        self.umbral = umbral
+        self.izq = izq
+        self.der = der
+        self.valores_hoja = valores_hoja
+        self.raices = raices
+        self.classes_ = classes_
+        self.n_features_in_ = int(n_features)
+
+    @classmethod
+    def desde_sklearn(cls, modelo):
+        features, umbrales, izqs, ders, valores, raices = [], [], [], [], [], []
+        desplazamiento = hojas = 0
+        for estimador in modelo.estimators_:
+            arbol = estimador.tree_
+            es_hoja = arbol.children_left == -1
+            n_hojas = int(es_hoja.sum())
+            # índice de cada hoja dentro de valores_hoja
+            indice_hoja = np.full(arbol.node_count, -1, dtype=np.int64)
+            indice_hoja[es_hoja] = hojas + np.arange(n_hojas)
+            features.append(np.where(es_hoja, _HOJA, arbol.feature))
+            umbrales.append(np.where(es_hoja, 0.0, arbol.threshold))
+            izqs.append(np.where(es_hoja, indice_hoja, arbol.children_left + desplazamiento))
+            ders.append(np.where(es_hoja, -1, arbol.children_right + desplazamiento))
+            # scikit-learn normaliza los conteos (o fracciones) de cada hoja para predict_proba
+            valor = arbol.value[es_hoja, 0, :]
+            normalizador = valor.sum(axis=1, keepdims=True)
+            normalizador[normalizador == 0] = 1.0
+            valores.append(valor / normalizador)
+            raices.append(desplazamiento)
+            desplazamiento += arbol.node_count
+            hojas += n_hojas
+        return cls(
+            feature=np.concatenate(features).astype(np.int32),
+            umbral=np.concatenate(umbrales).astype(np.float64),
+            izq=np.concatenate(izqs).astype(np.int32),
+            der=np.concatenate(ders).astype(np.int32),
+            valores_hoja=np.vstack(valores),
+            raices=np.asarray(raices, dtype=np.int64),
+            classes_=np.asarray(modelo.classes_),
+            n_features=modelo.n_features_in_,
+        )
+
+    def guardar(self, ruta):
+        np.savez_compressed(
+            ruta, feature=self.feature, umbral=self.umbral, izq=self.izq, der=self.der,
+            valores_hoja=self.valores_hoja, raices=self.raices,
+            classes_=self.classes_.astype(str), n_features=np.int64(self.n_features_in_))
+
+    @classmethod
+    def cargar(cls, ruta):
+        with np.load(ruta, allow_pickle=False) as datos:
+            return cls(**{nombre: datos[nombre] for nombre in datos.files})
+
+    def _lector(self, X):
+        """Devuelve f(filas, features) -> valores float32 de X (0 si la celda dispersa no está)."""
+        if hasattr(X, "tocsr"):
+            X = X.tocsr()
+            if not X.has_sorted_indices:
+                X = X.sorted_indices()
+            # clave global fila * n_features + columna: ordenada porque CSR está ordenado por fila y columna
+            claves = np.repeat(np.arange(X.shape[0], dtype=np.int64), np.diff(X.indptr)) * self.n_features_in_ + X.indices
+            datos = X.data.astype(np.float32)
+            if not claves.size:
+                return lambda filas, features: np.zeros(len(filas), dtype=np.float32)
+
+            def leer(filas, features):
+                consulta = filas * self.n_features_in_ + features
+                pos = np.minimum(np.searchsorted(claves, consulta), claves.size - 1)
+                return np.where(claves[pos] == consulta, datos[pos], np.float32(0))
+            return leer
+        X = np.asarray(X, dtype=np.float32)
+        return lambda filas, features: X[filas, features]
+
+    def predict_proba(self, X):
+        n_muestras = X.shape[0]
+        n_arboles = self.raices.size
+        leer = self._lector(X)
+        # un "cursor" por (muestra, árbol); se avanzan todos juntos nivel por nivel
+        nodos = np.tile(self.raices, n_muestras)
+        filas = np.repeat(np.arange(n_muestras, dtype=np.int64), n_arboles)
+        activos = np.flatnonzero(self.feature[nodos] != _HOJA)
+        while activos.size:
+            actuales = nodos[activos]
+            valores = leer(filas[activos], self.feature[actuales])
+            nodos[activos] = np.where(valores <= self.umbral[actuales], self.izq[actuales], self.der[actuales])
+            activos = activos[self.feature[nodos[activos]] != _HOJA]
+        proba = self.valores_hoja[self.izq[nodos]]
+        return proba.reshape(n_muestras, n_arboles, -1).mean(axis=1)
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+
+def convertir(ruta_joblib, ruta_npz):
+    import joblib
+    compacto = ForestCompacto.desde_sklearn(joblib.load(ruta_joblib))
+    compacto.guardar(ruta_npz)
+    return compacto
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 2:
+        print("Uso: python src/rf_compacto.py <modelo.joblib> <salida.npz>")
+        return 2
+    ruta_joblib, ruta_npz = argv
+    import joblib
+    inicio = time.perf_counter()
+    modelo = joblib.load(ruta_joblib)
+    carga_joblib = time.perf_counter() - inicio
+    compacto = ForestCompacto.desde_sklearn(modelo)
+    compacto.guardar(ruta_npz)
+    inicio = time.perf_counter()
+    ForestCompacto.cargar(ruta_npz)
+    carga_npz = time.perf_counter() - inicio
+    print(f"{len(modelo.estimators_)} árboles, {compacto.feature.size} nodos, {compacto.valores_hoja.shape[0]} hojas")
+    print(f"joblib: {os.path.getsize(ruta_joblib) / 1e6:.2f} MB, carga {carga_joblib * 1000:.1f} ms")
+    print(f"npz:    {os.path.getsize(ruta_npz) / 1e6:.2f} MB, carga {carga_npz * 1000:.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
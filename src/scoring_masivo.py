@@ -0,0 +1,233 @@
+"""
+Scoring masivo offline de tickets históricos (re-categorización tras reentrenar).
+
+Lee un JSONL o CSV de tickets en streaming, lo parte en lotes y ejecuta las
+etapas locales del pipeline en un pool de procesos: clasificación ML
+(TF-IDF + RandomForest), keywords (spaCy `nlp.pipe`), emoción (BETO en lote),
+confianza difusa y, opcionalmente, recuperación de candidatos (Cypher en vivo
+o snapshot en memoria). Cada worker carga los modelos una sola vez. Los
+resultados se escriben en orden a medida que terminan los lotes, con una
+cantidad acotada de lotes en vuelo: la memoria no depende del tamaño del archivo.
+
+La generación con LLM es opcional (--con-llm) y no se escribe nada en
+resultados_pruebas.json. Los workers no abren archivos de log: mandan sus
+registros por una cola al proceso principal, que los escribe con sus handlers.
+
+    python src/scoring_masivo.py tickets.jsonl salida.jsonl --workers 4 --recuperacion snapshot
+    python src/scoring_masivo.py tickets.csv salida.csv --campo-texto descripcion --recuperacion ninguna
+"""
+import os
+import sys
+import csv
+import json
+import time
+import logging
+import argparse
+import itertools
+import multiprocessing
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from logging.handlers import QueueListener
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+logger = logging.getLogger(__name__)
+
+MODOS_RECUPERACION = ("ninguna", "cypher", "snapshot")
+COLUMNAS = ("id", "tipo_usuario", "categoria_ml", "confianza_ml", "en_dominio", "keywords", "emocion",
+            "emocion_score", "confianza_fuzzy", "tipo_problema", "solucion", "matched_keywords",
+            "ruta_seleccion", "respuesta", "error")
+
+
+# --- Entrada y salida en streaming ---
+def _es_csv(ruta):
+    return ruta.lower().endswith(".csv")
+
+
+def leer_tickets(ruta, campo_texto="mensaje", campo_id="id", campo_rol="tipo_usuario", rol_default="Prestador"):
+    """Genera dicts {id, texto, tipo_usuario} leyendo el archivo de a una fila."""
+    with open(ruta, encoding="utf-8", newline="") as f:
+        filas = csv.DictReader(f) if _es_csv(ruta) else (json.loads(linea) for linea in f if linea.strip())
+        for n, fila in enumerate(filas, start=1):
+            texto = fila.get(campo_texto)
+            if not texto:
+                logger.warning(f"Fila {n} sin campo '{campo_texto}'; se omite.")
+                continue
+            yield {
+                "id": fila.get(campo_id) or n,
+                "texto": str(texto),
+                "tipo_usuario": fila.get(campo_rol) or rol_default,
+            }
+
+
+def en_lotes(iterable, tam_lote):
+    iterador = iter(iterable)
+    while True:
+        lote = list(itertools.islice(iterador, tam_lote))
+        if not lote:
+            return
+        yield lote
+
+
+class EscritorResultados:
+    """Escribe filas de resultado en JSONL o CSV (listas unidas con '|')."""
+    def __init__(self, ruta):
+        self._archivo = open(ruta, "w", encoding="utf-8", newline="")
+        self._csv = csv.DictWriter(self._archivo, fieldnames=COLUMNAS, extrasaction="ignore") if _es_csv(ruta) else None
+        if self._csv is not None:
+            self._csv.writeheader()
+
+    def escribir(self, filas):
+        for fila in filas:
+            if self._csv is None:
+                self._archivo.write(json.dumps(fila, ensure_ascii=False) + "\n")
+            else:
+                self._csv.writerow({k: "|".join(map(str, v)) if isinstance(v, list) else v for k, v in fila.items()})
+
+    def cerrar(self):
+        self._archivo.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.cerrar()
+
+
+def procesar_en_orden(ejecutor, funcion, lotes, max_en_vuelo, *args):
+    """
+    Envía los lotes al executor con a lo sumo `max_en_vuelo` pendientes y
+    devuelve sus resultados en el orden de entrada (el lote siguiente recién se
+    lee cuando se libera un lugar).
+    """
+    pendientes = deque()
+    for lote in lotes:
+        if len(pendientes) >= max_en_vuelo:
+            yield pendientes.popleft().result()
+        pendientes.append(ejecutor.submit(funcion, lote, *args))
+    while pendientes:
+        yield pendientes.popleft().result()
+
+
+# --- Funciones que corren en los workers ---
+def _inicializar_worker(recuperacion, hilos, cola_logs):
+    # Antes de importar el pipeline: el modo snapshot se lee al importar
+    os.environ["WEVENTLY_KG_SNAPSHOT"] = "1" if recuperacion == "snapshot" else "0"
+    if hilos:
+        os.environ.setdefault("WEVENTLY_EMOCION_HILOS", str(hilos))
+    import wevently_langchain as wl
+    # antes del warmup: si no, cada worker rotaría su propio pruebas_wevently.log
+    wl.configurar_logging(cola_logs)
+    nombres = list(wl.RECURSOS_LOCALES)
+    if recuperacion != "ninguna":
+        nombres.append("recuperador")
+    wl.warmup(nombres)
+
+
+def puntuar_lote(lote, recuperacion="ninguna", con_llm=False):
+    """Etapas locales del pipeline para un lote de tickets; devuelve una fila de resultado por ticket."""
+    import wevently_langchain as wl
+    textos = [t["texto"] for t in lote]
+    categorias = wl.clasificar_categoria_ml_batch(textos)
+    keywords_lote = wl.detect_keywords_batch(textos)
+    emociones = wl.detect_emotion_batch(textos)
+    filas = []
+    for ticket, (categoria_ml, confianza_ml), keywords, (emocion, emo_score) in zip(lote, categorias, keywords_lote, emociones):
+        fila = dict.fromkeys(COLUMNAS)
+        fila.update(id=ticket["id"], tipo_usuario=ticket["tipo_usuario"], categoria_ml=str(categoria_ml),
+                    confianza_ml=confianza_ml, keywords=keywords, emocion=emocion, emocion_score=emo_score,
+                    matched_keywords=[])
+        # Mismos criterios que el planificador: raíces de dominio, categoría ML y lemas de dominio
+        fila["en_dominio"] = bool(wl.AUTOMATA_DOMINIO.coincidencias_texto(ticket["texto"])
+                                  and categoria_ml != "NoRepresentaAlDominio"
+                                  and wl.AUTOMATA_DOMINIO.coincidencias(keywords))
+        fila["confianza_fuzzy"] = wl.fuzzy_problem_categorization(keywords)
+        if fila["en_dominio"] and recuperacion != "ninguna":
+            try:
+                _recuperar_y_seleccionar(wl, ticket, fila, con_llm)
+            except Exception as e:
+                logger.warning(f"Ticket {ticket['id']}: {e}", exc_info=True)
+                fila["error"] = str(e)
+        filas.append(fila)
+    return filas
+
+
+def _recuperar_y_seleccionar(wl, ticket, fila, con_llm):
+    result = wl.REGISTRO.obtener("recuperador").consultar(fila["keywords"], ticket["tipo_usuario"])
+    matched_keys, confianza_fuzzy, postdata = wl._resumir_resultados(result, fila["confianza_fuzzy"])
+    fila.update(matched_keywords=matched_keys, confianza_fuzzy=confianza_fuzzy)
+    if not result:
+        fila["ruta_seleccion"] = "sin_candidatos"
+        return
+    if con_llm:
+        plan = {"categoria_ml": fila["categoria_ml"], "confianza_ml": fila["confianza_ml"]}
+        tipo_problema, solucion, ruta, prompt_llm, respuesta, _ = wl._seleccionar_solucion(
+            ticket["texto"], ticket["tipo_usuario"], plan, result, fila["emocion"], fila["emocion_score"],
+            confianza_fuzzy, postdata)
+        if prompt_llm is not None:
+            respuesta = wl.REGISTRO.obtener("gateway_respuesta").invoke(
+                prompt_llm, plantilla=lambda: wl.respuesta_plantilla(ticket["tipo_usuario"], tipo_problema, solucion, postdata))
+        fila.update(tipo_problema=tipo_problema, solucion=solucion, ruta_seleccion=ruta, respuesta=respuesta)
+        return
+    # Sin LLM: ganador claro si lo hay; si no, el mejor rankeado queda marcado para revisión
+    seleccion = wl._seleccion_deterministica(result)
+    elegido = result[0] if seleccion is None else seleccion[2]
+    fila.update(tipo_problema=elegido.get("tipo_problema"), solucion=elegido.get("solucion"),
+                ruta_seleccion="deterministica" if seleccion is not None else "mejor_rankeado")
+
+
+# --- CLI ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scoring masivo offline de tickets históricos")
+    parser.add_argument("entrada", help="Archivo .jsonl o .csv de tickets")
+    parser.add_argument("salida", help="Archivo .jsonl o .csv de resultados")
+    parser.add_argument("--campo-texto", default="mensaje")
+    parser.add_argument("--campo-id", default="id")
+    parser.add_argument("--campo-rol", default="tipo_usuario")
+    parser.add_argument("--rol", default="Prestador", help="Rol cuando el ticket no trae uno")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--hilos-por-worker", type=int, default=1, help="Hilos de inferencia por worker (0: default de la librería)")
+    parser.add_argument("--tam-lote", type=int, default=128)
+    parser.add_argument("--lotes-en-vuelo", type=int, default=0, help="Máximo de lotes pendientes (default: 2 por worker)")
+    parser.add_argument("--recuperacion", default="ninguna", choices=MODOS_RECUPERACION)
+    parser.add_argument("--con-llm", action="store_true", help="Selecciona y redacta la respuesta con el LLM (requiere --recuperacion)")
+    parser.add_argument("--contexto-mp", default="fork" if sys.platform.startswith("linux") else "spawn")
+    args = parser.parse_args(argv)
+    if args.con_llm and args.recuperacion == "ninguna":
+        parser.error("--con-llm requiere --recuperacion cypher o snapshot")
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    max_en_vuelo = args.lotes_en_vuelo or 2 * args.workers
+    tickets = leer_tickets(args.entrada, args.campo_texto, args.campo_id, args.campo_rol, args.rol)
+    categorias = Counter()
+    total = 0
+    inicio = time.perf_counter()
+    contexto = multiprocessing.get_context(args.contexto_mp)
+    cola_logs = contexto.Queue()
+    # un único escritor: los registros de los workers pasan por los handlers de este proceso
+    listener_logs = QueueListener(cola_logs, *logging.getLogger().handlers, respect_handler_level=True)
+    listener_logs.start()
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=contexto, initializer=_inicializar_worker,
+                                 initargs=(args.recuperacion, args.hilos_por_worker, cola_logs)) as ejecutor, \
+                EscritorResultados(args.salida) as escritor:
+            resultados = procesar_en_orden(ejecutor, puntuar_lote, en_lotes(tickets, args.tam_lote), max_en_vuelo,
+                                           args.recuperacion, args.con_llm)
+            for n, filas in enumerate(resultados, start=1):
+                escritor.escribir(filas)
+                total += len(filas)
+                categorias.update(f["categoria_ml"] for f in filas)
+                if n % 10 == 0:
+                    transcurrido = time.perf_counter() - inicio
+                    logger.info(f"{total} tickets en {transcurrido:.1f}s ({total / transcurrido:.1f}/s)")
+    finally:
+        listener_logs.stop()
+    transcurrido = time.perf_counter() - inicio
+    logger.info(f"Listo: {total} tickets en {transcurrido:.1f}s ({total / max(transcurrido, 1e-9):.1f}/s) -> {args.salida}")
+    for categoria, n in categorias.most_common():
+        logger.info(f"  {categoria}: {n}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,247 @@
+import os
+import json
+import gzip
+import queue
+import shutil
+import atexit
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+FORMATOS = ("jsonl", "jsonl.gz", "parquet")
+
+# Columnas del formato Parquet; lo que no esté acá va serializado en "extra"
+COLUMNAS_PARQUET = (
+    "test_id", "entrada", "tipo_usuario", "categoria_predicha_ml", "confianza_ml", "keywords",
+    "emocion", "confianza_fuzzy", "tipo_problema", "solucion", "matched_keywords", "respuesta",
+    "plan", "ruta_seleccion", "tiempos", "extra",
+)
+COLUMNAS_NUMERICAS = ("confianza_ml", "confianza_fuzzy")
+
+
+class SinkResultados:
+    """
+    Escritor en segundo plano de los registros de resultados del pipeline.
+
+    `registrar` sólo encola (nunca escribe en el hilo del request). Un hilo
+    dedicado agrupa los registros y escribe al juntar `tam_lote` o al vencer
+    `intervalo_s` (con 0, escribe cada registro apenas llega). El archivo se rota al superar `max_bytes` (los rotados en
+    JSONL se comprimen con gzip). La cola es acotada: con la política
+    "descartar" un registro que no entra se cuenta como descartado; con
+    "bloquear" se espera hasta `timeout_bloqueo_s` antes de descartarlo.
+    """
+    def __init__(self, ruta=None, formato=None, max_cola=None, tam_lote=None, intervalo_s=None,
+                 max_bytes=None, backups=None, politica=None, timeout_bloqueo_s=0.05):
+        self.formato = formato or os.getenv("WEVENTLY_RESULTADOS_FORMATO", "jsonl")
+        if self.formato not in FORMATOS:
+            raise ValueError(f"Formato de resultados no soportado: {self.formato} (usar {', '.join(FORMATOS)})")
+        if self.formato == "parquet":
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError as e:
+                raise ImportError("El formato parquet requiere el paquete opcional 'pyarrow'.") from e
+        ruta_default = {"jsonl": "resultados_pruebas.json", "jsonl.gz": "resultados_pruebas.jsonl.gz",
+                        "parquet": "resultados_pruebas.parquet"}[self.formato]
+        self.ruta = ruta or os.getenv("WEVENTLY_RESULTADOS_RUTA", ruta_default)
+        self.tam_lote = int(os.getenv("WEVENTLY_SINK_LOTE", "200")) if tam_lote is None else tam_lote
+        self.intervalo_s = float(os.getenv("WEVENTLY_SINK_INTERVALO", "1.0")) if intervalo_s is None else intervalo_s
+        self.max_bytes = int(os.getenv("WEVENTLY_RESULTADOS_MAX_BYTES", str(50 * 1024 * 1024))) if max_bytes is None else max_bytes
+        self.backups = int(os.getenv("WEVENTLY_RESULTADOS_BACKUPS", "5")) if backups is None else backups
+        self.politica = politica or os.getenv("WEVENTLY_SINK_POLITICA", "descartar")
+        self.timeout_bloqueo_s = timeout_bloqueo_s
+        max_cola = int(os.getenv("WEVENTLY_SINK_MAX_COLA", "10000")) if max_cola is None else max_cola
+        # maxsize=0 sería una cola sin límite: se perdería la contrapresión
+        if max_cola < 1:
+            raise ValueError(f"max_cola debe ser al menos 1 (recibido {max_cola})")
+        if self.intervalo_s < 0:
+            raise ValueError(f"intervalo_s no puede ser negativo (recibido {self.intervalo_s})")
+        self._cola = queue.Queue(maxsize=max_cola)
+        self._writer_parquet = None
+        self._cerrado = False
+        self.encolados = 0
+        self.escritos = 0
+        self.descartados = 0
+        self.lotes = 0
+        self.rotaciones = 0
+        self.errores = 0
+        self._hilo = threading.Thread(target=self._loop, name="sink-resultados", daemon=True)
+        self._hilo.start()
+        atexit.register(self.cerrar)
+
+    # --- API ---
+    def registrar(self, registro):
+        if self._cerrado:
+            self.descartados += 1
+            return False
+        try:
+            if self.politica == "bloquear":
+                self._cola.put(registro, timeout=self.timeout_bloqueo_s)
+            else:
+                self._cola.put_nowait(registro)
+        except queue.Full:
+            self.descartados += 1
+            return False
+        self.encolados += 1
+        return True
+
+    def cerrar(self, timeout=5):
+        if self._cerrado:
+            return
+        self._cerrado = True
+        self._cola.put(None)
+        self._hilo.join(timeout)
+
+    def estadisticas(self):
+        return {
+            "encolados": self.encolados,
+            "escritos": self.escritos,
+            "descartados": self.descartados,
+            "pendientes": self._cola.qsize(),
+            "lotes": self.lotes,
+            "rotaciones": self.rotaciones,
+            "errores": self.errores,
+        }
+
+    # --- Hilo escritor ---
+    def _loop(self):
+        lote = []
+        limite = time.monotonic() + self.intervalo_s
+        while True:
+            if self.intervalo_s == 0:
+                # sin intervalo: get bloqueante y un lote por registro (un get con timeout 0 giraría en vacío)
+                registro = self._cola.get()
+            else:
+                try:
+                    registro = self._cola.get(timeout=max(0.0, limite - time.monotonic()))
+                except queue.Empty:
+                    registro = False
+            if registro is None:
+                self._vaciar(lote)
+                self._cerrar_parquet()
+                return
+            if registro is not False:
+                lote.append(registro)
+            if self.intervalo_s == 0 or len(lote) >= self.tam_lote or time.monotonic() >= limite:
+                self._vaciar(lote)
+                lote = []
+                limite = time.monotonic() + self.intervalo_s
+
+    def _vaciar(self, lote):
+        if not lote:
+            return
+        try:
+            if self.formato == "parquet":
+                self._escribir_parquet(lote)
+            else:
+                self._escribir_jsonl(lote)
+            self.escritos += len(lote)
+            self.lotes += 1
+            self._rotar_si_corresponde()
+        except Exception:
+            self.errores += 1
+            logger.error(f"No se pudo escribir un lote de {len(lote)} resultados en {self.ruta}", exc_info=True)
+
+    def _escribir_jsonl(self, lote):
+        datos = "".join(json.dumps(r) + "\n" for r in lote)
+        if self.formato == "jsonl.gz":
+            # cada lote agrega un miembro gzip; el archivo sigue siendo un gzip válido
+            with gzip.open(self.ruta, "at", encoding="utf-8") as f:
+                f.write(datos)
+        else:
+            with open(self.ruta, "a") as f:
+                f.write(datos)
+
+    def _escribir_parquet(self, lote):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        columnas = {c: [] for c in COLUMNAS_PARQUET}
+        for registro in lote:
+            extra = {k: v for k, v in registro.items() if k not in COLUMNAS_PARQUET}
+            for c in COLUMNAS_PARQUET:
+                valor = extra if c == "extra" else registro.get(c)
+                if c in COLUMNAS_NUMERICAS:
+                    columnas[c].append(None if valor is None else float(valor))
+                elif valor is None or isinstance(valor, str):
+                    columnas[c].append(valor)
+                else:
+                    columnas[c].append(json.dumps(valor))
+        esquema = pa.schema([(c, pa.float64() if c in COLUMNAS_NUMERICAS else pa.string()) for c in COLUMNAS_PARQUET])
+        tabla = pa.Table.from_pydict(columnas, schema=esquema)
+        if self._writer_parquet is None:
+            self._writer_parquet = pq.ParquetWriter(self.ruta, esquema, compression="zstd")
+        self._writer_parquet.write_table(tabla)
+
+    def _cerrar_parquet(self):
+        if self._writer_parquet is not None:
+            self._writer_parquet.close()
+            self._writer_parquet = None
+
+    # --- Rotación ---
+    def _rotar_si_corresponde(self):
+        if not os.path.exists(self.ruta) or os.path.getsize(self.ruta) < self.max_bytes:
+            return
+        self._cerrar_parquet()
+        sufijo = ".gz" if self.formato == "jsonl" else ""
+        for i in range(self.backups - 1, 0, -1):
+            origen = f"{self.ruta}.{i}{sufijo}"
+            if os.path.exists(origen):
+                os.replace(origen, f"{self.ruta}.{i + 1}{sufijo}")
+        if self.backups <= 0:
+            os.remove(self.ruta)
+        elif self.formato == "jsonl":
+            with open(self.ruta, "rb") as f_in, gzip.open(f"{self.ruta}.1.gz", "wb") as f_out:
+                shutil.copyfileobj(f_in, f_out)
+            os.remove(self.ruta)
+        else:
+            os.replace(self.ruta, f"{self.ruta}.1")
+        self.rotaciones += 1
+
+
+class SinkCola:
+    """
+    Sink de un worker de un pool de procesos: manda cada registro al proceso
+    padre por una cola multiprocessing. Un solo SinkResultados (el del padre,
+    vía ReceptorResultados) escribe y rota el archivo; varios procesos rotando
+    el mismo archivo se pisan los lotes.
+    """
+    def __init__(self, cola):
+        self._cola = cola
+        self.encolados = 0
+        self.descartados = 0
+
+    def registrar(self, registro):
+        try:
+            self._cola.put_nowait(registro)
+        except queue.Full:
+            self.descartados += 1
+            return False
+        self.encolados += 1
+        return True
+
+    def cerrar(self, timeout=5):
+        pass
+
+    def estadisticas(self):
+        return {"encolados": self.encolados, "descartados": self.descartados}
+
+
+class ReceptorResultados:
+    """Hilo del proceso padre que pasa al sink los registros que mandan los workers (SinkCola)."""
+    def __init__(self, cola, sink):
+        self._cola = cola
+        self.sink = sink
+        self._hilo = threading.Thread(target=self._loop, name="receptor-resultados", daemon=True)
+        self._hilo.start()
+
+    def _loop(self):
+        while True:
+            registro = self._cola.get()
+            if registro is None:
+                return
+            self.sink.registrar(registro)
+
+    def cerrar(self, timeout=5):
+        self._cola.put(None)
+        self._hilo.join(timeout)
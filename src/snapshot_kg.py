@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Consultas de carga del snapshot. Se traen sólo los nodos y relaciones que usa
+# la consulta de recuperación (PalabraClave -DISPARA-> CategoriaProblema
+# -AGRUPA-> TipoProblema -RESUELTO_POR-> Solucion, y CategoriaProblema -TIENE_UN-> TipoUsuario).
+CYPHER_SNAPSHOT_DISPARA = """
+    MATCH (k:PalabraClave)-[:DISPARA]->(c:CategoriaProblema)
+    RETURN k.nombre AS palabra, elementId(c) AS categoria
+    """
+CYPHER_SNAPSHOT_CATEGORIAS = """
+    MATCH (c:CategoriaProblema)
+    OPTIONAL MATCH (c)-[:AGRUPA]->(t:TipoProblema)-[:RESUELTO_POR]->(s:Solucion)
+    RETURN elementId(c) AS categoria,
+           coalesce(c.confianzaDecision, 0) AS confianza,
+           collect([t.nombre, s.accion]) AS soluciones
+    """
+CYPHER_SNAPSHOT_TIPOS_USUARIO = """
+    MATCH (c:CategoriaProblema)-[:TIENE_UN]->(tu:TipoUsuario)
+    RETURN elementId(c) AS categoria, collect(DISTINCT tu.nombre) AS tipos_usuario
+    """
+
+
+def huella_contenido(filas_dispara, filas_categorias, filas_tipos):
+    """
+    Checksum del contenido cargado (keywords, confianzas, acciones, tipos de
+    usuario), independiente del orden en que Neo4j devuelve filas y colecciones.
+    Detecta ediciones que no cambian ningún conteo (p. ej. el texto de una acción).
+    """
+    def _canonica(filas):
+        return sorted(json.dumps({k: sorted(v, key=str) if isinstance(v, list) else v for k, v in dict(f).items()},
+                                 sort_keys=True, default=str, ensure_ascii=False) for f in filas)
+    contenido = json.dumps([_canonica(filas_dispara), _canonica(filas_categorias), _canonica(filas_tipos)])
+    return hashlib.sha1(contenido.encode("utf-8")).hexdigest()
+
+
+class SnapshotConocimiento:
+    """
+    Copia en memoria del subgrafo de recuperación con índice invertido
+    palabra clave (en minúsculas) -> categorías.
+
+    `consultar` devuelve el mismo conjunto ordenado que CYPHER_RECUPERACION
+    (has_type, matched_count, confianza). El snapshot se recarga siempre que
+    vence el TTL; su `version` es la huella del contenido y los observadores
+    (p. ej. la caché de respuestas) sólo se notifican cuando cambia. Mientras
+    está vencido o sin cargar, `vigente` es False y el llamador debe usar Neo4j en vivo.
+    """
+    def __init__(self, graph, ttl_s=None):
+        self.graph = graph
+        self.ttl_s = float(os.getenv("WEVENTLY_KG_SNAPSHOT_TTL", "300")) if ttl_s is None else ttl_s
+        self._lock = threading.Lock()
+        self._refrescando = False
+        self.indice = {}
+        self.categorias = {}
+        self.version = None
+        self.cargado_en = None
+        self.observadores = []
+
+    # --- Carga ---
+    def cargar(self):
+        inicio = time.time()
+        filas_dispara = self.graph.query(CYPHER_SNAPSHOT_DISPARA)
+        filas_categorias = self.graph.query(CYPHER_SNAPSHOT_CATEGORIAS)
+        filas_tipos = self.graph.query(CYPHER_SNAPSHOT_TIPOS_USUARIO)
+        self.cargar_desde_filas(filas_dispara, filas_categorias, filas_tipos)
+        logger.info(f"Snapshot KG cargado: {len(self.indice)} keywords, {len(self.categorias)} categorías en {(time.time() - inicio) * 1000:.1f}ms")
+
+    def cargar_desde_filas(self, filas_dispara, filas_categorias, filas_tipos):
+        version = huella_contenido(filas_dispara, filas_categorias, filas_tipos)
+        categorias = {}
+        for fila in filas_categorias:
+            soluciones = []
+            for tipo, accion in fila["soluciones"]:
+                if (tipo, accion) not in soluciones:
+                    soluciones.append((tipo, accion))
+            categorias[fila["categoria"]] = {
+                "confianza": fila["confianza"],
+                # Sin solución el OPTIONAL MATCH original aporta una fila con nulos
+                "soluciones": tuple(soluciones) or ((None, None),),
+                "tipos_usuario": frozenset(),
+            }
+        for fila in filas_tipos:
+            if fila["categoria"] in categorias:
+                categorias[fila["categoria"]]["tipos_usuario"] = frozenset(fila["tipos_usuario"])
+        indice = {}
+        for fila in filas_dispara:
+            if fila["palabra"] is None or fila["categoria"] not in categorias:
+                continue
+            entradas = indice.setdefault(fila["palabra"].lower(), [])
+            if (fila["palabra"], fila["categoria"]) not in entradas:
+                entradas.append((fila["palabra"], fila["categoria"]))
+        with self._lock:
+            version_anterior = self.version
+            self.categorias = categorias
+            self.indice = {kw: tuple(entradas) for kw, entradas in indice.items()}
+            self.version = version
+            self.cargado_en = time.time()
+        if version_anterior is not None and version_anterior != version:
+            for observador in list(self.observadores):
+                observador(version)
+
+    # --- Vigencia ---
+    @property
+    def vigente(self):
+        return self.cargado_en is not None and (time.time() - self.cargado_en) < self.ttl_s
+
+    def verificar(self):
+        """
+        Revalida el snapshot vencido recargándolo completo: un conteo de nodos o
+        relaciones no ve ediciones de contenido. Si la huella no cambió, los
+        observadores no se enteran.
+        """
+        self.cargar()
+
+    def refrescar_en_segundo_plano(self):
+        with self._lock:
+            if self._refrescando:
+                return
+            self._refrescando = True
+
+        def _tarea():
+            try:
+                self.verificar()
+            except Exception:
+                logger.warning("No se pudo refrescar el snapshot KG; se sigue usando Neo4j en vivo.", exc_info=True)
+            finally:
+                self._refrescando = False
+
+        threading.Thread(target=_tarea, name="snapshot-kg-refresh", daemon=True).start()
+
+    # --- Consulta ---
+    def consultar(self, keywords, tipo_usuario):
+        with self._lock:
+            indice, categorias = self.indice, self.categorias
+        # categoría -> nombres de keywords en orden de aparición (collect DISTINCT)
+        matched_por_categoria = {}
+        for kw in keywords:
+            for nombre, categoria in indice.get(kw.lower(), ()):
+                nombres = matched_por_categoria.setdefault(categoria, [])
+                if nombre not in nombres:
+                    nombres.append(nombre)
+        filas = []
+        vistas = set()
+        for categoria, nombres in matched_por_categoria.items():
+            datos = categorias[categoria]
+            has_type = 1 if tipo_usuario in datos["tipos_usuario"] else 0
+            for tipo, accion in datos["soluciones"]:
+                clave = (tipo, accion, datos["confianza"], tuple(nombres), has_type)
+                if clave in vistas:
+                    continue
+                vistas.add(clave)
+                filas.append({
+                    "tipo_problema": tipo,
+                    "solucion": accion,
+                    "confianza": datos["confianza"],
+                    "matched_count": len(nombres),
+                    "matched_keywords": list(nombres),
+                    "has_type": has_type,
+                })
+        filas.sort(key=lambda r: (-r["has_type"], -r["matched_count"], -r["confianza"]))
+        return filas
+
+
+class RecuperadorConSnapshot:
+    """
+    Responde desde el snapshot cuando está vigente y cae a Neo4j en vivo
+    (RecuperadorCypher) cuando está vencido, disparando el refresco en segundo plano.
+    Si Neo4j en vivo falla y hay un snapshot cargado, se sirve el snapshot vencido.
+    """
+    def __init__(self, snapshot, recuperador_vivo):
+        self.snapshot = snapshot
+        self.recuperador_vivo = recuperador_vivo
+        self.respuestas_snapshot = 0
+        self.respuestas_vivo = 0
+
+    def consultar(self, keywords, tipo_usuario):
+        if self.snapshot.vigente:
+            self.respuestas_snapshot += 1
+            return self.snapshot.consultar(keywords, tipo_usuario)
+        self.snapshot.refrescar_en_segundo_plano()
+        try:
+            resultado = self.recuperador_vivo.consultar(keywords, tipo_usuario)
+        except Exception:
+            if self.snapshot.cargado_en is None:
+                raise
+            logger.warning("Neo4j no disponible; se responde desde el snapshot vencido.", exc_info=True)
+            self.respuestas_snapshot += 1
+            return self.snapshot.consultar(keywords, tipo_usuario)
+        self.respuestas_vivo += 1
+        return resultado
+
+    async def aconsultar(self, keywords, tipo_usuario):
+        if self.snapshot.vigente:
+            self.respuestas_snapshot += 1
+            return self.snapshot.consultar(keywords, tipo_usuario)
+        self.snapshot.refrescar_en_segundo_plano()
+        try:
+            resultado = await self.recuperador_vivo.aconsultar(keywords, tipo_usuario)
+        except Exception:
+            if self.snapshot.cargado_en is None:
+                raise
+            logger.warning("Neo4j no disponible; se responde desde el snapshot vencido.", exc_info=True)
+            self.respuestas_snapshot += 1
+            return self.snapshot.consultar(keywords, tipo_usuario)
+        self.respuestas_vivo += 1
+        return resultado
+
+    def estadisticas(self):
+        stats = self.recuperador_vivo.estadisticas()
+        stats.update({
+            "respuestas_snapshot": self.respuestas_snapshot,
+            "respuestas_vivo": self.respuestas_vivo,
+            "snapshot_version": self.snapshot.version,
+            "snapshot_vigente": self.snapshot.vigente,
+        })
+        return stats
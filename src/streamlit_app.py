@@ -1,16 +1,36 @@
 import os
 import sys
 import datetime
-import re
 from dotenv import load_dotenv
 load_dotenv()
 sys.path.append(os.path.dirname(__file__))
 import streamlit as st
-from wevently_langchain import generar_respuesta_streamlit
+from historial_chat import HistorialChat, LimpiadorHTMLIncremental, strip_html_tags
+
+# Con WEVENTLY_API_URL la app es un cliente liviano de api_asistente.py y no carga modelos
+API_URL = os.getenv("WEVENTLY_API_URL", "")
+if API_URL:
+    from cliente_api import consultar_api, ErrorAPI
+else:
+    from wevently_langchain import generar_respuesta_stream, configurar_logging, warmup, RECURSOS_LOCALES
 
 st.set_page_config(page_title="Wevently Chatbot", page_icon=":robot_face:", layout="wide")
 st.title("Asistente Inteligente de Wevently")
 
+if not API_URL:
+    configurar_logging()
+
+    @st.cache_resource(show_spinner="Cargando modelos...")
+    def precargar_modelos():
+        # Modelos locales compartidos por todas las sesiones; Neo4j y el LLM se conectan en el primer uso
+        return warmup(RECURSOS_LOCALES)
+
+    precargar_modelos()
+
+# Historial acotado y ventana de mensajes visibles (se amplía con "Ver mensajes anteriores")
+MAX_MENSAJES = int(os.getenv("WEVENTLY_CHAT_MAX_MENSAJES", "200"))
+VENTANA_MENSAJES = int(os.getenv("WEVENTLY_CHAT_VENTANA", "20"))
+
 def save_chat_to_localstorage(chat_history):
     st.session_state['last_saved'] = datetime.datetime.now()
     st.session_state['chat_history_saved'] = chat_history
@@ -22,14 +42,18 @@ def get_chat_from_localstorage():
             return st.session_state.get('chat_history_saved', [])
     return []
 
-def strip_html_tags(text):
-    return re.sub(r'<[^>]+>', '', text)
+def nuevo_historial(mensajes=()):
+    if isinstance(mensajes, HistorialChat):
+        return mensajes
+    return HistorialChat(MAX_MENSAJES, mensajes)
 
 # Inicializa historial y variable de rol actual
 if 'chat_history' not in st.session_state:
-    st.session_state['chat_history'] = get_chat_from_localstorage()
+    st.session_state['chat_history'] = nuevo_historial(get_chat_from_localstorage())
 if 'current_rol' not in st.session_state:
     st.session_state['current_rol'] = None
+if 'mensajes_visibles' not in st.session_state:
+    st.session_state['mensajes_visibles'] = VENTANA_MENSAJES
 
 # CSS para layout tipo mensajería
 st.markdown("""
@@ -82,35 +106,22 @@ st.markdown("""
 # --- Selector de rol arriba, borra chat al cambiar ---
 rol = st.selectbox("Selecciona tu rol:", ["Organizador", "Prestador", "Propietario"], key="rol")
 if rol != st.session_state['current_rol']:
-    st.session_state['chat_history'] = []
+    st.session_state['chat_history'] = nuevo_historial()
+    st.session_state['mensajes_visibles'] = VENTANA_MENSAJES
     st.session_state['current_rol'] = rol
     st.rerun()
 
 # ---- Chat scrolleable central ----
 st.markdown("#### Chat")
-chat_html = '<div class="chat-container-main">'
-for msg in st.session_state.chat_history:
-    # Sanitiza para evitar render HTML accidental y muestra sólo texto plano
-    user_text = strip_html_tags(str(msg['mensaje']))
-    assistant_text = strip_html_tags(str(msg['respuesta']))
-    chat_html += f"""
-    <div class='chat-row right'>
-        <div class='bubble-user'>
-            {user_text}
-            <div class='meta-info' style='text-align:right;'>{msg['hora']} | {msg['usuario']}</div>
-        </div>
-    </div>
-    <div class='chat-row left'>
-        <div class='bubble-assistant'>
-            {assistant_text}
-            <div class='meta-info'>
-                {msg['hora']} | Asistente<br>
-                <span style='font-size:9.5px'>KW: {', '.join(msg['keywords'])} — Emo: {msg['emocion']} — Confianza: {msg['confianza']:.2f}</span>
-            </div>
-        </div>
-    </div>
-    """
-chat_html += '</div>'
+historial = st.session_state.chat_history
+if len(historial) > st.session_state['mensajes_visibles']:
+    if st.button(f"Ver mensajes anteriores ({len(historial) - st.session_state['mensajes_visibles']})"):
+        st.session_state['mensajes_visibles'] += VENTANA_MENSAJES
+        st.rerun()
+# Cada burbuja se sanitiza una sola vez al agregarse; acá sólo se concatena la ventana visible
+chat_html = ('<div class="chat-container-main">'
+             + historial.html_ventana(st.session_state['mensajes_visibles'])
+             + '</div>')
 st.markdown(chat_html, unsafe_allow_html=True)
 
 # ---- Input y botón enviar al pie ----
@@ -123,9 +134,31 @@ with st.container():
 
 if enviar and mensaje:
     mensaje_clean = strip_html_tags(mensaje)
-    response, kwds, emo, conf = generar_respuesta_streamlit(mensaje_clean, tipo_usuario=rol, debug=True)
+    if API_URL:
+        try:
+            with st.spinner("Consultando al asistente..."):
+                response, kwds, emo, conf = consultar_api(API_URL, mensaje_clean, rol)
+        except ErrorAPI as e:
+            st.error(str(e))
+            st.stop()
+    else:
+        # Burbuja provisoria que se completa a medida que llegan los tokens del LLM
+        burbuja = st.empty()
+        limpiador = LimpiadorHTMLIncremental()
+        texto_parcial = ''
+        stream = generar_respuesta_stream(mensaje_clean, tipo_usuario=rol, debug=True)
+        for fragmento in stream:
+            texto_parcial += limpiador.feed(fragmento)
+            burbuja.markdown(
+                f"<div class='chat-row left'><div class='bubble-assistant'>{texto_parcial}▌</div></div>",
+                unsafe_allow_html=True)
+        # lo retenido tras un '<' sin cerrar se muestra al terminar el stream
+        texto_parcial += limpiador.flush()
+        burbuja.markdown(f"<div class='chat-row left'><div class='bubble-assistant'>{texto_parcial}</div></div>",
+                         unsafe_allow_html=True)
+        response, kwds, emo, conf = stream.resultado
     response_clean = strip_html_tags(response)
-    st.session_state.chat_history.append({
+    st.session_state.chat_history.agregar({
         'usuario': rol,
         'mensaje': mensaje_clean,
         'respuesta': response_clean,
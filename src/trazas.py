@@ -0,0 +1,328 @@
+import os
+import time
+import threading
+import logging
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+logger = logging.getLogger(__name__)
+
+# Límites (segundos) de los histogramas de latencia por etapa
+BUCKETS_LATENCIA = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+METRICA_ETAPAS = "wevently_etapa_duracion_segundos"
+METRICA_SOLICITUDES = "wevently_solicitudes_total"
+METRICA_RECHAZOS = "wevently_planificador_rechazos_total"
+METRICA_API = "wevently_api_respuestas_total"
+METRICA_LLM_EVENTOS = "wevently_llm_eventos_total"
+METRICA_LLM_CIRCUITO = "wevently_llm_circuito_estado"
+METRICA_MEMORIA_WORKER = "wevently_worker_memoria_bytes"
+METRICA_NIVEL_SERVICIO = "wevently_nivel_servicio"
+AYUDA = {
+    METRICA_ETAPAS: "Duración de cada etapa del pipeline (reloj monotónico).",
+    METRICA_SOLICITUDES: "Consultas completadas por ruta de respuesta.",
+    METRICA_RECHAZOS: "Mensajes descartados por el planificador según el nivel que los rechazó.",
+    METRICA_API: "Respuestas de la API por estado (ok, saturado, timeout, error).",
+    METRICA_LLM_EVENTOS: "Eventos del gateway LLM (exito, fallo, plazo_vencido, hedge_enviado, hedge_ganador, circuito_abierto, respaldo, plantilla).",
+    METRICA_LLM_CIRCUITO: "Estado del circuit breaker del LLM (0 cerrado, 1 semiabierto, 2 abierto).",
+    METRICA_MEMORIA_WORKER: "Memoria de cada worker de la API por tipo (unica, compartida, pss).",
+    METRICA_NIVEL_SERVICIO: "Nivel de degradación actual (0 completo, 1 sin_emocion, 2 sin_seleccion_llm, 3 plantilla).",
+}
+
+
+class Histograma:
+    def __init__(self, buckets=BUCKETS_LATENCIA):
+        self.buckets = tuple(buckets)
+        self.conteos = [0] * len(self.buckets)
+        self.suma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        for i, limite in enumerate(self.buckets):
+            if valor <= limite:
+                self.conteos[i] += 1
+                break
+        self.suma += valor
+        self.total += 1
+
+    def acumulados(self):
+        """Conteos acumulados por límite, como los espera Prometheus (incluye +Inf)."""
+        acumulado, filas = 0, []
+        for limite, conteo in zip(self.buckets, self.conteos):
+            acumulado += conteo
+            filas.append((limite, acumulado))
+        filas.append((float("inf"), self.total))
+        return filas
+
+    def percentil(self, q):
+        """Estimación del percentil q (0-100) interpolando dentro del bucket."""
+        if not self.total:
+            return None
+        objetivo = self.total * q / 100
+        anterior_limite, anterior_acumulado = 0.0, 0
+        for limite, acumulado in self.acumulados():
+            if acumulado >= objetivo:
+                if limite == float("inf"):
+                    return anterior_limite
+                dentro = acumulado - anterior_acumulado
+                fraccion = (objetivo - anterior_acumulado) / dentro if dentro else 1.0
+                return anterior_limite + (limite - anterior_limite) * fraccion
+            anterior_limite, anterior_acumulado = limite, acumulado
+        return anterior_limite
+
+
+class RegistroMetricas:
+    """Histogramas, contadores y gauges en memoria del proceso, exportables en formato de texto de Prometheus."""
+    def __init__(self):
+        self._histogramas = {}
+        self._contadores = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _clave(nombre, etiquetas):
+        return nombre, tuple(sorted(etiquetas.items()))
+
+    def observar(self, nombre, valor, **etiquetas):
+        clave = self._clave(nombre, etiquetas)
+        with self._lock:
+            histograma = self._histogramas.get(clave)
+            if histograma is None:
+                histograma = self._histogramas[clave] = Histograma()
+            histograma.observar(valor)
+
+    def contar(self, nombre, incremento=1, **etiquetas):
+        clave = self._clave(nombre, etiquetas)
+        with self._lock:
+            self._contadores[clave] = self._contadores.get(clave, 0) + incremento
+
+    def fijar(self, nombre, valor, **etiquetas):
+        clave = self._clave(nombre, etiquetas)
+        with self._lock:
+            self._gauges[clave] = valor
+
+    def resumen(self, nombre=METRICA_ETAPAS, etiqueta="etapa"):
+        """{valor de la etiqueta: {conteo, media_ms, p50_ms, p95_ms, p99_ms}} de un histograma."""
+        with self._lock:
+            histogramas = {dict(etq).get(etiqueta): h for (n, etq), h in self._histogramas.items() if n == nombre}
+            salida = {}
+            for valor, h in histogramas.items():
+                salida[valor] = {"conteo": h.total, "media_ms": h.suma / h.total * 1000 if h.total else None}
+                for q in (50, 95, 99):
+                    p = h.percentil(q)
+                    salida[valor][f"p{q}_ms"] = None if p is None else p * 1000
+            return salida
+
+    def exportar_prometheus(self):
+        lineas = []
+        with self._lock:
+            histogramas = sorted(self._histogramas.items())
+            contadores = sorted(self._contadores.items())
+            gauges = sorted(self._gauges.items())
+        vistos = set()
+        for (nombre, etiquetas), h in histogramas:
+            if nombre not in vistos:
+                vistos.add(nombre)
+                lineas.append(f"# HELP {nombre} {AYUDA.get(nombre, nombre)}")
+                lineas.append(f"# TYPE {nombre} histogram")
+            for limite, acumulado in h.acumulados():
+                le = "+Inf" if limite == float("inf") else repr(limite)
+                lineas.append(f"{nombre}_bucket{_etiquetas(etiquetas + (('le', le),))} {acumulado}")
+            lineas.append(f"{nombre}_sum{_etiquetas(etiquetas)} {h.suma!r}")
+            lineas.append(f"{nombre}_count{_etiquetas(etiquetas)} {h.total}")
+        for tipo, filas in (("counter", contadores), ("gauge", gauges)):
+            for (nombre, etiquetas), valor in filas:
+                if nombre not in vistos:
+                    vistos.add(nombre)
+                    lineas.append(f"# HELP {nombre} {AYUDA.get(nombre, nombre)}")
+                    lineas.append(f"# TYPE {nombre} {tipo}")
+                lineas.append(f"{nombre}{_etiquetas(etiquetas)} {valor}")
+        return "\n".join(lineas) + "\n"
+
+
+def _etiquetas(pares):
+    if not pares:
+        return ""
+    escapar = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{escapar(v)}"' for k, v in pares) + "}"
+
+
+METRICAS = RegistroMetricas()
+
+
+# --- Trazas por consulta ---
+class Span:
+    def __init__(self, etapa, trace_id=None):
+        self.etapa = etapa
+        self.trace_id = trace_id
+        self.inicio = time.perf_counter()
+        self.duracion_s = None
+
+    def cerrar(self):
+        self.duracion_s = time.perf_counter() - self.inicio
+        return self.duracion_s
+
+
+class Traza:
+    """Spans de una consulta; el trace id es el test_id del pipeline."""
+    def __init__(self, trace_id):
+        self.trace_id = trace_id
+        self.inicio = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def agregar(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def duracion_s(self, etapa):
+        """Suma de las duraciones de los spans cerrados de la etapa (0 si no corrió)."""
+        with self._lock:
+            return sum(s.duracion_s for s in self.spans if s.etapa == etapa and s.duracion_s is not None)
+
+    def resumen(self):
+        with self._lock:
+            return {
+                "trace_id": self.trace_id,
+                "spans": [
+                    {"etapa": s.etapa, "inicio_ms": (s.inicio - self.inicio) * 1000, "duracion_ms": s.duracion_s * 1000}
+                    for s in self.spans if s.duracion_s is not None
+                ],
+            }
+
+
+_traza_actual = contextvars.ContextVar("wevently_traza", default=None)
+
+
+def traza_actual():
+    return _traza_actual.get()
+
+
+@contextmanager
+def iniciar_traza(trace_id):
+    """Abre la traza de una consulta; al cerrarla registra la etapa "total"."""
+    traza = Traza(trace_id)
+    token = _traza_actual.set(traza)
+    try:
+        with span("total"):
+            yield traza
+    finally:
+        try:
+            _traza_actual.reset(token)
+        except ValueError:
+            # generador de streaming cerrado desde otro contexto: la traza ya no se usa
+            pass
+
+
+@contextmanager
+def span(etapa):
+    """Mide una etapa con reloj monotónico: la suma a la traza actual, al histograma y a OpenTelemetry si está activo."""
+    traza = _traza_actual.get()
+    actual = Span(etapa, traza.trace_id if traza else None)
+    otel = _span_otel(etapa, actual.trace_id)
+    try:
+        if otel is None:
+            yield actual
+        else:
+            with otel:
+                yield actual
+    finally:
+        duracion = actual.cerrar()
+        if traza is not None:
+            traza.agregar(actual)
+        METRICAS.observar(METRICA_ETAPAS, duracion, etapa=etapa)
+
+
+def instrumentar(etapa):
+    """Decorador: ejecuta la función dentro de un span de la etapa, sin alterar su valor de retorno."""
+    def decorador(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(etapa):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorador
+
+
+def en_contexto(func):
+    """Envuelve func para ejecutarla con el contexto actual (traza incluida) en otro hilo/executor."""
+    contexto = contextvars.copy_context()
+    return lambda *args: contexto.run(func, *args)
+
+
+# --- OpenTelemetry (opcional) ---
+_tracer_otel = None
+
+
+def _span_otel(etapa, trace_id):
+    if _tracer_otel is None:
+        return None
+    return _tracer_otel.start_as_current_span(f"wevently.{etapa}", attributes={"wevently.trace_id": trace_id or ""})
+
+
+def _configurar_otel():
+    global _tracer_otel
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        logger.warning("WEVENTLY_OTEL=1 pero 'opentelemetry-api' no está instalado; se omite la exportación OpenTelemetry.")
+        return
+    if os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"):
+        try:
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import BatchSpanProcessor
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+            proveedor = TracerProvider(resource=Resource.create({"service.name": os.getenv("OTEL_SERVICE_NAME", "wevently")}))
+            proveedor.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+            trace.set_tracer_provider(proveedor)
+        except ImportError:
+            logger.warning("Falta 'opentelemetry-sdk' u 'opentelemetry-exporter-otlp'; se usa el TracerProvider global existente.")
+    _tracer_otel = trace.get_tracer("wevently")
+    logger.info("Exportación de spans OpenTelemetry activada.")
+
+
+# --- Endpoint de métricas ---
+class _ManejadorMetricas(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        cuerpo = METRICAS.exportar_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, *_):
+        pass
+
+
+def iniciar_servidor_metricas(puerto, host="127.0.0.1"):
+    """Sirve GET /metrics (formato Prometheus) desde un hilo daemon y devuelve el servidor."""
+    servidor = ThreadingHTTPServer((host, puerto), _ManejadorMetricas)
+    threading.Thread(target=servidor.serve_forever, name="metricas-http", daemon=True).start()
+    logger.info(f"Métricas Prometheus en http://{host}:{servidor.server_address[1]}/metrics")
+    return servidor
+
+
+_configurado = False
+_servidor = None
+
+
+def configurar_observabilidad():
+    """Levanta el endpoint de métricas y OpenTelemetry según variables de entorno (una sola vez por proceso)."""
+    global _configurado, _servidor
+    if _configurado:
+        return
+    _configurado = True
+    puerto = os.getenv("WEVENTLY_METRICAS_PUERTO", "")
+    if puerto:
+        try:
+            _servidor = iniciar_servidor_metricas(int(puerto), os.getenv("WEVENTLY_METRICAS_HOST", "127.0.0.1"))
+        except OSError:
+            logger.warning(f"No se pudo abrir el endpoint de métricas en el puerto {puerto}.", exc_info=True)
+    if os.getenv("WEVENTLY_OTEL", "0") == "1":
+        _configurar_otel()
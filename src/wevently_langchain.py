@@ -1,27 +1,43 @@
 import logging
 import time
 import json
-from functools import wraps
+import re
+import asyncio
+import queue
+import threading
+import atexit
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from collections import Counter
 from datetime import datetime
-import spacy
-import torch
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
-from langchain_neo4j import Neo4jGraph
-from langchain_ollama import OllamaLLM
+from contextlib import contextmanager
 import numpy as np
-import skfuzzy as fuzz
-from skfuzzy import control as ctrl
-from neo4j_connection import get_graph
+from neo4j_connection import get_graph, get_async_driver, get_query_timeout
+from inferencia_batch import get_motor_inferencia
+from motor_difuso import get_motor_difuso
+from recuperacion_kg import CYPHER_RECUPERACION, RecuperadorCypher, parametros_recuperacion
+from snapshot_kg import SnapshotConocimiento, RecuperadorConSnapshot
+from esquema_kg import consulta_recuperacion
+from cache_respuestas import CacheRespuestas, clave_intencion
+from recursos import RegistroRecursos
+from sink_resultados import SinkResultados
+from emocion_backends import crear_backend
+from filtro_dominio import AutomataDominio
+from rf_compacto import ForestCompacto
+from llm_gateway import GatewayLLM, CircuitBreaker, registrar_origenes, respondio_el_primario, plazo_configurado
+from degradacion import ControladorDegradacion, nivel_al_menos, nivel_actual, servir_con_nivel
+from trazas import (METRICAS, METRICA_ETAPAS, METRICA_SOLICITUDES, METRICA_RECHAZOS, configurar_observabilidad,
+                    iniciar_traza, traza_actual, span, instrumentar, en_contexto)
 import os
 import joblib
 
 # --- Parámetros/paths para cargar modelo ML entrenado ---
 MODEL_FOLDER = os.path.dirname(os.path.abspath(__file__))
 MODEL_PATH = os.path.join(MODEL_FOLDER, "mejor_modelo_RandomForest.joblib")
+# Versión en arreglos planos del mismo modelo (ver rf_compacto.py); se usa si existe y no es más vieja que el .joblib
+MODEL_COMPACTO_PATH = os.path.join(MODEL_FOLDER, "mejor_modelo_RandomForest.npz")
+USAR_RF_COMPACTO = os.getenv("WEVENTLY_RF_COMPACTO", "1") == "1"
 VECTORIZER_PATH = os.path.join(MODEL_FOLDER, "vectorizador_tfidf.joblib")
 MODEL_METADATA_PATH = os.path.join(MODEL_FOLDER, "metadata.json")
-modelo_rf = joblib.load(MODEL_PATH)
-vectorizador_tfidf = joblib.load(VECTORIZER_PATH)
 if os.path.exists(MODEL_METADATA_PATH):
     with open(MODEL_METADATA_PATH, "r") as f:
         METADATA = json.load(f)
@@ -29,6 +45,9 @@ if os.path.exists(MODEL_METADATA_PATH):
 else:
     ML_CONFIDENCE_THRESHOLD = 0.1
 
+# --- Micro-batching de inferencia (ver inferencia_batch.py) ---
+USAR_MICRO_BATCHING = os.getenv("WEVENTLY_MICRO_BATCHING", "0") == "1"
+
 # --- Palabras clave del dominio soporte ---
 DOMAIN_KEYWORDS = {
     'pago','pagos','pagar','pagué','pague','acreditar','acredita','acreditación','acreditacion', 
@@ -38,166 +57,449 @@ DOMAIN_KEYWORDS = {
     'rechazar', 'rechazo', 'rechazado', 'servicio', 'proveedor', 'prestador', 'reclamo',
     'cancelacion', 'cancelación', 'transacción', 'evento', 'eventos', 'rechazó', 'rechaza', 'reintentar'
 }
+# Raíces plegadas (sin tildes) de DOMAIN_KEYWORDS para el filtro barato sobre el texto crudo
+# y formas plegadas para la coincidencia exacta de lemas.
+# "no" se excluye: spaCy lo marca como stopword, así que nunca contó como keyword de dominio.
+AUTOMATA_DOMINIO = AutomataDominio(DOMAIN_KEYWORDS, excluir={"no"})
 
 # --- Logging global ---
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('pruebas_wevently.log'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
+_logging_pid = None
+_handlers_logging = []
 
-def medir_tiempo(func):
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        inicio = time.time()
-        resultado = func(*args, **kwargs)
-        duracion = time.time() - inicio
-        logger.info(f"{func.__name__} ejecutado en {duracion:.4f}s")
-        return resultado, duracion
-    return wrapper
-
-# --- Modelos NLP y HuggingFace ---
-def load_nlp_models():
-    model_id = "raulgdp/Analisis-sentimientos-BETO-TASS-2025-II"
+def configurar_logging(cola=None):
+    """
+    Configura el logging a archivo y consola (una sola vez por proceso).
+    Los handlers escriben desde un hilo QueueListener, así el request no hace
+    I/O de disco; el archivo rota por tamaño.
+
+    Con `cola` (una cola multiprocessing, en los workers de un pool) los
+    registros se mandan al proceso padre, único que escribe el archivo (ver
+    escuchar_logs_workers): varios procesos rotando el mismo archivo se pisan.
+    """
+    global _logging_pid
+    if _logging_pid == os.getpid():
+        return
+    raiz = logging.getLogger()
+    if _logging_pid is not None or cola is not None:
+        # Proceso hijo de un fork: el QueueHandler heredado apunta a un listener que acá no corre
+        for handler in list(raiz.handlers):
+            if isinstance(handler, QueueHandler):
+                raiz.removeHandler(handler)
+    _logging_pid = os.getpid()
+    raiz.setLevel(logging.INFO)
+    if cola is not None:
+        raiz.addHandler(QueueHandler(cola))
+        return
+    formato = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    archivo = RotatingFileHandler(
+        'pruebas_wevently.log',
+        maxBytes=int(os.getenv("WEVENTLY_LOG_MAX_BYTES", str(20 * 1024 * 1024))),
+        backupCount=int(os.getenv("WEVENTLY_LOG_BACKUPS", "5")),
+        encoding='utf-8'
+    )
+    consola = logging.StreamHandler()
+    for handler in (archivo, consola):
+        handler.setFormatter(formato)
+    cola_logs = queue.Queue(-1)
+    listener = QueueListener(cola_logs, archivo, consola, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    _handlers_logging[:] = [archivo, consola]
+    raiz.addHandler(QueueHandler(cola_logs))
+
+def escuchar_logs_workers(cola):
+    """
+    En el proceso padre de un pool: escribe con los handlers de este proceso
+    los registros que mandan los workers configurados con `configurar_logging(cola)`.
+    Devuelve el QueueListener (detenerlo con `stop()` al cerrar el pool).
+    """
+    configurar_logging()
+    listener = QueueListener(cola, *_handlers_logging, respect_handler_level=True)
+    listener.start()
+    return listener
+
+# --- Instrumentación (ver trazas.py) ---
+# Cada etapa corre dentro de un span con reloj monotónico; las duraciones quedan en
+# la traza de la consulta (trace id = test_id) y en histogramas del proceso.
+def _duracion_etapa(etapa):
+    traza = traza_actual()
+    return traza.duracion_s(etapa) if traza is not None else 0.0
+
+# --- Recursos con carga diferida (ver recursos.py) ---
+# Nada se carga al importar el módulo: cada modelo/conexión se carga en su primer
+# uso o con warmup(). Los nombres del registro siguen accesibles como atributos
+# del módulo (wevently_langchain.nlp, .graph, .llm, ...) vía __getattr__.
+REGISTRO = RegistroRecursos()
+BETO_MODEL_ID = "raulgdp/Analisis-sentimientos-BETO-TASS-2025-II"
+LLM_MODEL = "gpt-oss:20b-cloud"
+LLM_BASE_URL = "https://ollama.com"
+# Backend de inferencia de emoción (ver emocion_backends.py): pytorch, pytorch_int8, onnx u onnx_int8
+EMOCION_BACKEND = os.getenv("WEVENTLY_EMOCION_BACKEND", "pytorch")
+
+def _cargar_modelo_rf():
+    if USAR_RF_COMPACTO and os.path.exists(MODEL_COMPACTO_PATH):
+        if not os.path.exists(MODEL_PATH) or os.path.getmtime(MODEL_COMPACTO_PATH) >= os.path.getmtime(MODEL_PATH):
+            return ForestCompacto.cargar(MODEL_COMPACTO_PATH)
+        logger.warning("El modelo compacto es anterior al .joblib (¿reentrenado?); se usa el .joblib. "
+                       "Regenerar con: python src/rf_compacto.py")
+    return joblib.load(MODEL_PATH)
+
+def _cargar_vectorizador():
+    return joblib.load(VECTORIZER_PATH)
+
+def _cargar_spacy():
+    import spacy
+    # spaCy: sólo usamos lemas, stopwords y flags léxicos; NER y parser no aportan nada
+    return spacy.load("es_core_news_sm", disable=["ner", "parser"])
+
+def _cargar_tokenizer():
+    from transformers import AutoTokenizer
+    hf_token = os.getenv("HUGGINGFACE_HUB_TOKEN", None)
+    return AutoTokenizer.from_pretrained(BETO_MODEL_ID, use_auth_token=hf_token)
+
+def _cargar_emo_model():
+    from transformers import AutoModelForSequenceClassification
     hf_token = os.getenv("HUGGINGFACE_HUB_TOKEN", None)
-    # spaCy
-    nlp_local = spacy.load("es_core_news_sm")
-    # Transformer
-    tokenizer_local = AutoTokenizer.from_pretrained(model_id, use_auth_token=hf_token)
-    model_local = AutoModelForSequenceClassification.from_pretrained(model_id, use_auth_token=hf_token)
-    return nlp_local, tokenizer_local, model_local
-nlp, tokenizer, emo_model = load_nlp_models()
-
-# --- Neo4j y Ollama LLM ---
-graph = get_graph()
-llm = OllamaLLM(
-    model="gpt-oss:20b-cloud",
-    base_url="https://ollama.com"
-)
+    return AutoModelForSequenceClassification.from_pretrained(BETO_MODEL_ID, use_auth_token=hf_token)
+
+def _cargar_emo_backend():
+    # Con ONNX ya exportado el modelo PyTorch no se carga (es el mayor consumo de memoria por worker).
+    # Salvo en fp32 (el backend usa el mismo modelo), el modelo se carga sólo para cuantizarlo o
+    # exportarlo y no pasa por el registro: ni REGISTRO ni st.cache_resource retienen la copia fp32.
+    if EMOCION_BACKEND == "pytorch" or REGISTRO.cargado("emo_model"):
+        cargar_modelo = lambda: REGISTRO.obtener("emo_model")
+    else:
+        cargar_modelo = _cargar_emo_model
+    return crear_backend(EMOCION_BACKEND, REGISTRO.obtener("tokenizer"), cargar_modelo)
+
+def _cargar_recuperador():
+    graph = REGISTRO.obtener("graph")
+    # un AsyncDriver queda atado al event loop donde abrió sus conexiones: se crea uno por loop
+    recuperador = RecuperadorCypher(graph, fabrica_driver_async=get_async_driver, timeout_s=get_query_timeout(),
+                                    elegir_cypher=lambda: consulta_recuperacion(graph))
+    if not USAR_SNAPSHOT_KG and cache_respuestas is None:
+        return recuperador
+    # En modo en vivo el snapshot no responde consultas: sólo da la versión del grafo a la cache
+    snapshot = SnapshotConocimiento(graph)
+    try:
+        snapshot.cargar()
+    except Exception:
+        logger.warning("No se pudo cargar el snapshot KG al inicio; se usará Neo4j en vivo hasta el próximo refresco.", exc_info=True)
+    if cache_respuestas is not None:
+        # Un cambio de versión del grafo invalida las respuestas cacheadas
+        cache_respuestas.vigilar(snapshot)
+    return RecuperadorConSnapshot(snapshot, recuperador) if USAR_SNAPSHOT_KG else recuperador
+
+# Timeout HTTP del cliente Ollama, acotado al plazo del gateway: un hilo cuya llamada
+# ya se abandonó por plazo queda libre a más tardar cuando vence ese mismo plazo
+LLM_TIMEOUT_HTTP = float(os.getenv("WEVENTLY_LLM_TIMEOUT_HTTP", "60"))
+# Modelo Ollama local de respaldo (vacío: sin respaldo, se pasa directo a la plantilla)
+LLM_RESPALDO_MODELO = os.getenv("WEVENTLY_LLM_RESPALDO_MODELO", "")
+LLM_RESPALDO_URL = os.getenv("WEVENTLY_LLM_RESPALDO_URL", "http://localhost:11434")
+# Un único circuito para el endpoint remoto, compartido por todos los gateways
+BREAKER_LLM = CircuitBreaker(nombre="ollama_remoto")
+
+def _cargar_llm():
+    from langchain_ollama import OllamaLLM
+    return OllamaLLM(model=LLM_MODEL, base_url=LLM_BASE_URL, client_kwargs={"timeout": min(LLM_TIMEOUT_HTTP, plazo_configurado())})
+
+def _cargar_llm_estructurado():
+    # Mismo modelo con salida JSON, para el modo de una sola llamada (selección + respuesta)
+    from langchain_ollama import OllamaLLM
+    return OllamaLLM(model=LLM_MODEL, base_url=LLM_BASE_URL, format="json", client_kwargs={"timeout": min(LLM_TIMEOUT_HTTP, plazo_configurado())})
+
+def _llm_respaldo(**kwargs):
+    if not LLM_RESPALDO_MODELO:
+        return None
+    from langchain_ollama import OllamaLLM
+    return OllamaLLM(model=LLM_RESPALDO_MODELO, base_url=LLM_RESPALDO_URL, client_kwargs={"timeout": min(LLM_TIMEOUT_HTTP, plazo_configurado(respaldo=True))}, **kwargs)
+
+# Sin LLM la selección cae en el candidato mejor rankeado (ver _interpretar_seleccion)
+PLANTILLA_SELECCION = "Opción 1: LLM no disponible, se usa el candidato mejor rankeado."
+
+# Un gateway por tipo de llamada: cada uno lleva su propia distribución de latencias para el hedging
+def _cargar_gateway_seleccion():
+    return GatewayLLM(REGISTRO.obtener("llm"), _llm_respaldo(), BREAKER_LLM, nombre="seleccion", plantilla=PLANTILLA_SELECCION)
+
+def _cargar_gateway_respuesta():
+    return GatewayLLM(REGISTRO.obtener("llm"), _llm_respaldo(), BREAKER_LLM, nombre="respuesta")
+
+def _cargar_gateway_estructurado():
+    return GatewayLLM(REGISTRO.obtener("llm_estructurado"), _llm_respaldo(format="json"), BREAKER_LLM, nombre="estructurado")
+
+REGISTRO.registrar("modelo_rf", _cargar_modelo_rf)
+REGISTRO.registrar("vectorizador_tfidf", _cargar_vectorizador)
+REGISTRO.registrar("nlp", _cargar_spacy)
+REGISTRO.registrar("tokenizer", _cargar_tokenizer)
+REGISTRO.registrar("emo_model", _cargar_emo_model)
+REGISTRO.registrar("emo_backend", _cargar_emo_backend)
+REGISTRO.registrar("graph", get_graph)
+REGISTRO.registrar("recuperador", _cargar_recuperador)
+REGISTRO.registrar("llm", _cargar_llm)
+REGISTRO.registrar("llm_estructurado", _cargar_llm_estructurado)
+REGISTRO.registrar("gateway_seleccion", _cargar_gateway_seleccion)
+REGISTRO.registrar("gateway_respuesta", _cargar_gateway_respuesta)
+REGISTRO.registrar("gateway_estructurado", _cargar_gateway_estructurado)
+REGISTRO.registrar("sink_resultados", SinkResultados)
+
+def __getattr__(nombre):
+    try:
+        return REGISTRO.obtener(nombre)
+    except KeyError:
+        raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}") from None
+
+# Modelos locales que conviene precargar (los remotos, Neo4j y LLM, se conectan en su primer uso)
+RECURSOS_LOCALES = ("modelo_rf", "vectorizador_tfidf", "nlp", "tokenizer", "emo_backend")
+
+def warmup(nombres=None):
+    """Carga modelos y conexiones por adelantado y devuelve el tiempo de carga (ms) de cada uno."""
+    configurar_logging()
+    configurar_observabilidad()
+    return REGISTRO.warmup(nombres)
+
+def load_nlp_models():
+    return REGISTRO.obtener("nlp"), REGISTRO.obtener("tokenizer"), REGISTRO.obtener("emo_model")
+
+# Modo snapshot: el subgrafo de recuperación se sirve desde memoria (ver snapshot_kg.py)
+USAR_SNAPSHOT_KG = os.getenv("WEVENTLY_KG_SNAPSHOT", "0") == "1"
+
+# --- Selección de solución ---
+# "dos_llamadas": el LLM elige la opción y luego redacta la respuesta (comportamiento original).
+# "una_llamada": el LLM elige y redacta en una única llamada con salida estructurada.
+MODO_LLM = os.getenv("WEVENTLY_LLM_MODO", "dos_llamadas")
+# Margen para considerar que el primer candidato de Neo4j es ganador claro
+# Con margen 1 cualquier diferencia de keywords decidiría sin el LLM: se exige al menos 2
+MARGEN_GANADOR_KEYWORDS = int(os.getenv("WEVENTLY_MARGEN_GANADOR_KEYWORDS", "2"))
+MARGEN_GANADOR_CONFIANZA = float(os.getenv("WEVENTLY_MARGEN_GANADOR_CONFIANZA", "0.15"))
+# Se actualiza desde los hilos de Streamlit, el executor async y el streaming
+ESTADISTICAS_SELECCION = Counter()
+_lock_seleccion = threading.Lock()
+
+def _contar_ruta(ruta):
+    with _lock_seleccion:
+        ESTADISTICAS_SELECCION[ruta] += 1
+
+# --- Degradación bajo carga (ver degradacion.py) ---
+# Decide el nivel de las consultas de este proceso; la API decide con su propia carga y lo pasa explícito
+CONTROLADOR_DEGRADACION = ControladorDegradacion()
+# Sin BETO: "neutral" no está en EMOTION_TO_TONE, así el prompt usa el tono del rol
+EMOCION_OMITIDA = ("neutral", 0.0)
+
+@contextmanager
+def _nivel_de_servicio(nivel_servicio=None):
+    if nivel_servicio is not None:
+        with servir_con_nivel(nivel_servicio):
+            yield nivel_servicio
+        return
+    with CONTROLADOR_DEGRADACION.solicitud() as nivel, servir_con_nivel(nivel):
+        yield nivel
+
+def _emocion_segun_nivel(pregunta):
+    if nivel_al_menos(nivel_actual(), "sin_emocion"):
+        return EMOCION_OMITIDA
+    return detect_emotion(pregunta)
+
+# --- Cache de respuestas por intención (ver cache_respuestas.py) ---
+cache_respuestas = CacheRespuestas() if os.getenv("WEVENTLY_CACHE_RESPUESTAS", "0") == "1" else None
 
 # --- Emoción (BETO) ---
 emotion_id2label = {0: "alegría", 1: "enojo", 2: "asco", 3: "miedo", 4: "tristeza", 5: "sorpresa"}
-@medir_tiempo
+@instrumentar("emocion")
 def detect_emotion(text):
-    inputs = tokenizer(text, return_tensors="pt", truncation=True, max_length=128)
-    with torch.no_grad():
-        logits = emo_model(**inputs).logits
-    scores = torch.softmax(logits, dim=-1).detach().cpu().numpy()[0]
-    emo_idx = int(np.argmax(scores))
-    emo = emotion_id2label[emo_idx]
-    return emo, float(scores[emo_idx])
+    if USAR_MICRO_BATCHING:
+        return get_motor_inferencia().detect_emotion(text).result()
+    return detect_emotion_batch([text])[0]
+
+def detect_emotion_batch(texts):
+    """Emoción para una lista de textos en un único forward pass (batch con padding)."""
+    scores = REGISTRO.obtener("emo_backend").probabilidades(texts)
+    resultados = []
+    for fila in scores:
+        emo_idx = int(np.argmax(fila))
+        resultados.append((emotion_id2label[emo_idx], float(fila[emo_idx])))
+    return resultados
+
+# --- Contexto de análisis por mensaje ---
+class AnalisisMensaje:
+    """
+    Resultado compartido del análisis NLP de un mensaje.
+
+    Cada artefacto (Doc de spaCy, lemas, vector TF-IDF, match de dominio) se calcula
+    una sola vez, la primera vez que se pide, y queda cacheado para el planificador,
+    la etapa difusa, el armado de la consulta Cypher y el logging.
+    """
+    def __init__(self, texto):
+        self.texto = texto
+        self._doc = None
+        self._keywords = None
+        self._vector_tfidf = None
+        self._domain_match = None
+        self._domain_match_texto = None
+        self.tiempos = {}
+
+    @property
+    def doc(self):
+        if self._doc is None:
+            with span("spacy") as s:
+                if USAR_MICRO_BATCHING:
+                    self._doc = get_motor_inferencia().parse(self.texto).result()
+                else:
+                    self._doc = REGISTRO.obtener("nlp")(self.texto)
+            self.tiempos["spacy_ms"] = s.duracion_s * 1000
+        return self._doc
+
+    @property
+    def keywords(self):
+        if self._keywords is None:
+            # el span incluye el parseo de spaCy si todavía no se hizo
+            with span("keywords") as s:
+                self._keywords = _keywords_de_doc(self.doc)
+            self.tiempos["keywords_ms"] = s.duracion_s * 1000
+        return self._keywords
+
+    @property
+    def vector_tfidf(self):
+        if self._vector_tfidf is None:
+            with span("tfidf") as s:
+                self._vector_tfidf = REGISTRO.obtener("vectorizador_tfidf").transform([self.texto])
+            self.tiempos["tfidf_ms"] = s.duracion_s * 1000
+        return self._vector_tfidf
+
+    @property
+    def domain_match(self):
+        # lemas plegados contra DOMAIN_KEYWORDS: "transacción"/"transaccion" coinciden igual
+        if self._domain_match is None:
+            self._domain_match = AUTOMATA_DOMINIO.coincidencias(self.keywords)
+        return self._domain_match
+
+    @property
+    def domain_match_texto(self):
+        """Coincidencias de dominio sobre el texto crudo (sin spaCy)."""
+        if self._domain_match_texto is None:
+            self._domain_match_texto = AUTOMATA_DOMINIO.coincidencias_texto(self.texto)
+        return self._domain_match_texto
+
+def analizar_mensaje(texto):
+    return texto if isinstance(texto, AnalisisMensaje) else AnalisisMensaje(texto)
+
+def _keywords_de_doc(doc):
+    return [token.lemma_.lower() for token in doc if token.is_alpha and not token.is_stop]
 
 # --- Keywords (spaCy) ---
-@medir_tiempo
 def detect_keywords(text):
-    doc = nlp(text)
-    keywords = [token.lemma_.lower() for token in doc if token.is_alpha and not token.is_stop]
-    return keywords
+    return analizar_mensaje(text).keywords
+
+def detect_keywords_batch(texts):
+    """Keywords para una lista de textos usando `nlp.pipe`."""
+    return [_keywords_de_doc(doc) for doc in REGISTRO.obtener("nlp").pipe(texts)]
 
 # --- Modelo ML predictivo ---
 def clasificar_categoria_ml(texto):
     """
     Clasifica el mensaje usando el modelo ML y retorna categoria y confianza.
     Si la confianza < umbral, devuelve categoría NoRepresentaAlDominio.
+    Acepta el texto crudo o un AnalisisMensaje (reutiliza su vector TF-IDF).
     """
-    vec = vectorizador_tfidf.transform([texto])
-    proba = modelo_rf.predict_proba(vec)[0]
-    categoria_predicha = modelo_rf.classes_[np.argmax(proba)]
+    analisis = analizar_mensaje(texto)
+    if USAR_MICRO_BATCHING and analisis._vector_tfidf is None:
+        with span("clasificacion_ml"):
+            return get_motor_inferencia().clasificar(analisis.texto).result()
+    vector = analisis.vector_tfidf
+    with span("clasificacion_ml"):
+        proba = REGISTRO.obtener("modelo_rf").predict_proba(vector)[0]
+        return _categoria_desde_proba(proba)
+
+def clasificar_categoria_ml_batch(textos):
+    """Clasifica una lista de textos con una sola transformación TF-IDF dispersa."""
+    vec = REGISTRO.obtener("vectorizador_tfidf").transform(list(textos))
+    return [_categoria_desde_proba(proba) for proba in REGISTRO.obtener("modelo_rf").predict_proba(vec)]
+
+def _categoria_desde_proba(proba):
+    categoria_predicha = REGISTRO.obtener("modelo_rf").classes_[np.argmax(proba)]
     confianza = float(np.max(proba))
     if confianza < ML_CONFIDENCE_THRESHOLD:
         return "NoRepresentaAlDominio", confianza
     return categoria_predicha, confianza
 
 # --- Planificador dinámico (PG3) ---
-def planificar_flujo(pregunta, tipo_usuario, historial_sesion):
-    categoria_ml, confianza_ml = clasificar_categoria_ml(pregunta)
-    keywords, _ = detect_keywords(pregunta)
-    kw_set = set(keywords)
-    domain_match = kw_set.intersection(DOMAIN_KEYWORDS)
+# Niveles de filtrado de más barato a más caro; el primero que rechaza corta el
+# flujo y los siguientes no se ejecutan:
+#   automata:     raíces de dominio + terminación sobre el texto crudo plegado (microsegundos; sólo rechaza)
+#   clasificador: TF-IDF + RandomForest (categoría y confianza)
+#   spacy:        lemas de spaCy plegados contra DOMAIN_KEYWORDS (coincidencia exacta)
+NIVELES_PLANIFICADOR = ("automata", "clasificador", "spacy")
 
+@instrumentar("planificador")
+def planificar_flujo(pregunta, tipo_usuario, historial_sesion, analisis=None):
+    analisis = analisis or analizar_mensaje(pregunta)
     plan = {
-        "categoria_ml": categoria_ml,
-        "confianza_ml": confianza_ml,
-        "keywords": keywords,
+        "categoria_ml": "NoRepresentaAlDominio",
+        "confianza_ml": 0.0,
+        "keywords": [],
         "ejecutar_flujo_completo": True,
+        "nivel_rechazo": None,
+        "niveles_ms": {},
         "justificacion": []
     }
-    if categoria_ml == "NoRepresentaAlDominio":
+
+    def _rechazar(nivel, motivo):
         plan["ejecutar_flujo_completo"] = False
-        plan["justificacion"].append(f"Categoría ML: NoRepresentaAlDominio o confianza baja {confianza_ml:.2f}. Fallback inmediato.")
+        plan["nivel_rechazo"] = nivel
+        plan["justificacion"].append(motivo)
+        METRICAS.contar(METRICA_RECHAZOS, nivel=nivel)
         return plan
+
+    with span("planificador_automata") as s:
+        coincidencias = analisis.domain_match_texto
+    plan["niveles_ms"]["automata"] = s.duracion_s * 1000
+    if not coincidencias:
+        return _rechazar("automata", "Sin raíces de dominio en el texto. Fallback inmediato.")
+
+    with span("planificador_clasificador") as s:
+        categoria_ml, confianza_ml = clasificar_categoria_ml(analisis)
+    plan["niveles_ms"]["clasificador"] = s.duracion_s * 1000
+    plan.update(categoria_ml=categoria_ml, confianza_ml=confianza_ml)
+    if categoria_ml == "NoRepresentaAlDominio":
+        return _rechazar("clasificador", f"Categoría ML: NoRepresentaAlDominio o confianza baja {confianza_ml:.2f}. Fallback inmediato.")
     if confianza_ml < ML_CONFIDENCE_THRESHOLD:
-        plan["ejecutar_flujo_completo"] = False
-        plan["justificacion"].append(f"Confianza ML ({confianza_ml:.2f}) < umbral ({ML_CONFIDENCE_THRESHOLD:.2f}). Fallback inmediato.")
-        return plan
+        return _rechazar("clasificador", f"Confianza ML ({confianza_ml:.2f}) < umbral ({ML_CONFIDENCE_THRESHOLD:.2f}). Fallback inmediato.")
+
+    with span("planificador_spacy") as s:
+        plan["keywords"] = analisis.keywords
+        domain_match = analisis.domain_match
+    plan["niveles_ms"]["spacy"] = s.duracion_s * 1000
     if not domain_match:
-        plan["ejecutar_flujo_completo"] = False
-        plan["justificacion"].append(f"Sin keywords relevantes de dominio. Fallback.")
-        return plan
+        return _rechazar("spacy", "Sin keywords relevantes de dominio. Fallback.")
     plan["justificacion"].append("Confianza ML suficiente y keywords relevantes en dominio. Ejecuto flujo completo.")
     return plan
 
 # --- Lógica difusa ---
-@medir_tiempo
+# El sistema de control se compila una vez (motor_difuso.py); cada llamada es un lookup.
+@instrumentar("fuzzy")
 def fuzzy_problem_categorization(keywords):
-    matched = len(keywords)
-    kw_input = ctrl.Antecedent(np.arange(0, 6, 1), 'num_keywords')
-    conf_output = ctrl.Consequent(np.arange(0, 1.1, 0.1), 'confianza')
-    kw_input['bajo'] = fuzz.trimf(kw_input.universe, [0, 0, 2])
-    kw_input['medio'] = fuzz.trimf(kw_input.universe, [1, 3, 5])
-    kw_input['alto'] = fuzz.trimf(kw_input.universe, [3, 5, 5])
-    conf_output['baja'] = fuzz.trimf(conf_output.universe, [0, 0, 0.7])
-    conf_output['alta'] = fuzz.trimf(conf_output.universe, [0.6, 1, 1])
-    rule1 = ctrl.Rule(kw_input['bajo'], conf_output['baja'])
-    rule2 = ctrl.Rule(kw_input['medio'], conf_output['baja'])
-    rule3 = ctrl.Rule(kw_input['alto'], conf_output['alta'])
-    confianza_ctrl = ctrl.ControlSystem([rule1, rule2, rule3])
-    confianza_sim = ctrl.ControlSystemSimulation(confianza_ctrl)
-    confianza_sim.input['num_keywords'] = matched
-    confianza_sim.compute()
-    return float(confianza_sim.output['confianza'])
+    return get_motor_difuso().confianza(len(keywords))
 
 # --- Cypher Query ---
 def cypher_query(keywords, tipo_usuario):
-    kw_list = [k.lower() for k in keywords]
-    kwstr = "[" + ", ".join([f"'{k}'" for k in kw_list]) + "]"
-    #a la consulta le saque el LIMIT 1 para obtener todas als respuestas
-    return f"""
-    WITH {kwstr} AS kws
-    UNWIND kws AS kw
-    MATCH (k:PalabraClave)
-    WHERE toLower(k.nombre) = kw
-    MATCH (k)-[:DISPARA]->(c:CategoriaProblema)
-    OPTIONAL MATCH (c)-[:AGRUPA]->(t:TipoProblema)-[:RESUELTO_POR]->(s:Solucion)
-    OPTIONAL MATCH (c)-[:TIENE_UN]->(tu:TipoUsuario {{nombre: '{tipo_usuario}'}})
-    WITH c, t, s, tu, collect(DISTINCT k.nombre) AS matched_keywords
-    WITH c,t,s,tu,matched_keywords, size(matched_keywords) AS matched_count,
-         coalesce(c.confianzaDecision,0) AS confianza,
-         CASE WHEN tu IS NULL THEN 0 ELSE 1 END AS has_type
-    RETURN DISTINCT
-        t.nombre AS tipo_problema,
-        s.accion AS solucion,
-        confianza AS confianza,
-        matched_count AS matched_count,
-        matched_keywords AS matched_keywords,
-        has_type
-    ORDER BY has_type DESC, matched_count DESC, confianza DESC
     """
+    Devuelve la consulta de recuperación (texto constante) y sus parámetros.
+    Las keywords y el rol nunca se interpolan en el texto Cypher.
+    """
+    #a la consulta le saque el LIMIT 1 para obtener todas als respuestas
+    return CYPHER_RECUPERACION, parametros_recuperacion(keywords, tipo_usuario)
 
-def elegir_mejor_solucion_con_llm(user_message, all_results, categoria_ml, emocion, llm):
-    if not all_results:
-        return None, None, None, "No hay soluciones candidatas en la base de conocimiento."
-    candidates_text = "\n".join([
+def _texto_candidatos(all_results):
+    return "\n".join([
         f"Opción {i+1}: Tipo={r.get('tipo_problema','')}, Solución={r.get('solucion','')}, "
         f"Confianza={r.get('confianza',0):.2f}, Keywords={r.get('matched_keywords','')}"
         for i, r in enumerate(all_results)
     ])
 
-    selection_prompt = (
+def _prompt_seleccion(user_message, all_results, categoria_ml, emocion):
+    candidates_text = _texto_candidatos(all_results)
+
+    return (
         f"Como capa intermedia de un proceso de decisión para ofrecer la mejor solución al problema/consulta del usuario, debes elegir cual es la mejor solución de las ofrecidas para el problema que plantea el usuario. No modifiques la solución ni el tipo de problema"
         f"Mensaje del usuario: '{user_message}'\n"
         f"Categoría ML: {categoria_ml}\n"
@@ -208,11 +510,9 @@ def elegir_mejor_solucion_con_llm(user_message, all_results, categoria_ml, emoci
         "Responde exactamente con 'Opción X:' seguido de una justificación breve. "
         "Si varias opciones son similares, desempata por cantidad de keywords y confianza."
     )
-    respuesta = llm.invoke(selection_prompt)
-    print(respuesta)
 
+def _interpretar_seleccion(respuesta, all_results):
     # Extracción del índice de opción elegida (regex robusta)
-    import re
     match = re.search(r"Opción\s*(\d+)", respuesta)
     if not match:
         # Si el LLM no devuelve formato, fallback seguro
@@ -224,6 +524,96 @@ def elegir_mejor_solucion_con_llm(user_message, all_results, categoria_ml, emoci
     justificacion = respuesta
     return elegido.get('tipo_problema'), elegido.get('solucion'), elegido, justificacion
 
+def elegir_mejor_solucion_con_llm(user_message, all_results, categoria_ml, emocion, llm):
+    if not all_results:
+        return None, None, None, "No hay soluciones candidatas en la base de conocimiento."
+    respuesta = llm.invoke(_prompt_seleccion(user_message, all_results, categoria_ml, emocion))
+    logger.info(respuesta)
+    return _interpretar_seleccion(respuesta, all_results)
+
+async def aelegir_mejor_solucion_con_llm(user_message, all_results, categoria_ml, emocion, llm):
+    if not all_results:
+        return None, None, None, "No hay soluciones candidatas en la base de conocimiento."
+    respuesta = await llm.ainvoke(_prompt_seleccion(user_message, all_results, categoria_ml, emocion))
+    logger.info(respuesta)
+    return _interpretar_seleccion(respuesta, all_results)
+
+def ganador_claro(all_results):
+    """
+    Devuelve el primer candidato si la selección es obvia sin consultar al LLM:
+    un único candidato (o todos con la misma solución), o un primer candidato con
+    margen claro en has_type, matched_count o confianza sobre el segundo.
+    """
+    if not all_results:
+        return None
+    primero = all_results[0]
+    if len(all_results) == 1:
+        return primero
+    if all((r.get('tipo_problema'), r.get('solucion')) == (primero.get('tipo_problema'), primero.get('solucion')) for r in all_results):
+        return primero
+    segundo = all_results[1]
+    if int(primero.get('has_type', 0) or 0) > int(segundo.get('has_type', 0) or 0):
+        return primero
+    if int(primero.get('matched_count', 0) or 0) - int(segundo.get('matched_count', 0) or 0) >= MARGEN_GANADOR_KEYWORDS:
+        return primero
+    if float(primero.get('confianza', 0) or 0) - float(segundo.get('confianza', 0) or 0) >= MARGEN_GANADOR_CONFIANZA:
+        return primero
+    return None
+
+def _seleccion_deterministica(all_results):
+    elegido = ganador_claro(all_results)
+    if elegido is None:
+        return None
+    justificacion = " (selección determinística: candidato con margen claro en la base de conocimiento)"
+    return elegido.get('tipo_problema'), elegido.get('solucion'), elegido, justificacion
+
+def _seleccion_mejor_rankeado(all_results):
+    # Nivel degradado: sin llamada de selección, se toma el primero del ranking de Neo4j
+    elegido = all_results[0]
+    justificacion = " (servicio degradado: candidato mejor rankeado en la base de conocimiento)"
+    return elegido.get('tipo_problema'), elegido.get('solucion'), elegido, justificacion
+
+def estadisticas_seleccion():
+    """Conteo y proporción de cada ruta de selección usada por el pipeline."""
+    with _lock_seleccion:
+        conteos = dict(ESTADISTICAS_SELECCION)
+    total = sum(conteos.values())
+    return {
+        ruta: {"conteo": n, "proporcion": n / total}
+        for ruta, n in conteos.items()
+    }
+
+def _prompt_seleccion_y_respuesta(pregunta, tipo_usuario, plan, emocion, emo_score, confianza_fuzzy, all_results, postdata):
+    rd = role_details.get(tipo_usuario, role_details["Prestador"])
+    emotion_tone = EMOTION_TO_TONE.get(emocion, rd.get('tono', 'neutral'))
+    return (
+        f"Como asistente del sistema Wevently para la organización de eventos privados donde organizadores, prestadores de servicios y propietarios de lugar operan, contesta a la pregunta del usuario."
+        f"Primero elige la mejor solución de las candidatas para el problema que plantea el usuario, sin modificar la solución ni el tipo de problema; "
+        f"si varias opciones son similares, desempata por cantidad de keywords y confianza.\n"
+        f"Soluciones candidatas:\n{_texto_candidatos(all_results)}\n\n"
+        f"Luego redacta la respuesta al usuario comenzando con '{rd['saludo']}', en un tono {emotion_tone}, "
+        f"basada en la solución elegida. Cierra con: {rd['extra']} {postdata}\n"
+        f"(Categoría ML: {plan['categoria_ml']}, Emoción detectada: {emocion}, score emoción: {emo_score:.2f}, confianza ML: {plan['confianza_ml']:.2f}, confianza fuzzy: {confianza_fuzzy:.2f}). "
+        f"Mensaje original: {pregunta}\n"
+        'Responde SOLO con un objeto JSON: {"opcion": <número de la opción elegida>, "respuesta": "<texto para el usuario>"}'
+    )
+
+def _interpretar_seleccion_y_respuesta(texto, all_results):
+    """Devuelve (tipo_problema, solucion, elegido, respuesta) a partir de la salida JSON del LLM."""
+    try:
+        datos = json.loads(texto)
+        idx = int(datos.get("opcion", 1)) - 1
+        respuesta = str(datos.get("respuesta", "")).strip() or texto
+    except (ValueError, TypeError, AttributeError):
+        # Salida no estructurada: se usa el texto completo y la opción mejor rankeada
+        match = re.search(r"Opción\s*(\d+)", texto)
+        idx = int(match.group(1)) - 1 if match else 0
+        respuesta = texto
+    if idx < 0 or idx >= len(all_results):
+        idx = 0
+    elegido = all_results[idx]
+    return elegido.get('tipo_problema'), elegido.get('solucion'), elegido, respuesta
+
 role_details = {
     "Organizador": {
         "saludo": "¡Hola estimado organizador! ",
@@ -251,110 +641,450 @@ EMOTION_TO_TONE = {
     "sorpresa": "informativo y claro"
 }
 
-def generar_respuesta_streamlit(pregunta, tipo_usuario='Prestador', debug=False):
+RESPUESTA_FUERA_DE_DOMINIO = "Lo siento, no puedo ayudar con ese tipo de consulta."
+
+def _registrar_resultado(resultado_prueba):
+    traza = traza_actual()
+    if traza is not None:
+        resultado_prueba["traza"] = traza.resumen()
+    resultado_prueba["nivel_servicio"] = nivel_actual()
+    METRICAS.contar(METRICA_SOLICITUDES, ruta=resultado_prueba.get("ruta_seleccion") or "fuera_de_dominio",
+                    nivel=resultado_prueba["nivel_servicio"])
+    # Sólo encola: el hilo de SinkResultados escribe en lotes fuera del request
+    REGISTRO.obtener("sink_resultados").registrar(resultado_prueba)
+
+def _responder_fallback(test_id, pregunta, tipo_usuario, plan):
+    resultado_prueba = {
+        "test_id": test_id,
+        "entrada": pregunta,
+        "tipo_usuario": tipo_usuario,
+        "categoria_predicha_ml": plan["categoria_ml"],
+        "confianza_ml": plan["confianza_ml"],
+        "keywords": plan["keywords"],
+        "plan": plan,
+        "respuesta": RESPUESTA_FUERA_DE_DOMINIO,
+    }
+    _registrar_resultado(resultado_prueba)
+    logger.info(f"[TEST {test_id}] Fallback por ML")
+    return RESPUESTA_FUERA_DE_DOMINIO, [], "N/A", plan["confianza_ml"]
+
+def _resumir_resultados(result, confianza_fuzzy):
+    """Toma el mejor resultado de Neo4j y ajusta confianza y postdata."""
+    matched_keys = []
+    postdata = "No se encontró solución automática, te derivaremos a soporte. (weventlyempresa@gmail.com)"
+    if result:
+        r = result[0]
+        matched_count = int(r.get('matched_count', 0) or 0)
+        result_conf = float(r.get('confianza', 0) or 0)
+        matched_keys = r.get('matched_keywords', [])
+        if matched_count > 0:
+            confianza_fuzzy = max(confianza_fuzzy, result_conf)
+            postdata = "Respuesta recomendada por nuestro sistema." if confianza_fuzzy >= 0.7 else "Respuesta tomada de la base de conocimiento (confianza baja, verificar manualmente)."
+    return matched_keys, confianza_fuzzy, postdata
+
+def _prompt_respuesta(pregunta, tipo_usuario, plan, emocion, emo_score, confianza_fuzzy, tipo_problema_llm, solucion_llm, justificacion_llm, postdata):
+    rd = role_details.get(tipo_usuario, role_details["Prestador"])
+    emotion_tone = EMOTION_TO_TONE.get(emocion, rd.get('tono', 'neutral'))
+    return (
+        f"Como asistente del sistema Wevently para la organización de eventos privados donde organizadores, prestadores de servicios y propietarios de lugar operan, contesta a la pregunta del usuario."
+        f"{rd['saludo']}Se detectó el problema: {tipo_problema_llm}. "
+        f"Solución sugerida: {(solucion_llm or 'No definida') + justificacion_llm}. "
+        f"Por favor responde en un tono {emotion_tone}. "
+        f"(Categoría ML: {plan['categoria_ml']}, Emoción detectada: {emocion}, score emoción: {emo_score:.2f}, confianza ML: {plan['confianza_ml']:.2f}, confianza fuzzy: {confianza_fuzzy:.2f}). "
+        f"Mensaje original: {pregunta}\n"
+        f"{rd['extra']}\n{postdata}"
+    )
+
+def respuesta_plantilla(tipo_usuario, tipo_problema, solucion, postdata):
+    """Respuesta sin LLM armada con la solución elegida (último respaldo del gateway)."""
+    rd = role_details.get(tipo_usuario, role_details["Prestador"])
+    if not solucion:
+        return f"{rd['saludo']}No pudimos generar una respuesta automática en este momento. {postdata}"
+    problema = f"Detectamos un problema de tipo \"{tipo_problema}\". " if tipo_problema else ""
+    return f"{rd['saludo']}{problema}Solución sugerida: {solucion} {rd['extra']} {postdata}"
+
+def _plantilla_estructurada(tipo_usuario, all_results, postdata):
+    # misma forma que la salida JSON del LLM, con el candidato mejor rankeado
+    elegido = all_results[0]
+    respuesta = respuesta_plantilla(tipo_usuario, elegido.get('tipo_problema'), elegido.get('solucion'), postdata)
+    return json.dumps({"opcion": 1, "respuesta": respuesta}, ensure_ascii=False)
+
+def _plantilla_contexto(ctx, tipo_problema, solucion):
+    return lambda: respuesta_plantilla(ctx["tipo_usuario"], tipo_problema, solucion, ctx["postdata"])
+
+def estadisticas_llm():
+    """Estado del circuito, eventos (hedges, respaldos, plantillas) y latencias de cada gateway ya cargado."""
+    return {
+        nombre: REGISTRO.obtener(nombre).estadisticas()
+        for nombre in ("gateway_seleccion", "gateway_respuesta", "gateway_estructurado")
+        if REGISTRO.cargado(nombre)
+    }
+
+def _resultado_prueba(test_id, pregunta, tipo_usuario, plan, keywords, emocion, confianza_fuzzy,
+                      tipo_problema_llm, solucion_llm, matched_keys, respuesta, tiempos, ruta_seleccion=None):
+    return {
+        "test_id": test_id,
+        "entrada": pregunta,
+        "tipo_usuario": tipo_usuario,
+        "categoria_predicha_ml": plan["categoria_ml"],
+        "confianza_ml": plan["confianza_ml"],
+        "keywords": keywords,
+        "emocion": emocion,
+        "confianza_fuzzy": confianza_fuzzy,
+        "tipo_problema": tipo_problema_llm,
+        "solucion": solucion_llm,
+        "matched_keywords": matched_keys,
+        "respuesta": respuesta,
+        "plan": plan,
+        "ruta_seleccion": ruta_seleccion,
+        "tiempos": tiempos,
+    }
+
+def _tiempos(kw_time, emo_time, conf_time, neo4j_time, llm_time):
+    return {
+        "keywords_ms": kw_time * 1000,
+        "emocion_ms": emo_time * 1000,
+        "fuzzy_ms": conf_time * 1000,
+        "neo4j_ms": neo4j_time * 1000,
+        "llm_ms": llm_time * 1000,
+        "total_ms": (kw_time + emo_time + conf_time + neo4j_time + llm_time) * 1000
+    }
+
+def _buscar_en_cache(tipo_usuario, plan, keywords, emocion, analisis):
+    """Devuelve (clave, valor_cacheado, tipo_acierto); clave es None si la cache está desactivada."""
+    if cache_respuestas is None:
+        return None, None, None
+    clave = clave_intencion(tipo_usuario, plan["categoria_ml"], keywords, emocion)
+    valor, tipo_acierto = cache_respuestas.obtener(clave, analisis.vector_tfidf)
+    return clave, valor, tipo_acierto
+
+def _guardar_en_cache(clave, analisis, respuesta, tipo_problema, solucion, confianza_fuzzy, matched_keys):
+    # No se cachean selecciones fallidas ni respuestas degradadas (nivel reducido,
+    # respaldo o plantilla del gateway) para no fijarlas hasta el TTL
+    if clave is None or solucion is None:
+        return
+    if nivel_actual() != "completo" or not respondio_el_primario():
+        return
+    cache_respuestas.guardar(clave, {
+        "respuesta": respuesta,
+        "tipo_problema": tipo_problema,
+        "solucion": solucion,
+        "confianza_fuzzy": confianza_fuzzy,
+        "matched_keywords": list(matched_keys or []),
+    }, analisis.vector_tfidf)
+
+def _responder_desde_cache(test_id, pregunta, tipo_usuario, plan, keywords, emocion, cacheado, tipo_acierto, tiempos, debug):
+    resultado_prueba = _resultado_prueba(
+        test_id, pregunta, tipo_usuario, plan, keywords, emocion, cacheado["confianza_fuzzy"],
+        cacheado["tipo_problema"], cacheado["solucion"], cacheado["matched_keywords"], cacheado["respuesta"],
+        tiempos, f"cache_{tipo_acierto}")
+    _registrar_resultado(resultado_prueba)
+    if debug:
+        logger.info(f"[DEBUG] {json.dumps(resultado_prueba)}")
+    logger.info(f"[TEST {test_id}] Completado desde cache ({tipo_acierto})")
+    return cacheado["respuesta"], keywords, emocion, cacheado["confianza_fuzzy"]
+
+SELECCION_SIN_CANDIDATOS = (None, None, None, "No hay soluciones candidatas en la base de conocimiento.")
+
+def _ruta_seleccion(result, nivel):
+    """
+    Decide la ruta de selección sin llamar a nadie (compartida por el pipeline
+    síncrono y el async). Devuelve (ruta, seleccion); seleccion es None en las
+    rutas que necesitan al LLM ("una_llamada" y "llm_seleccion").
+    """
+    if not result:
+        return "sin_candidatos", SELECCION_SIN_CANDIDATOS
+    seleccion = _seleccion_deterministica(result)
+    if seleccion is not None:
+        return "deterministica", seleccion
+    if nivel_al_menos(nivel, "sin_seleccion_llm"):
+        return "mejor_rankeado", _seleccion_mejor_rankeado(result)
+    if MODO_LLM == "una_llamada":
+        return "una_llamada", None
+    return "llm_seleccion", None
+
+def _respuesta_o_prompt(nivel, pregunta, tipo_usuario, plan, emocion, emo_score, confianza_fuzzy, seleccion, postdata):
+    """Tras la selección: (None, respuesta de plantilla) en el nivel "plantilla"; si no, (prompt de la respuesta final, None)."""
+    tipo_problema, solucion, _, justificacion = seleccion
+    if nivel == "plantilla":
+        return None, respuesta_plantilla(tipo_usuario, tipo_problema, solucion, postdata)
+    return _prompt_respuesta(pregunta, tipo_usuario, plan, emocion, emo_score, confianza_fuzzy,
+                             tipo_problema, solucion, justificacion, postdata), None
+
+def _seleccionar_solucion(pregunta, tipo_usuario, plan, result, emocion, emo_score, confianza_fuzzy, postdata):
+    """
+    Selección de solución según la ruta que corresponda (ver _ruta_seleccion).
+    Devuelve (tipo_problema, solucion, ruta, prompt_llm, respuesta, llm_time): en la ruta
+    "una_llamada" y en el nivel "plantilla" la respuesta ya está lista y prompt_llm
+    es None; en el resto queda pendiente la llamada final al LLM con prompt_llm.
+    """
+    nivel = nivel_actual()
+    ruta, seleccion = _ruta_seleccion(result, nivel)
+    if ruta == "una_llamada":
+        prompt = _prompt_seleccion_y_respuesta(pregunta, tipo_usuario, plan, emocion, emo_score, confianza_fuzzy, result, postdata)
+        with span("llm_una_llamada") as s:
+            salida = REGISTRO.obtener("gateway_estructurado").invoke(
+                prompt, plantilla=lambda: _plantilla_estructurada(tipo_usuario, result, postdata))
+        tipo_problema_llm, solucion_llm, _, respuesta = _interpretar_seleccion_y_respuesta(salida, result)
+        _contar_ruta(ruta)
+        return tipo_problema_llm, solucion_llm, ruta, None, respuesta, s.duracion_s
+    if ruta == "llm_seleccion":
+        with span("llm_seleccion"):
+            seleccion = elegir_mejor_solucion_con_llm(pregunta, result, plan['categoria_ml'], emocion, REGISTRO.obtener("gateway_seleccion"))
+    _contar_ruta(ruta)
+    prompt_llm, respuesta = _respuesta_o_prompt(nivel, pregunta, tipo_usuario, plan, emocion, emo_score, confianza_fuzzy, seleccion, postdata)
+    return seleccion[0], seleccion[1], ruta, prompt_llm, respuesta, 0
+
+async def _aresolver_respuesta(pregunta, tipo_usuario, plan, result, emocion, emo_score, confianza_fuzzy, postdata):
+    """Versión async de _seleccionar_solucion que además hace la llamada final; devuelve (tipo_problema, solucion, respuesta, llm_time, ruta)."""
+    nivel = nivel_actual()
+    ruta, seleccion = _ruta_seleccion(result, nivel)
+    if ruta == "una_llamada":
+        prompt = _prompt_seleccion_y_respuesta(pregunta, tipo_usuario, plan, emocion, emo_score, confianza_fuzzy, result, postdata)
+        with span("llm_una_llamada") as s:
+            salida = await REGISTRO.obtener("gateway_estructurado").ainvoke(
+                prompt, plantilla=lambda: _plantilla_estructurada(tipo_usuario, result, postdata))
+        tipo_problema_llm, solucion_llm, _, respuesta = _interpretar_seleccion_y_respuesta(salida, result)
+        _contar_ruta(ruta)
+        return tipo_problema_llm, solucion_llm, respuesta, s.duracion_s, ruta
+    if ruta == "llm_seleccion":
+        with span("llm_seleccion"):
+            seleccion = await aelegir_mejor_solucion_con_llm(pregunta, result, plan['categoria_ml'], emocion, REGISTRO.obtener("gateway_seleccion"))
+    _contar_ruta(ruta)
+    tipo_problema_llm, solucion_llm = seleccion[0], seleccion[1]
+    prompt_llm, respuesta = _respuesta_o_prompt(nivel, pregunta, tipo_usuario, plan, emocion, emo_score, confianza_fuzzy, seleccion, postdata)
+    if prompt_llm is None:
+        return tipo_problema_llm, solucion_llm, respuesta, 0, ruta
+    with span("llm_respuesta") as s:
+        respuesta = await REGISTRO.obtener("gateway_respuesta").ainvoke(
+            prompt_llm, plantilla=lambda: respuesta_plantilla(tipo_usuario, tipo_problema_llm, solucion_llm, postdata))
+    return tipo_problema_llm, solucion_llm, respuesta, s.duracion_s, ruta
+
+def _etapas_previas(test_id, pregunta, tipo_usuario):
+    """
+    Ejecuta planificación, emoción, lógica difusa, cache y Neo4j (todo lo anterior
+    a la respuesta final del LLM) y devuelve el contexto de la consulta.
+    """
+    ctx = {"test_id": test_id, "pregunta": pregunta, "tipo_usuario": tipo_usuario, "inicio": time.perf_counter()}
+    analisis = analizar_mensaje(pregunta)
+    plan = planificar_flujo(pregunta, tipo_usuario, [], analisis=analisis)
+    logger.info(f"PLANIFICACIÓN: {plan}")
+    ctx.update(analisis=analisis, plan=plan, cacheado=None)
+    if not plan["ejecutar_flujo_completo"]:
+        return ctx
+
+    # --- EJECUCIÓN DEL FLUJO COMPLETO ---
+    # keywords y match de dominio ya calculados por el planificador
+    keywords = analisis.keywords
+    kw_time = analisis.tiempos.get("keywords_ms", 0) / 1000
+    emocion, emo_score = _emocion_segun_nivel(pregunta)
+    confianza_fuzzy = fuzzy_problem_categorization(keywords)
+    emo_time, conf_time = _duracion_etapa("emocion"), _duracion_etapa("fuzzy")
+    ctx.update(keywords=keywords, kw_time=kw_time, emocion=emocion, emo_score=emo_score, emo_time=emo_time,
+               confianza_fuzzy=confianza_fuzzy, conf_time=conf_time)
+
+    with span("cache"):
+        clave_cache, cacheado, tipo_acierto = _buscar_en_cache(tipo_usuario, plan, keywords, emocion, analisis)
+    ctx.update(clave_cache=clave_cache, cacheado=cacheado, tipo_acierto=tipo_acierto)
+    if cacheado is not None:
+        return ctx
+
+    _, cypher_params = cypher_query(keywords, tipo_usuario)
+    logger.info(f"Cypher params: {cypher_params}")
+    with span("neo4j") as s:
+        result = REGISTRO.obtener("recuperador").consultar(keywords, tipo_usuario)
+    neo4j_time = s.duracion_s
+    matched_keys, confianza_fuzzy, postdata = _resumir_resultados(result, confianza_fuzzy)
+    ctx.update(result=result, neo4j_time=neo4j_time, matched_keys=matched_keys,
+               confianza_fuzzy=confianza_fuzzy, postdata=postdata)
+    return ctx
+
+def _respuesta_temprana(ctx, debug):
+    """Respuesta sin LLM (fallback de dominio o acierto de cache); None si hay que seguir."""
+    if not ctx["plan"]["ejecutar_flujo_completo"]:
+        return _responder_fallback(ctx["test_id"], ctx["pregunta"], ctx["tipo_usuario"], ctx["plan"])
+    if ctx["cacheado"] is not None:
+        return _responder_desde_cache(ctx["test_id"], ctx["pregunta"], ctx["tipo_usuario"], ctx["plan"], ctx["keywords"],
+                                      ctx["emocion"], ctx["cacheado"], ctx["tipo_acierto"],
+                                      _tiempos(ctx["kw_time"], ctx["emo_time"], ctx["conf_time"], 0, 0), debug)
+    return None
+
+def _seleccionar_para_contexto(ctx):
+    return _seleccionar_solucion(ctx["pregunta"], ctx["tipo_usuario"], ctx["plan"], ctx["result"], ctx["emocion"],
+                                 ctx["emo_score"], ctx["confianza_fuzzy"], ctx["postdata"])
+
+def _finalizar(ctx, tipo_problema_llm, solucion_llm, respuesta, llm_time, ruta_seleccion, debug, tiempos_extra=None):
+    tiempos = _tiempos(ctx["kw_time"], ctx["emo_time"], ctx["conf_time"], ctx["neo4j_time"], llm_time)
+    tiempos.update(tiempos_extra or {})
+    resultado_prueba = _resultado_prueba(
+        ctx["test_id"], ctx["pregunta"], ctx["tipo_usuario"], ctx["plan"], ctx["keywords"], ctx["emocion"], ctx["confianza_fuzzy"],
+        tipo_problema_llm, solucion_llm, ctx["matched_keys"], respuesta, tiempos, ruta_seleccion)
+    _registrar_resultado(resultado_prueba)
+    _guardar_en_cache(ctx["clave_cache"], ctx["analisis"], respuesta, tipo_problema_llm, solucion_llm, ctx["confianza_fuzzy"], ctx["matched_keys"])
+
+    if debug:
+        logger.info(f"[DEBUG] {json.dumps(resultado_prueba)}")
+    logger.info(f"[TEST {ctx['test_id']}] Completado")
+    return respuesta, ctx["keywords"], ctx["emocion"], ctx["confianza_fuzzy"]
+
+def generar_respuesta_streamlit(pregunta, tipo_usuario='Prestador', debug=False, nivel_servicio=None):
+    """
+    Pipeline completo para una consulta. `nivel_servicio` (ver degradacion.py)
+    fija el nivel; por defecto lo decide CONTROLADOR_DEGRADACION según la carga.
+    """
+    configurar_logging()
+    configurar_observabilidad()
     test_id = datetime.now().isoformat()
     logger.info(f"[TEST {test_id}] Iniciando - Usuario: {tipo_usuario}, Pregunta: {pregunta[:50]}...")
     try:
-        plan = planificar_flujo(pregunta, tipo_usuario, [])
-        logger.info(f"PLANIFICACIÓN: {plan}")
-
-        if not plan["ejecutar_flujo_completo"]:
-            respuesta = "Lo siento, no puedo ayudar con ese tipo de consulta."
-            resultado_prueba = {
-                "test_id": test_id,
-                "entrada": pregunta,
-                "tipo_usuario": tipo_usuario,
-                "categoria_predicha_ml": plan["categoria_ml"],
-                "confianza_ml": plan["confianza_ml"],
-                "keywords": plan["keywords"],
-                "plan": plan,
-                "respuesta": respuesta,
-            }
-            with open('resultados_pruebas.json', 'a') as f:
-                f.write(json.dumps(resultado_prueba) + '\n')
-            logger.info(f"[TEST {test_id}] Fallback por ML")
-            return respuesta, [], "N/A", plan["confianza_ml"]
-
-        # --- EJECUCIÓN DEL FLUJO COMPLETO ---
-        keywords, kw_time = detect_keywords(pregunta)
-        (emocion, emo_score), emo_time = detect_emotion(pregunta)
-        confianza_fuzzy, conf_time = fuzzy_problem_categorization(keywords)
-        kw_set = set(keywords or [])
-        domain_match = kw_set.intersection(DOMAIN_KEYWORDS)
-        if not domain_match:
-            logger.info(f"No domain keywords found. Skipping DB lookup.")
-            respuesta = "Lo siento, no puedo ayudar con ese tipo de consulta. "
-            tipo_problema = "No definido"
-            solucion = "No definida"
-            matched_keys = []
-            neo4j_time = 0
-            llm_time = 0
-        else:
-            cypher = cypher_query(keywords, tipo_usuario)
-            logger.info(f"Cypher query:\n{cypher}")
-            inicio_neo4j = time.time()
-            result = graph.query(cypher)
-            neo4j_time = time.time() - inicio_neo4j
-            tipo_problema = "No definido"
-            solucion = "No definida"
-            matched_keys = []
-            postdata = "No se encontró solución automática, te derivaremos a soporte. (weventlyempresa@gmail.com)"
-            if result:
-                r = result[0]
-                matched_count = int(r.get('matched_count', 0) or 0)
-                result_conf = float(r.get('confianza', 0) or 0)
-                matched_keys = r.get('matched_keywords', [])
-                if matched_count > 0:
-                    tipo_problema = r.get('tipo_problema', tipo_problema)
-                    solucion = r.get('solucion', solucion)
-                    confianza_fuzzy = max(confianza_fuzzy, result_conf)
-                    postdata = "Respuesta recomendada por nuestro sistema." if confianza_fuzzy >= 0.7 else "Respuesta tomada de la base de conocimiento (confianza baja, verificar manualmente)."
-            tipo_problema_llm, solucion_llm, elegido_result, justificacion_llm = elegir_mejor_solucion_con_llm(pregunta, result, plan['categoria_ml'], emocion, llm)
-            rd = role_details.get(tipo_usuario, role_details["Prestador"])
-            emotion_tone = EMOTION_TO_TONE.get(emocion, rd.get('tono', 'neutral'))
-            prompt_llm = (
-                f"Como asistente del sistema Wevently para la organización de eventos privados donde organizadores, prestadores de servicios y propietarios de lugar operan, contesta a la pregunta del usuario."
-                f"{rd['saludo']}Se detectó el problema: {tipo_problema_llm}. "
-                f"Solución sugerida: {solucion_llm + justificacion_llm}. "
-                f"Por favor responde en un tono {emotion_tone}. "
-                f"(Categoría ML: {plan['categoria_ml']}, Emoción detectada: {emocion}, score emoción: {emo_score:.2f}, confianza ML: {plan['confianza_ml']:.2f}, confianza fuzzy: {confianza_fuzzy:.2f}). "
-                f"Mensaje original: {pregunta}\n"
-                f"{rd['extra']}\n{postdata}"
-            )
-            inicio_llm = time.time()
-            respuesta = llm.invoke(prompt_llm)
-            llm_time = time.time() - inicio_llm
-
-        resultado_prueba = {
-            "test_id": test_id,
-            "entrada": pregunta,
-            "tipo_usuario": tipo_usuario,
-            "categoria_predicha_ml": plan["categoria_ml"],
-            "confianza_ml": plan["confianza_ml"],
-            "keywords": keywords,
-            "emocion": emocion,
-            "confianza_fuzzy": confianza_fuzzy,
-            "tipo_problema": tipo_problema_llm,
-            "solucion": solucion_llm,
-            "matched_keywords": matched_keys,
-            "respuesta": respuesta,
-            "plan": plan,
-            "tiempos": {
-                "keywords_ms": kw_time * 1000,
-                "emocion_ms": emo_time * 1000,
-                "fuzzy_ms": conf_time * 1000,
-                "neo4j_ms": neo4j_time * 1000 if domain_match else 0,
-                "llm_ms": llm_time * 1000 if domain_match else 0,
-                "total_ms": (kw_time + emo_time + conf_time + (neo4j_time if domain_match else 0) + (llm_time if domain_match else 0)) * 1000
-            }
-        }
-        with open('resultados_pruebas.json', 'a') as f:
-            f.write(json.dumps(resultado_prueba) + '\n')
-
-        if debug:
-            logger.info(f"[DEBUG] {json.dumps(resultado_prueba)}")
-        logger.info(f"[TEST {test_id}] Completado")
-        return respuesta, keywords, emocion, confianza_fuzzy
+        with _nivel_de_servicio(nivel_servicio), iniciar_traza(test_id), registrar_origenes():
+            ctx = _etapas_previas(test_id, pregunta, tipo_usuario)
+            temprana = _respuesta_temprana(ctx, debug)
+            if temprana is not None:
+                return temprana
+
+            tipo_problema_llm, solucion_llm, ruta_seleccion, prompt_llm, respuesta, llm_time = _seleccionar_para_contexto(ctx)
+            if prompt_llm is not None:
+                with span("llm_respuesta") as s:
+                    respuesta = REGISTRO.obtener("gateway_respuesta").invoke(prompt_llm, plantilla=_plantilla_contexto(ctx, tipo_problema_llm, solucion_llm))
+                llm_time = s.duracion_s
+            return _finalizar(ctx, tipo_problema_llm, solucion_llm, respuesta, llm_time, ruta_seleccion, debug)
+    except Exception as e:
+        logger.error(f"[TEST {test_id}] Error: {str(e)}", exc_info=True)
+        raise
+
+# --- Streaming ---
+class RespuestaStreaming:
+    """
+    Iterable de fragmentos de la respuesta a medida que llegan del LLM.
+    Al terminar la iteración, `resultado` tiene la misma tupla que
+    generar_respuesta_streamlit (respuesta completa, keywords, emoción, confianza).
+    """
+    def __init__(self, generador):
+        self._generador = generador
+        self.resultado = None
+
+    def __iter__(self):
+        self.resultado = yield from self._generador
+
+def _generar_stream(pregunta, tipo_usuario, debug, nivel_servicio):
+    configurar_logging()
+    configurar_observabilidad()
+    test_id = datetime.now().isoformat()
+    logger.info(f"[TEST {test_id}] Iniciando (stream) - Usuario: {tipo_usuario}, Pregunta: {pregunta[:50]}...")
+    try:
+        with _nivel_de_servicio(nivel_servicio), iniciar_traza(test_id), registrar_origenes():
+            ctx = _etapas_previas(test_id, pregunta, tipo_usuario)
+            temprana = _respuesta_temprana(ctx, debug)
+            if temprana is not None:
+                yield temprana[0]
+                return temprana
+
+            tipo_problema_llm, solucion_llm, ruta_seleccion, prompt_llm, respuesta, llm_time = _seleccionar_para_contexto(ctx)
+            tiempos_extra = {}
+            if prompt_llm is None:
+                # La ruta de una sola llamada devuelve JSON: se entrega la respuesta completa
+                tiempos_extra["ttft_ms"] = (time.perf_counter() - ctx["inicio"]) * 1000
+                yield respuesta
+            else:
+                fragmentos = []
+                with span("llm_respuesta") as s:
+                    plantilla = _plantilla_contexto(ctx, tipo_problema_llm, solucion_llm)
+                    for fragmento in REGISTRO.obtener("gateway_respuesta").stream(prompt_llm, plantilla=plantilla):
+                        if not fragmentos:
+                            tiempos_extra["ttft_ms"] = (time.perf_counter() - ctx["inicio"]) * 1000
+                            tiempos_extra["llm_ttft_ms"] = (time.perf_counter() - s.inicio) * 1000
+                        fragmentos.append(fragmento)
+                        yield fragmento
+                llm_time = s.duracion_s
+                respuesta = "".join(fragmentos)
+            # sin fragmentos (salida vacía del modelo) el primer "token" es el fin del stream
+            tiempos_extra.setdefault("ttft_ms", (time.perf_counter() - ctx["inicio"]) * 1000)
+            METRICAS.observar(METRICA_ETAPAS, tiempos_extra["ttft_ms"] / 1000, etapa="ttft")
+            return _finalizar(ctx, tipo_problema_llm, solucion_llm, respuesta, llm_time, ruta_seleccion, debug, tiempos_extra)
+    except Exception as e:
+        logger.error(f"[TEST {test_id}] Error: {str(e)}", exc_info=True)
+        raise
+
+def generar_respuesta_stream(pregunta, tipo_usuario='Prestador', debug=False, nivel_servicio=None):
+    """
+    Variante streaming de generar_respuesta_streamlit respaldada por `llm.stream`.
+    La respuesta completa se registra igual que en la versión bloqueante y
+    `tiempos` agrega `ttft_ms` (desde el inicio de la consulta) y `llm_ttft_ms`.
+    """
+    return RespuestaStreaming(_generar_stream(pregunta, tipo_usuario, debug, nivel_servicio))
+
+# --- Pipeline asíncrono ---
+async def _en_executor(func, *args):
+    # run_in_executor no propaga contextvars: se copia el contexto para conservar la traza
+    return await asyncio.get_running_loop().run_in_executor(None, en_contexto(func), *args)
+
+async def _consultar_neo4j_async(keywords, tipo_usuario):
+    with span("neo4j") as s:
+        result = await REGISTRO.obtener("recuperador").aconsultar(keywords, tipo_usuario)
+    return result, s.duracion_s
+
+async def agenerar_respuesta(pregunta, tipo_usuario='Prestador', debug=False, nivel_servicio=None):
+    """
+    Versión asíncrona de generar_respuesta_streamlit con el mismo retorno.
+
+    Tras el planificador, emoción (BETO), lógica difusa y la consulta a Neo4j
+    corren en paralelo; las dos llamadas al LLM usan `ainvoke`. Además del
+    desglose habitual, `tiempos` incluye `ruta_critica_ms` (tiempo de reloj).
+    """
+    configurar_logging()
+    configurar_observabilidad()
+    test_id = datetime.now().isoformat()
+    logger.info(f"[TEST {test_id}] Iniciando (async) - Usuario: {tipo_usuario}, Pregunta: {pregunta[:50]}...")
+    try:
+        with _nivel_de_servicio(nivel_servicio), iniciar_traza(test_id) as traza, registrar_origenes():
+            analisis = analizar_mensaje(pregunta)
+            plan = await _en_executor(lambda: planificar_flujo(pregunta, tipo_usuario, [], analisis=analisis))
+            logger.info(f"PLANIFICACIÓN: {plan}")
+
+            if not plan["ejecutar_flujo_completo"]:
+                return _responder_fallback(test_id, pregunta, tipo_usuario, plan)
+
+            keywords = analisis.keywords
+            kw_time = analisis.tiempos.get("keywords_ms", 0) / 1000
+            logger.info(f"Cypher params: {parametros_recuperacion(keywords, tipo_usuario)}")
+            # Neo4j arranca ya; si la cache responde, la consulta se cancela
+            tarea_neo4j = asyncio.ensure_future(_consultar_neo4j_async(keywords, tipo_usuario))
+            try:
+                (emocion, emo_score), confianza_fuzzy = await asyncio.gather(
+                    _en_executor(_emocion_segun_nivel, pregunta),
+                    _en_executor(fuzzy_problem_categorization, keywords),
+                )
+                emo_time, conf_time = traza.duracion_s("emocion"), traza.duracion_s("fuzzy")
+                with span("cache"):
+                    clave_cache, cacheado, tipo_acierto = _buscar_en_cache(tipo_usuario, plan, keywords, emocion, analisis)
+            except BaseException:
+                tarea_neo4j.cancel()
+                raise
+            if cacheado is not None:
+                tarea_neo4j.cancel()
+                tiempos = _tiempos(kw_time, emo_time, conf_time, 0, 0)
+                tiempos["ruta_critica_ms"] = (time.perf_counter() - traza.inicio) * 1000
+                return _responder_desde_cache(test_id, pregunta, tipo_usuario, plan, keywords, emocion, cacheado, tipo_acierto,
+                                              tiempos, debug)
+            result, neo4j_time = await tarea_neo4j
+            matched_keys, confianza_fuzzy, postdata = _resumir_resultados(result, confianza_fuzzy)
+
+            tipo_problema_llm, solucion_llm, respuesta, llm_time, ruta_seleccion = await _aresolver_respuesta(
+                pregunta, tipo_usuario, plan, result, emocion, emo_score, confianza_fuzzy, postdata)
+
+            tiempos = _tiempos(kw_time, emo_time, conf_time, neo4j_time, llm_time)
+            tiempos["ruta_critica_ms"] = (time.perf_counter() - traza.inicio) * 1000
+            resultado_prueba = _resultado_prueba(
+                test_id, pregunta, tipo_usuario, plan, keywords, emocion, confianza_fuzzy,
+                tipo_problema_llm, solucion_llm, matched_keys, respuesta, tiempos, ruta_seleccion)
+            _registrar_resultado(resultado_prueba)
+            _guardar_en_cache(clave_cache, analisis, respuesta, tipo_problema_llm, solucion_llm, confianza_fuzzy, matched_keys)
+
+            if debug:
+                logger.info(f"[DEBUG] {json.dumps(resultado_prueba)}")
+            logger.info(f"[TEST {test_id}] Completado (async)")
+            return respuesta, keywords, emocion, confianza_fuzzy
     except Exception as e:
         logger.error(f"[TEST {test_id}] Error: {str(e)}", exc_info=True)
         raise
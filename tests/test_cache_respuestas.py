@@ -0,0 +1,72 @@
+from scipy.sparse import csr_matrix
+from cache_respuestas import CacheRespuestas, clave_intencion
+
+
+def _valor(texto):
+    return {"respuesta": texto, "tipo_problema": "Demora", "solucion": "Esperar", "confianza_fuzzy": 0.8, "matched_keywords": ["pago"]}
+
+
+def test_clave_normaliza_orden_y_emocion():
+    a = clave_intencion("Prestador", "ProblemaPago", ["pago", "acreditar", "pago"], "enojo")
+    b = clave_intencion("Prestador", "ProblemaPago", ["acreditar", "pago"], "asco")
+    assert a == b
+
+
+def test_lru_respeta_maximo_de_entradas():
+    cache = CacheRespuestas(max_entradas=2, ttl_s=60, max_bytes=10**6, umbral_similitud=None)
+    claves = [clave_intencion("Prestador", "ProblemaPago", [kw], "enojo") for kw in ("a", "b", "c")]
+    for clave in claves:
+        cache.guardar(clave, _valor(clave[2][0]))
+    assert cache.obtener(claves[0]) == (None, None)
+    assert cache.obtener(claves[2])[1] == "exacto"
+    stats = cache.estadisticas()
+    assert stats["entradas"] == 2 and stats["bytes_usados"] > 0
+
+
+def test_nivel_similar_por_coseno_tfidf():
+    cache = CacheRespuestas(max_entradas=10, ttl_s=60, max_bytes=10**6, umbral_similitud=0.9)
+    v1 = csr_matrix([[0.6, 0.8, 0.0]])
+    v2 = csr_matrix([[0.62, 0.78, 0.0]])
+    cache.guardar(clave_intencion("Organizador", "ProblemaPago", ["pago"], "miedo"), _valor("ok"), v1)
+    valor, tipo = cache.obtener(clave_intencion("Organizador", "ProblemaPago", ["pagar"], "tristeza"), v2)
+    assert tipo == "similar" and valor["respuesta"] == "ok"
+    cache.invalidar()
+    assert cache.estadisticas()["entradas"] == 0
+
+
+def test_similitud_se_calcula_fuera_del_lock():
+    cache = CacheRespuestas(max_entradas=10, ttl_s=60, max_bytes=10**6, umbral_similitud=0.9)
+    guardada = clave_intencion("Organizador", "ProblemaPago", ["pago"], "miedo")
+    cache.guardar(guardada, _valor("vieja"), csr_matrix([[0.6, 0.8, 0.0]]))
+
+    class VectorQueReemplaza:
+        def multiply(self, otro):
+            # con el lock tomado esto se bloquearía; además reemplaza la entrada comparada
+            cache.guardar(guardada, _valor("nueva"))
+            return otro
+
+    assert cache.obtener(clave_intencion("Organizador", "ProblemaPago", ["pagar"], "miedo"), VectorQueReemplaza()) == (None, None)
+    assert cache.obtener(guardada) == (_valor("nueva"), "exacto")
+
+
+def test_vigilar_invalida_cuando_cambia_el_grafo():
+    class SnapshotFalso:
+        vigente = False
+
+        def __init__(self):
+            self.observadores = []
+            self.refrescos = 0
+
+        def refrescar_en_segundo_plano(self):
+            self.refrescos += 1
+            for observador in self.observadores:
+                observador("otra_huella")
+
+    snapshot = SnapshotFalso()
+    cache = CacheRespuestas(max_entradas=10, ttl_s=60, max_bytes=10**6, umbral_similitud=None)
+    cache.vigilar(snapshot)
+    clave = clave_intencion("Prestador", "ProblemaPago", ["pago"], "enojo")
+    cache.guardar(clave, _valor("ok"))
+    # el snapshot vencido se revisa en la consulta aunque la respuesta estuviera en cache
+    assert cache.obtener(clave) == (None, None)
+    assert snapshot.refrescos == 1 and cache.estadisticas()["invalidaciones"] == 1
@@ -0,0 +1,42 @@
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import pytest
+from cliente_api import consultar_api, ErrorAPI
+
+
+class _Manejador(BaseHTTPRequestHandler):
+    def do_POST(self):
+        datos = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if datos["mensaje"] == "saturado":
+            self.send_response(503)
+            self.end_headers()
+            return
+        cuerpo = json.dumps({"respuesta": "ok " + datos["tipo_usuario"], "keywords": ["pago"], "emocion": "enojo",
+                             "confianza": 0.9, "timestamp": "t"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, *_):
+        pass
+
+
+@pytest.fixture
+def url_api():
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), _Manejador)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{servidor.server_address[1]}"
+    servidor.shutdown()
+
+
+def test_devuelve_la_tupla_del_pipeline(url_api):
+    assert consultar_api(url_api, "mi pago", "Organizador") == ("ok Organizador", ["pago"], "enojo", 0.9)
+
+
+def test_503_se_informa_como_servicio_ocupado(url_api):
+    with pytest.raises(ErrorAPI) as error:
+        consultar_api(url_api, "saturado", "Prestador")
+    assert error.value.estado == 503
@@ -0,0 +1,126 @@
+import pytest
+
+from degradacion import ControladorDegradacion, NIVELES, nivel_actual, nivel_al_menos, servir_con_nivel
+
+
+class Reloj:
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+
+def _controlador(**kwargs):
+    reloj = Reloj()
+    opciones = dict(max_en_vuelo=2, latencia_objetivo_s=1.0, alfa=0.5, histeresis=0.3, enfriamiento_s=10,
+                    activo=True, muestras_minimas=1, descartar_iniciales=0, reloj=reloj)
+    opciones.update(kwargs)
+    return ControladorDegradacion(**opciones), reloj
+
+
+def test_baja_de_nivel_con_las_consultas_en_vuelo():
+    c, _ = _controlador()
+    niveles = [c.entrar() for _ in range(5)]
+    # 1/2, 2/2 -> completo; 3/2 -> sin_emocion; 4/2 = 2.0 (no supera) -> sin_seleccion_llm; 5/2 -> plantilla
+    assert niveles == ["completo", "completo", "sin_emocion", "sin_seleccion_llm", "plantilla"]
+    assert c.estadisticas()["por_nivel"] == {"completo": 2, "sin_emocion": 1, "sin_seleccion_llm": 1, "plantilla": 1}
+
+
+def test_latencia_alta_salta_varios_niveles():
+    c, _ = _controlador()
+    c.entrar()
+    c.salir(0.0)
+    c.entrar()
+    c.salir(5.0)  # recortada a 3s: EWMA 1.5s contra objetivo de 1s
+    assert c.nivel == "sin_emocion"
+    c.entrar()
+    c.salir(5.0)  # EWMA 2.25s
+    assert c.nivel == "plantilla"
+
+
+def test_arranque_en_frio_no_degrada_un_proceso_ocioso():
+    c, _ = _controlador(muestras_minimas=3, descartar_iniciales=1)
+    c.entrar()
+    c.salir(60.0)  # primera consulta: carga de modelos, no entra a la EWMA
+    assert c.nivel == "completo" and c.latencia_ewma_s is None
+    for _ in range(2):
+        c.entrar()
+        c.salir(2.5)
+        assert c.nivel == "completo"  # todavía sin muestras suficientes
+    c.entrar()
+    c.salir(2.5)
+    assert c.nivel == "plantilla"
+    assert c.estadisticas()["muestras_latencia"] == 3
+
+
+def test_recupera_de_a_un_nivel_con_histeresis_y_enfriamiento():
+    c, reloj = _controlador()
+    c.entrar()
+    c.salir(2.6)
+    assert c.nivel == "plantilla"
+    # latencias rápidas: la EWMA baja pero el enfriamiento todavía no pasó
+    for _ in range(6):
+        c.entrar()
+        c.salir(0.01)
+    assert c.nivel == "plantilla"
+    recorrido = []
+    for _ in range(3):
+        reloj.t += 10
+        c.entrar()
+        c.salir(0.01)
+        recorrido.append(c.nivel)
+    assert recorrido == ["sin_seleccion_llm", "sin_emocion", "completo"]
+
+
+def test_histeresis_evita_oscilar_en_el_umbral():
+    c, reloj = _controlador()
+    c.entrar()
+    c.salir(1.2)
+    assert c.nivel == "sin_emocion"
+    reloj.t += 60
+    c.entrar()
+    c.salir(0.9)  # EWMA 1.05: por debajo de 1.5 pero no de 1.0 * 0.7
+    assert c.nivel == "sin_emocion"
+
+
+def test_controlador_inactivo_sirve_siempre_completo():
+    c, _ = _controlador(activo=False)
+    assert {c.entrar() for _ in range(10)} == {"completo"}
+
+
+def test_nivel_de_la_consulta_actual():
+    assert nivel_actual() == "completo"
+    with servir_con_nivel("plantilla"):
+        assert nivel_actual() == "plantilla"
+        assert nivel_al_menos(nivel_actual(), "sin_emocion")
+    assert nivel_actual() == NIVELES[0]
+    with pytest.raises(ValueError):
+        with servir_con_nivel("minimo"):
+            pass
+
+
+CANDIDATOS = [
+    {"tipo_problema": "Tarjeta rechazada", "solucion": "Verificar los datos de la tarjeta.", "has_type": 1, "matched_count": 2, "confianza": 0.8},
+    {"tipo_problema": "Pago duplicado", "solucion": "Solicitar el reintegro.", "has_type": 1, "matched_count": 2, "confianza": 0.8},
+]
+
+
+def _seleccionar(wl):
+    plan = {"categoria_ml": "ProblemaPago", "confianza_ml": 0.9}
+    return wl._seleccionar_solucion("me cobraron dos veces", "Organizador", plan, CANDIDATOS, "neutral", 0.0, 0.8,
+                                    "Respuesta recomendada por nuestro sistema.")
+
+
+def test_niveles_degradados_no_llaman_al_llm_de_seleccion():
+    import wevently_langchain as wl
+    with servir_con_nivel("sin_seleccion_llm"):
+        tipo_problema, solucion, ruta, prompt, respuesta, _ = _seleccionar(wl)
+    assert (tipo_problema, ruta, respuesta) == ("Tarjeta rechazada", "mejor_rankeado", None)
+    assert prompt is not None and "Verificar los datos de la tarjeta." in prompt
+
+    with servir_con_nivel("plantilla"):
+        tipo_problema, solucion, ruta, prompt, respuesta, llm_time = _seleccionar(wl)
+    assert prompt is None and llm_time == 0
+    assert respuesta.startswith(wl.role_details["Organizador"]["saludo"])
+    assert "Verificar los datos de la tarjeta." in respuesta
@@ -0,0 +1,100 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from concurrent.futures.process import BrokenProcessPool
+from despachador import DespachadorConsultas, ServicioSaturado, TiempoAgotado, PoolReiniciando
+
+
+def _despachador(funcion, max_concurrencia=2, max_cola=2, timeout_s=5):
+    return DespachadorConsultas(ThreadPoolExecutor(4), funcion, max_concurrencia, max_cola, timeout_s)
+
+
+def test_consultas_identicas_en_vuelo_se_ejecutan_una_vez():
+    llamadas = []
+
+    def procesar(mensaje, tipo_usuario):
+        llamadas.append(mensaje)
+        time.sleep(0.05)
+        return mensaje.upper()
+
+    async def escenario():
+        d = _despachador(procesar)
+        resultados = await asyncio.gather(
+            d.resolver("mi pago", "Prestador"), d.resolver("mi  pago ", "Prestador"), d.resolver("mi pago", "Organizador"))
+        return d, resultados
+
+    d, resultados = asyncio.run(escenario())
+    assert len(llamadas) == 2
+    assert [c for _, c in resultados] == [False, True, False]
+    assert d.estadisticas()["coalescidas"] == 1 and d.estadisticas()["pendientes"] == 0
+
+
+def test_rechaza_cuando_se_llenan_ejecucion_y_cola():
+    liberar = threading.Event()
+
+    def procesar(mensaje, tipo_usuario):
+        liberar.wait(2)
+        return mensaje
+
+    async def escenario():
+        d = _despachador(procesar, max_concurrencia=1, max_cola=1)
+        primeras = [asyncio.ensure_future(d.resolver(m, "Prestador")) for m in ("a", "b")]
+        await asyncio.sleep(0.01)
+        with pytest.raises(ServicioSaturado):
+            await d.resolver("c", "Prestador")
+        liberar.set()
+        return d, await asyncio.gather(*primeras)
+
+    d, resultados = asyncio.run(escenario())
+    assert [r for r, _ in resultados] == ["a", "b"]
+    assert d.estadisticas()["rechazadas"] == 1
+
+
+def test_timeout_no_libera_el_lugar_hasta_que_termina_el_worker():
+    def procesar(mensaje, tipo_usuario):
+        time.sleep(0.2)
+        return mensaje
+
+    async def escenario():
+        d = _despachador(procesar, max_concurrencia=1, max_cola=0, timeout_s=0.05)
+        with pytest.raises(TiempoAgotado):
+            await d.resolver("lento", "Prestador")
+        with pytest.raises(ServicioSaturado):
+            await d.resolver("otro", "Prestador")
+        await asyncio.sleep(0.25)
+        d.timeout_s = 1
+        return d, await d.resolver("otro", "Prestador")
+
+    d, (resultado, _) = asyncio.run(escenario())
+    assert resultado == "otro"
+    assert d.estadisticas()["timeouts"] == 1
+
+
+def test_pool_roto_se_reconstruye_y_no_esta_disponible_mientras_tanto():
+    def procesar(mensaje, tipo_usuario):
+        if mensaje == "mata al worker":
+            raise BrokenProcessPool("worker terminado")
+        return mensaje
+
+    async def escenario():
+        reconstruido = asyncio.Event()
+
+        async def reconstruir():
+            await reconstruido.wait()
+            return ThreadPoolExecutor(2)
+
+        d = DespachadorConsultas(ThreadPoolExecutor(2), procesar, 2, 2, 5, reconstruir=reconstruir)
+        with pytest.raises(PoolReiniciando):
+            await d.resolver("mata al worker", "Prestador")
+        assert not d.disponible
+        with pytest.raises(PoolReiniciando):
+            await d.resolver("otra", "Prestador")
+        reconstruido.set()
+        await asyncio.sleep(0.01)
+        return d, await d.resolver("otra", "Prestador")
+
+    d, (resultado, _) = asyncio.run(escenario())
+    assert resultado == "otra"
+    assert d.disponible and d.estadisticas()["reconstrucciones"] == 1
@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+from emocion_backends import crear_backend, _softmax
+
+
+def test_backend_desconocido():
+    with pytest.raises(ValueError):
+        crear_backend("tensorrt", tokenizer=None, cargar_modelo=lambda: None)
+
+
+def test_softmax_estable_con_logits_grandes():
+    probas = _softmax(np.array([[1000.0, 1000.0, 0.0], [1.0, 2.0, 3.0]]))
+    assert np.allclose(probas.sum(axis=1), 1.0)
+    assert probas[0, 0] == pytest.approx(0.5)
+
+
+def test_onnx_no_carga_el_modelo_pytorch_si_falta_onnxruntime():
+    try:
+        import onnxruntime  # noqa: F401
+        pytest.skip("onnxruntime instalado")
+    except ImportError:
+        pass
+
+    def cargar_modelo():
+        raise AssertionError("no debería cargarse el modelo PyTorch")
+
+    with pytest.raises(ImportError):
+        crear_backend("onnx", tokenizer=None, cargar_modelo=cargar_modelo)
+
+
+class TokenizerDoble:
+    """Palabras -> ids por hash, con padding: alcanza para un BERT mínimo."""
+    def __call__(self, textos, return_tensors="pt", truncation=True, max_length=128, padding=True):
+        import torch
+        ids = [[1 + sum(map(ord, p)) % 97 for p in t.split()][:max_length] for t in textos]
+        largo = max(len(i) for i in ids)
+        return {
+            "input_ids": torch.tensor([i + [0] * (largo - len(i)) for i in ids]),
+            "attention_mask": torch.tensor([[1] * len(i) + [0] * (largo - len(i)) for i in ids]),
+        }
+
+
+def _bert_minimo():
+    torch = pytest.importorskip("torch")
+    transformers = pytest.importorskip("transformers")
+    torch.manual_seed(0)
+    config = transformers.BertConfig(vocab_size=100, hidden_size=32, num_hidden_layers=2, num_attention_heads=2,
+                                     intermediate_size=64, num_labels=4)
+    return transformers.BertForSequenceClassification(config)
+
+
+def test_int8_coincide_en_etiquetas_con_fp32():
+    modelo = _bert_minimo()
+    textos = [f"me cobraron {i} veces el pago del evento {i * 7}" for i in range(40)]
+    fp32 = crear_backend("pytorch", TokenizerDoble(), lambda: modelo).probabilidades(textos)
+    int8 = crear_backend("pytorch_int8", TokenizerDoble(), lambda: modelo).probabilidades(textos)
+    # mismo criterio que benchmarks/paridad_emocion.py, con margen para pesos aleatorios
+    assert (fp32.argmax(axis=1) == int8.argmax(axis=1)).mean() >= 0.9
+    assert np.abs(fp32 - int8).max() < 0.1
+
+
+def test_int8_no_retiene_el_modelo_fp32(monkeypatch):
+    import gc
+    import weakref
+    pytest.importorskip("torch")
+    pytest.importorskip("transformers")
+    import wevently_langchain as wl
+    referencias = []
+
+    def cargar_fp32():
+        modelo = _bert_minimo()
+        referencias.append(weakref.ref(modelo))
+        return modelo
+
+    monkeypatch.setattr(wl, "_cargar_emo_model", cargar_fp32)
+    monkeypatch.setattr(wl, "EMOCION_BACKEND", "pytorch_int8")
+    monkeypatch.setitem(wl.REGISTRO._instancias, "tokenizer", TokenizerDoble())
+    backend = wl._cargar_emo_backend()
+    gc.collect()
+    assert referencias and referencias[0]() is None
+    assert not wl.REGISTRO.cargado("emo_model")
+    assert backend.probabilidades(["me rechazaron el pago"]).shape == (1, 4)
+
+
+def test_backend_no_registra_el_modelo_que_solo_usa_para_construirse(monkeypatch):
+    import gc
+    import weakref
+    import wevently_langchain as wl
+
+    class Modelo:
+        pass
+
+    referencias = []
+
+    def cargar_fp32():
+        modelo = Modelo()
+        referencias.append(weakref.ref(modelo))
+        return modelo
+
+    def crear_backend_doble(nombre, tokenizer, cargar_modelo):
+        cargar_modelo()
+        return object()
+
+    monkeypatch.setattr(wl, "_cargar_emo_model", cargar_fp32)
+    monkeypatch.setattr(wl, "crear_backend", crear_backend_doble)
+    monkeypatch.setattr(wl, "EMOCION_BACKEND", "onnx_int8")
+    monkeypatch.setitem(wl.REGISTRO._instancias, "tokenizer", object())
+    wl._cargar_emo_backend()
+    gc.collect()
+    assert referencias[0]() is None and not wl.REGISTRO.cargado("emo_model")
@@ -0,0 +1,72 @@
+from recuperacion_kg import CYPHER_RECUPERACION, CYPHER_RECUPERACION_INDEXADA
+from esquema_kg import (INDICES, INDICE_NOMBRE_LOWER, CYPHER_ESTADO_INDICES, CYPHER_PENDIENTES_NORMALIZAR,
+                        consulta_recuperacion, resumir_perfil, regresiones)
+
+
+class GraphEsquema:
+    def __init__(self, estado="ONLINE", pendientes=0, falla=False):
+        self.estado, self.pendientes, self.falla = estado, pendientes, falla
+
+    def query(self, cypher, params=None):
+        if self.falla:
+            raise RuntimeError("SHOW INDEXES no soportado")
+        if cypher == CYPHER_ESTADO_INDICES:
+            return [{"name": n, "state": self.estado} for n in INDICES if self.estado]
+        if cypher == CYPHER_PENDIENTES_NORMALIZAR:
+            return [{"pendientes": self.pendientes}]
+        raise AssertionError(cypher)
+
+
+def test_consulta_indexada_busca_por_nombre_lower():
+    assert "{nombre_lower: kw}" in CYPHER_RECUPERACION_INDEXADA
+    assert "toLower" not in CYPHER_RECUPERACION_INDEXADA
+    # el resto de la consulta (candidatos y orden) es idéntico
+    assert CYPHER_RECUPERACION_INDEXADA.split("kw})")[1] == CYPHER_RECUPERACION.split("= kw")[1]
+
+
+def test_usa_el_indice_solo_si_esta_listo_y_normalizado():
+    assert consulta_recuperacion(GraphEsquema()) == CYPHER_RECUPERACION_INDEXADA
+    assert consulta_recuperacion(GraphEsquema(estado="POPULATING")) == CYPHER_RECUPERACION
+    assert consulta_recuperacion(GraphEsquema(estado=None)) == CYPHER_RECUPERACION
+    assert consulta_recuperacion(GraphEsquema(pendientes=3)) == CYPHER_RECUPERACION
+    assert consulta_recuperacion(GraphEsquema(falla=True)) == CYPHER_RECUPERACION
+
+
+def _perfil(operador_busqueda, hits):
+    return {"operatorType": "ProduceResults@neo4j", "dbHits": 0, "rows": 2, "children": [
+        {"operatorType": "Expand(All)@neo4j", "dbHits": 10, "rows": 4, "children": [
+            {"operatorType": f"{operador_busqueda}@neo4j", "dbHits": hits, "rows": 3, "children": []}]}]}
+
+
+def test_regresion_por_forma_del_plan_y_db_hits():
+    base = resumir_perfil(_perfil("NodeIndexSeek", 6))
+    assert base["db_hits"] == 16 and "NodeIndexSeek" in base["operadores"]
+    assert regresiones(resumir_perfil(_perfil("NodeIndexSeek", 8)), base, tolerancia=0.2) == []
+    assert any("db hits" in p for p in regresiones(resumir_perfil(_perfil("NodeIndexSeek", 20)), base))
+    problemas = regresiones(resumir_perfil(_perfil("NodeByLabelScan", 6)), base)
+    assert any("NodeByLabelScan" in p for p in problemas) and any("NodeIndexSeek" in p for p in problemas)
+    assert INDICE_NOMBRE_LOWER in INDICES
+
+
+def test_recuperador_revisa_la_consulta_periodicamente():
+    import time
+    from recuperacion_kg import RecuperadorCypher
+
+    class GraphConRecuperacion(GraphEsquema):
+        def query(self, cypher, params=None):
+            if cypher in (CYPHER_RECUPERACION, CYPHER_RECUPERACION_INDEXADA):
+                return []
+            return super().query(cypher, params)
+
+    graph = GraphConRecuperacion()
+    recuperador = RecuperadorCypher(graph, elegir_cypher=lambda: consulta_recuperacion(graph), revision_s=0)
+    assert recuperador.cypher == CYPHER_RECUPERACION_INDEXADA
+    # se cargaron PalabraClave sin nombre_lower: la próxima revisión vuelve a toLower
+    graph.pendientes = 2
+    recuperador.consultar(["pago"], "Prestador")
+    for _ in range(100):
+        if recuperador.cypher == CYPHER_RECUPERACION and not recuperador._revisando:
+            break
+        time.sleep(0.01)
+    assert recuperador.cypher == CYPHER_RECUPERACION
+    assert recuperador.estadisticas()["consulta_indexada"] is False
@@ -0,0 +1,50 @@
+from filtro_dominio import AutomataDominio, plegar, raiz
+
+
+def test_plegado_y_raices():
+    assert plegar("Transacción ÑANDÚ") == "transaccion nandu"
+    assert raiz("acreditación") == raiz("acreditar") == "acredit"
+    assert raiz("comisiones") == "comision"
+
+
+def test_automata_coincide_formas_flexionadas_y_sin_tildes():
+    automata = AutomataDominio({"pago", "pagar", "pagué", "rechazar", "transacción", "no"}, excluir={"no"})
+    assert automata.coincidencias_texto("Me RECHAZARON el pagó de la transaccion") == {"rechazaron", "pago", "transaccion"}
+    assert automata.coincidencias_texto("No sé nada de eso") == set()
+    assert automata.coincidencias(["pagar", "hola"]) == {"pagar"}
+
+
+def test_planificador_rechaza_sin_spacy_ni_clasificador():
+    import wevently_langchain as wl
+    plan = wl.planificar_flujo("¿Quién ganó el partido de ayer?", "Organizador", [])
+    assert plan["ejecutar_flujo_completo"] is False
+    assert plan["nivel_rechazo"] == "automata"
+    assert set(plan["niveles_ms"]) == {"automata"}
+    assert not wl.REGISTRO.cargado("nlp") and not wl.REGISTRO.cargado("modelo_rf")
+
+
+def test_automata_no_acepta_palabras_que_solo_empiezan_con_una_raiz():
+    import wevently_langchain as wl
+    automata = wl.AUTOMATA_DOMINIO
+    for texto in ("hola Andrés, mira esta página", "el andamio", "la cobra del zoológico",
+                  "la falla geológica", "el servicial mozo"):
+        assert automata.coincidencias_texto(texto) == set(), texto
+    assert automata.coincidencias_texto("no anda el pago, me pagaron dos servicios") == {"anda", "pago", "pagaron", "servicios"}
+
+
+def test_lemas_se_comparan_exactos_contra_las_palabras_clave():
+    automata = AutomataDominio({"servicio", "transacción", "rechazar"})
+    assert automata.coincidencias(["servicial", "transaccion", "rechazo", "Rechazar"]) == {"transaccion", "Rechazar"}
+
+
+def test_automata_no_rechaza_lo_que_el_filtro_de_lemas_aceptaria():
+    import wevently_langchain as wl
+    automata = wl.AUTOMATA_DOMINIO
+    # (forma, lema que daría spaCy): si el lema está en el dominio, el nivel barato no puede rechazarla
+    formas = [("pagaste", "pagar"), ("pagaría", "pagar"), ("pagarle", "pagar"), ("acreditaría", "acreditar"),
+              ("pagué", "pagar"), ("paguen", "pagar"), ("pagó", "pagar"), ("pagaremos", "pagar"),
+              ("pagándole", "pagar"), ("acreditaron", "acreditar"), ("acreditárselo", "acreditar"),
+              ("acreditase", "acreditar"), ("pagábamos", "pagar")]
+    for forma, lema in formas:
+        assert automata.coincidencias([lema]), lema
+        assert automata.coincidencias_texto(f"no me {forma} nada") == {plegar(forma)}, forma
@@ -0,0 +1,43 @@
+from historial_chat import HistorialChat, html_burbujas
+
+
+def _msg(i, respuesta="ok"):
+    return {"usuario": "Prestador", "mensaje": f"consulta {i}", "respuesta": respuesta,
+            "keywords": ["pago"], "emocion": "neutral", "confianza": 0.5, "hora": "10:00"}
+
+
+def test_descarta_los_mensajes_mas_antiguos_al_superar_el_maximo():
+    historial = HistorialChat(max_mensajes=3, mensajes=[_msg(i) for i in range(5)])
+    assert len(historial) == 3
+    assert [m["mensaje"] for m in historial.mensajes()] == ["consulta 2", "consulta 3", "consulta 4"]
+
+
+def test_ventana_muestra_solo_los_ultimos_en_orden():
+    historial = HistorialChat(mensajes=[_msg(i) for i in range(10)])
+    html = historial.html_ventana(2)
+    assert "consulta 7" not in html
+    assert html.index("consulta 8") < html.index("consulta 9")
+    assert historial.html_ventana(50).count("bubble-user") == 10
+
+
+def test_burbuja_sanitizada_al_agregar():
+    html = html_burbujas(_msg(1, respuesta="<script>x</script>hola"))
+    assert "<script>" not in html and "xhola" in html
+
+
+def test_limpiador_incremental_equivale_a_limpiar_el_texto_completo():
+    from historial_chat import LimpiadorHTMLIncremental, strip_html_tags
+    texto = "Hola <b>organizador</b>, revisá <a href='x'>el pago</a> y 3 < 5 listo"
+    limpiador = LimpiadorHTMLIncremental()
+    salida = "".join(limpiador.feed(texto[i:i + 3]) for i in range(0, len(texto), 3)) + limpiador.flush()
+    assert salida == strip_html_tags(texto)
+
+
+def test_limpiador_libera_un_menor_sin_cerrar():
+    from historial_chat import LimpiadorHTMLIncremental
+    limpiador = LimpiadorHTMLIncremental(max_retenido=10)
+    assert limpiador.feed("precio < 100") == "precio "
+    assert limpiador.feed(" pesos por persona") == "< 100 pesos por persona"
+    assert limpiador.pendiente == ""
+    limpiador.feed("fin <")
+    assert limpiador.flush() == "<"
@@ -0,0 +1,43 @@
+import threading
+from inferencia_batch import MicroBatcher
+
+
+def test_micro_batcher_agrupa_pedidos_concurrentes():
+    lotes = []
+
+    def procesar(textos):
+        lotes.append(list(textos))
+        return [t.upper() for t in textos]
+
+    batcher = MicroBatcher(procesar, max_batch_size=8, max_wait_ms=50, nombre="test")
+    barrera = threading.Barrier(8)
+    futuros = [None] * 8
+
+    def pedir(i):
+        barrera.wait()
+        futuros[i] = batcher.submit(f"msg{i}")
+
+    hilos = [threading.Thread(target=pedir, args=(i,)) for i in range(8)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+
+    assert [f.result(timeout=2) for f in futuros] == [f"MSG{i}" for i in range(8)]
+    assert len(lotes) < 8, "Los pedidos concurrentes deben procesarse en lotes."
+    assert max(len(l) for l in lotes) <= 8
+    batcher.cerrar(timeout=2)
+
+
+def test_micro_batcher_propaga_errores_a_cada_futuro():
+    def procesar(textos):
+        raise ValueError("falla de modelo")
+
+    batcher = MicroBatcher(procesar, max_batch_size=4, max_wait_ms=1, nombre="test-error")
+    futuro = batcher.submit("hola")
+    try:
+        futuro.result(timeout=2)
+        assert False, "Se esperaba la excepción del lote."
+    except ValueError as e:
+        assert "falla de modelo" in str(e)
+    batcher.cerrar(timeout=2)
@@ -0,0 +1,135 @@
+import time
+import asyncio
+import threading
+import pytest
+from llm_gateway import (GatewayLLM, CircuitBreaker, LLMNoDisponible, ABIERTO, SEMIABIERTO, CERRADO,
+                         registrar_origenes, respondio_el_primario)
+
+
+class LLMDoble:
+    """invoke/ainvoke/stream con demoras por llamada y fallos opcionales."""
+    def __init__(self, respuesta="ok", demoras=(0,), falla=False):
+        self.respuesta, self.demoras, self.falla = respuesta, list(demoras), falla
+        self.llamadas = 0
+        self._lock = threading.Lock()
+
+    def _demora(self):
+        with self._lock:
+            self.llamadas += 1
+            return self.demoras[min(self.llamadas, len(self.demoras)) - 1]
+
+    def invoke(self, prompt):
+        time.sleep(self._demora())
+        if self.falla:
+            raise ConnectionError("endpoint caído")
+        return self.respuesta
+
+    async def ainvoke(self, prompt):
+        await asyncio.sleep(self._demora())
+        if self.falla:
+            raise ConnectionError("endpoint caído")
+        return self.respuesta
+
+    def stream(self, prompt):
+        time.sleep(self._demora())
+        if self.falla:
+            raise ConnectionError("endpoint caído")
+        yield from self.respuesta.split(" ")
+
+
+def _gateway(primario, **kwargs):
+    kwargs.setdefault("breaker", CircuitBreaker(umbral_fallos=2, enfriamiento_s=60, nombre="test"))
+    kwargs.setdefault("hedge", False)
+    return GatewayLLM(primario, plazo_s=kwargs.pop("plazo_s", 1.0), plazo_respaldo_s=1.0, **kwargs)
+
+
+def test_circuito_se_abre_y_deja_de_llamar_al_remoto():
+    ahora = [0.0]
+    primario = LLMDoble(falla=True)
+    gateway = _gateway(primario, breaker=CircuitBreaker(umbral_fallos=2, enfriamiento_s=30, nombre="t", reloj=lambda: ahora[0]))
+    assert [gateway.invoke("p", plantilla="plantilla") for _ in range(4)] == ["plantilla"] * 4
+    assert primario.llamadas == 2 and gateway.breaker.estado == ABIERTO
+    assert gateway.estadisticas()["circuito_abierto"] == 2
+
+    ahora[0] = 31.0
+    primario.falla = False
+    assert gateway.invoke("p") == "ok"
+    assert gateway.breaker.estado == CERRADO
+
+
+def test_semiabierto_deja_pasar_una_sola_prueba():
+    ahora = [0.0]
+    breaker = CircuitBreaker(umbral_fallos=1, enfriamiento_s=10, nombre="t", reloj=lambda: ahora[0])
+    breaker.registrar_fallo()
+    ahora[0] = 10.0
+    assert breaker.permitir() and breaker.estado == SEMIABIERTO
+    assert not breaker.permitir()
+    breaker.registrar_fallo()
+    assert breaker.estado == ABIERTO
+
+
+def test_plazo_vencido_usa_el_respaldo_local():
+    gateway = _gateway(LLMDoble(demoras=(0.5,)), respaldo=LLMDoble("respaldo"), plazo_s=0.05)
+    inicio = time.monotonic()
+    assert gateway.invoke("p") == "respaldo"
+    assert time.monotonic() - inicio < 0.4
+    assert gateway.estadisticas()["plazo_vencido"] == 1 and gateway.estadisticas()["respaldo"] == 1
+
+
+def test_sin_respaldo_ni_plantilla_lanza_error():
+    with pytest.raises(LLMNoDisponible):
+        _gateway(LLMDoble(falla=True)).invoke("p")
+
+
+def test_hedge_tras_el_p95_gana_el_duplicado():
+    primario = LLMDoble(demoras=[0.01] * 20 + [0.5, 0.01])
+    gateway = _gateway(primario, hedge=True, hedge_minimo_s=0.02, max_fraccion_hedge=0.5)
+    for _ in range(20):
+        gateway.invoke("p")
+    inicio = time.monotonic()
+    assert gateway.invoke("p") == "ok"
+    assert time.monotonic() - inicio < 0.3
+    assert gateway.estadisticas()["hedge_enviado"] == 1 and gateway.estadisticas()["hedge_ganador"] == 1
+
+
+def test_ainvoke_con_plazo_y_plantilla():
+    gateway = _gateway(LLMDoble(demoras=(0.5,)), plazo_s=0.05)
+    assert asyncio.run(gateway.ainvoke("p", plantilla=lambda: "plantilla")) == "plantilla"
+
+
+def test_stream_entrega_fragmentos_o_el_respaldo_si_falla_antes_del_primero():
+    assert list(_gateway(LLMDoble("hola que tal")).stream("p")) == ["hola", "que", "tal"]
+    assert list(_gateway(LLMDoble(falla=True)).stream("p", plantilla="plantilla")) == ["plantilla"]
+    assert list(_gateway(LLMDoble(demoras=(0.5,)), plazo_s=0.05).stream("p", plantilla="plantilla")) == ["plantilla"]
+
+
+def test_origenes_distinguen_al_primario_del_respaldo():
+    with registrar_origenes() as origenes:
+        _gateway(LLMDoble("remoto")).invoke("p")
+        assert respondio_el_primario()
+        _gateway(LLMDoble(falla=True), respaldo=LLMDoble("local")).invoke("p")
+        assert not respondio_el_primario()
+    assert origenes == ["primario", "respaldo"]
+    # fuera de una consulta no hay registro: no se puede afirmar que respondió el primario
+    assert not respondio_el_primario()
+
+
+def test_sin_hedge_con_el_circuito_semiabierto():
+    reloj = [0.0]
+    breaker = CircuitBreaker(umbral_fallos=1, enfriamiento_s=10, nombre="test", reloj=lambda: reloj[0])
+    primario = LLMDoble(demoras=[0.01] * 20 + [0.2])
+    gateway = _gateway(primario, breaker=breaker, hedge=True, hedge_minimo_s=0.02, max_fraccion_hedge=1.0)
+    for _ in range(20):
+        gateway.invoke("p")
+    breaker.registrar_fallo()
+    reloj[0] = 11.0
+    # la llamada de prueba del semiabierto es lenta pero no se duplica
+    assert gateway.invoke("p") == "ok"
+    assert primario.llamadas == 21 and "hedge_enviado" not in gateway.estadisticas()
+    assert breaker.estado == CERRADO
+
+
+def test_stream_registra_su_latencia_para_el_p95():
+    gateway = _gateway(LLMDoble("hola que tal", demoras=(0.05,)))
+    list(gateway.stream("p"))
+    assert gateway.estadisticas()["p95_s"] >= 0.05
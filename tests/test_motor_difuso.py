@@ -0,0 +1,24 @@
+import numpy as np
+from skfuzzy import control as ctrl
+from motor_difuso import MotorDifusoConfianza, construir_sistema_confianza
+
+
+def _confianza_por_llamada(matched):
+    # Réplica del cálculo original: sistema y simulación nuevos en cada llamada
+    sim = ctrl.ControlSystemSimulation(construir_sistema_confianza())
+    sim.input['num_keywords'] = matched
+    sim.compute()
+    return float(sim.output['confianza'])
+
+
+def test_motor_difuso_coincide_con_skfuzzy():
+    motor = MotorDifusoConfianza()
+    for matched in range(0, 10):
+        assert motor.confianza(matched) == _confianza_por_llamada(matched)
+
+
+def test_motor_difuso_batch():
+    motor = MotorDifusoConfianza()
+    conteos = np.array([0, 1, 2, 3, 4, 5, 7, 12])
+    esperado = [motor.confianza(int(c)) for c in conteos]
+    assert motor.confianza_batch(conteos).tolist() == esperado
@@ -0,0 +1,62 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+from prefork import parsear_smaps, memoria_proceso, reporte_memoria, congelar_para_inferencia
+from rf_compacto import ForestCompacto
+
+SMAPS_ROLLUP = """\
+55d4c0a2e000-7ffd9b7f1000 ---p 00000000 00:00 0                          [rollup]
+Rss:              412340 kB
+Pss:              150210 kB
+Pss_Anon:          90120 kB
+Shared_Clean:     300100 kB
+Shared_Dirty:      12040 kB
+Private_Clean:      2100 kB
+Private_Dirty:     98100 kB
+Referenced:       412340 kB
+Swap:                  0 kB
+"""
+
+
+def test_parsear_smaps_rollup():
+    kb = parsear_smaps(SMAPS_ROLLUP)
+    assert kb["Rss"] == 412340
+    assert kb["Pss"] == 150210  # Pss_Anon no se suma
+    assert kb["Shared_Clean"] + kb["Shared_Dirty"] == 312140
+    assert kb["Private_Clean"] + kb["Private_Dirty"] == 100200
+
+
+def test_parsear_smaps_suma_todos_los_mapeos():
+    mapeo = "Rss: 10 kB\nPss: 5 kB\nShared_Clean: 8 kB\nPrivate_Dirty: 2 kB\n"
+    kb = parsear_smaps(mapeo * 3)
+    assert (kb["Rss"], kb["Pss"], kb["Shared_Clean"], kb["Private_Dirty"]) == (30, 15, 24, 6)
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="requiere /proc")
+def test_memoria_proceso_actual():
+    memoria = memoria_proceso()
+    assert memoria["pid"] == os.getpid()
+    assert memoria["rss_mb"] > 0
+    assert memoria["unica_mb"] + memoria["compartida_mb"] == pytest.approx(memoria["rss_mb"], abs=0.2)
+
+
+def test_reporte_omite_procesos_inexistentes():
+    reporte = reporte_memoria([2 ** 22 + 1])
+    assert reporte == {"workers": [], "unica_total_mb": 0, "pss_total_mb": 0}
+
+
+def test_congelar_deja_el_forest_compacto_de_solo_lectura():
+    forest = ForestCompacto(
+        feature=np.array([0, -1, -1], dtype=np.int32), umbral=np.array([0.5, 0.0, 0.0]),
+        izq=np.array([1, 0, 1], dtype=np.int32), der=np.array([2, -1, -1], dtype=np.int32),
+        valores_hoja=np.array([[1.0, 0.0], [0.0, 1.0]]), raices=np.array([0]),
+        classes_=np.array(["a", "b"]), n_features=1)
+    congelar_para_inferencia(forest)
+    assert not forest.umbral.flags.writeable
+    with pytest.raises(ValueError):
+        forest.valores_hoja[0, 0] = 0.5
+    # la predicción sólo lee
+    assert list(forest.predict(np.array([[0.2], [0.9]]))) == ["a", "b"]
@@ -0,0 +1,101 @@
+from neo4j.exceptions import ServiceUnavailable
+from recuperacion_kg import CYPHER_RECUPERACION, RecuperadorCypher
+
+
+class GraphFalso:
+    def __init__(self, fallos=0):
+        self.fallos = fallos
+        self.llamadas = []
+
+    def query(self, cypher, params=None):
+        self.llamadas.append((cypher, params))
+        if self.fallos:
+            self.fallos -= 1
+            raise ServiceUnavailable("sin conexión")
+        return [{"tipo_problema": "Demora", "solucion": "Esperar 48hs", "matched_count": 1}]
+
+
+def test_consulta_parametrizada_sin_interpolar_valores():
+    graph = GraphFalso()
+    recuperador = RecuperadorCypher(graph, reintentos=0)
+    recuperador.consultar(["Pago", "x' OR 1=1 //"], "Prestador")
+    cypher, params = graph.llamadas[0]
+    assert cypher == CYPHER_RECUPERACION
+    assert "Prestador" not in cypher and "OR 1=1" not in cypher
+    assert params == {"kws": ["pago", "x' or 1=1 //"], "tipo_usuario": "Prestador"}
+
+
+def test_reintenta_errores_transitorios():
+    graph = GraphFalso(fallos=2)
+    recuperador = RecuperadorCypher(graph, reintentos=2, backoff_s=0)
+    resultado = recuperador.consultar(["pago"], "Organizador")
+    assert resultado[0]["solucion"] == "Esperar 48hs"
+    stats = recuperador.estadisticas()
+    assert stats["consultas"] == 1 and stats["reintentos"] == 2
+    assert "p95_ms" in stats
+
+
+def test_aconsultar_sin_driver_async_usa_executor():
+    import asyncio
+    graph = GraphFalso()
+    recuperador = RecuperadorCypher(graph, reintentos=0)
+    resultado = asyncio.run(recuperador.aconsultar(["pago"], "Propietario"))
+    assert resultado[0]["tipo_problema"] == "Demora"
+    assert graph.llamadas[0][1]["tipo_usuario"] == "Propietario"
+
+
+def test_un_driver_async_por_event_loop():
+    import asyncio
+
+    class Registro:
+        def __init__(self, datos):
+            self._datos = datos
+
+        def data(self):
+            return self._datos
+
+    class DriverAsyncFalso:
+        def __init__(self):
+            self.loop = None
+            self.cerrado = False
+            self.bases = []
+
+        async def execute_query(self, query, parameters_=None, database_=None):
+            loop = asyncio.get_running_loop()
+            # como el driver real: sus conexiones no sirven en otro loop
+            assert self.loop in (None, loop), "driver usado desde otro event loop"
+            assert not self.cerrado
+            self.loop = loop
+            self.bases.append(database_)
+            return [Registro({"solucion": "Esperar 48hs"})], None, None
+
+        async def close(self):
+            assert asyncio.get_running_loop() is self.loop
+            self.cerrado = True
+
+    creados = []
+
+    def fabrica():
+        creados.append(DriverAsyncFalso())
+        return creados[-1]
+
+    graph = GraphFalso()
+    graph._database = "wevently"
+    recuperador = RecuperadorCypher(graph, reintentos=0, fabrica_driver_async=fabrica)
+
+    async def dos_consultas():
+        return [await recuperador.aconsultar(["pago"], "Organizador") for _ in range(2)]
+
+    for _ in range(2):
+        assert asyncio.run(dos_consultas())[1][0]["solucion"] == "Esperar 48hs"
+    assert len(creados) == 2
+    # cada driver se cerró en su loop al terminar asyncio.run, y consultó la base del grafo
+    assert all(d.cerrado for d in creados)
+    assert {b for d in creados for b in d.bases} == {"wevently"}
+
+    async def consultar_y_cerrar():
+        await recuperador.aconsultar(["pago"], "Organizador")
+        await recuperador.acerrar()
+        return creados[-1].cerrado
+
+    assert asyncio.run(consultar_y_cerrar())
@@ -0,0 +1,48 @@
+import threading
+import time
+from recursos import RegistroRecursos
+
+
+def test_carga_diferida_una_sola_vez_con_hilos_concurrentes():
+    registro = RegistroRecursos()
+    cargas = []
+
+    def cargar():
+        cargas.append(1)
+        time.sleep(0.05)
+        return object()
+
+    registro.registrar("modelo", cargar)
+    assert not registro.cargado("modelo")
+    resultados = []
+    hilos = [threading.Thread(target=lambda: resultados.append(registro.obtener("modelo"))) for _ in range(8)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    assert len(cargas) == 1
+    assert all(r is resultados[0] for r in resultados)
+    assert registro.estado()["modelo"]["carga_ms"] >= 50 * 0.9
+
+
+def test_warmup_reporta_tiempos_y_listo():
+    registro = RegistroRecursos()
+    registro.registrar("a", lambda: 1)
+    registro.registrar("b", lambda: 2)
+    assert not registro.listo()
+    tiempos = registro.warmup()
+    assert set(tiempos) == {"a", "b"}
+    assert registro.listo()
+
+
+def test_fijar_reemplaza_sin_llamar_al_cargador():
+    registro = RegistroRecursos()
+
+    def cargar():
+        raise AssertionError("no debería cargarse")
+
+    registro.registrar("graph", cargar)
+    doble = object()
+    registro.fijar("graph", doble)
+    assert registro.obtener("graph") is doble
+    assert registro.cargado("graph")
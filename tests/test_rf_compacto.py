@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("sklearn")
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.feature_extraction.text import TfidfVectorizer
+from rf_compacto import ForestCompacto
+
+PALABRAS = ["pago", "tarjeta", "rechazada", "evento", "servicio", "salon", "error", "app", "cobro",
+            "comision", "reserva", "cancelar", "hola", "precio", "login", "clave", "transferencia"]
+CATEGORIAS = ["ProblemaPago", "ProblemaServicio", "ProblemaTecnico", "ConsultaGeneral", "NoRepresentaAlDominio"]
+
+
+def _corpus(n, semilla):
+    rng = np.random.default_rng(semilla)
+    textos = [" ".join(rng.choice(PALABRAS, size=rng.integers(1, 8))) for _ in range(n)]
+    etiquetas = [CATEGORIAS[sum(map(len, t.split())) % len(CATEGORIAS)] for t in textos]
+    return textos, etiquetas
+
+
+@pytest.fixture(scope="module")
+def modelos():
+    textos, etiquetas = _corpus(400, 0)
+    vectorizador = TfidfVectorizer().fit(textos)
+    rf = RandomForestClassifier(n_estimators=25, random_state=0).fit(vectorizador.transform(textos), etiquetas)
+    return vectorizador, rf
+
+
+def test_paridad_con_predict_proba_disperso_y_denso(modelos):
+    vectorizador, rf = modelos
+    textos, _ = _corpus(200, 1)
+    X = vectorizador.transform(textos + ["", "palabra fuera del vocabulario"])
+    compacto = ForestCompacto.desde_sklearn(rf)
+    np.testing.assert_allclose(compacto.predict_proba(X), rf.predict_proba(X), atol=1e-12)
+    np.testing.assert_allclose(compacto.predict_proba(X[:1]), rf.predict_proba(X[:1]), atol=1e-12)
+    np.testing.assert_allclose(compacto.predict_proba(X.toarray()), rf.predict_proba(X), atol=1e-12)
+    assert list(compacto.predict(X)) == list(rf.predict(X))
+
+
+def test_artefacto_npz_conserva_la_prediccion(modelos, tmp_path):
+    vectorizador, rf = modelos
+    ruta = tmp_path / "rf.npz"
+    ForestCompacto.desde_sklearn(rf).guardar(str(ruta))
+    cargado = ForestCompacto.cargar(str(ruta))
+    X = vectorizador.transform(_corpus(50, 2)[0])
+    np.testing.assert_allclose(cargado.predict_proba(X), rf.predict_proba(X), atol=1e-12)
+    assert list(cargado.classes_) == list(rf.classes_)
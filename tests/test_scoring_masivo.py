@@ -0,0 +1,51 @@
+import csv
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from scoring_masivo import leer_tickets, en_lotes, procesar_en_orden, EscritorResultados
+
+
+def test_lee_jsonl_y_csv_con_rol_por_defecto(tmp_path):
+    jsonl = tmp_path / "t.jsonl"
+    jsonl.write_text('{"id": "a", "mensaje": "no me pagaron"}\n\n{"mensaje": "hola", "tipo_usuario": "Organizador"}\n{"otro": 1}\n',
+                     encoding="utf-8")
+    assert list(leer_tickets(str(jsonl))) == [
+        {"id": "a", "texto": "no me pagaron", "tipo_usuario": "Prestador"},
+        {"id": 2, "texto": "hola", "tipo_usuario": "Organizador"},
+    ]
+    archivo_csv = tmp_path / "t.csv"
+    archivo_csv.write_text("ticket,descripcion\n7,mi evento\n", encoding="utf-8")
+    assert list(leer_tickets(str(archivo_csv), campo_texto="descripcion", campo_id="ticket")) == [
+        {"id": "7", "texto": "mi evento", "tipo_usuario": "Prestador"}]
+
+
+def test_resultados_en_orden_con_lotes_en_vuelo_acotados():
+    en_vuelo, maximo, lock = [0], [0], threading.Lock()
+
+    def procesar(lote, factor):
+        with lock:
+            en_vuelo[0] += 1
+            maximo[0] = max(maximo[0], en_vuelo[0])
+        time.sleep(0.01 * (len(lote) % 3))
+        with lock:
+            en_vuelo[0] -= 1
+        return [x * factor for x in lote]
+
+    with ThreadPoolExecutor(4) as ejecutor:
+        resultados = list(procesar_en_orden(ejecutor, procesar, en_lotes(range(25), 4), 2, 10))
+    assert [x for lote in resultados for x in lote] == [x * 10 for x in range(25)]
+    assert maximo[0] <= 2
+
+
+def test_escritor_csv_une_listas(tmp_path):
+    ruta = tmp_path / "salida.csv"
+    with EscritorResultados(str(ruta)) as escritor:
+        escritor.escribir([{"id": 1, "keywords": ["pago", "evento"], "categoria_ml": "Pagos"}])
+    filas = list(csv.DictReader(ruta.open(encoding="utf-8")))
+    assert filas[0]["keywords"] == "pago|evento" and filas[0]["categoria_ml"] == "Pagos"
+
+    ruta = tmp_path / "salida.jsonl"
+    with EscritorResultados(str(ruta)) as escritor:
+        escritor.escribir([{"id": 1, "keywords": ["pago"]}])
+    assert json.loads(ruta.read_text(encoding="utf-8")) == {"id": 1, "keywords": ["pago"]}
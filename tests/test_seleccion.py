@@ -0,0 +1,29 @@
+import threading
+
+import wevently_langchain as wl
+
+
+def _candidato(solucion, matched_count, has_type=1, confianza=0.8):
+    return {"tipo_problema": solucion, "solucion": solucion, "has_type": has_type,
+            "matched_count": matched_count, "confianza": confianza}
+
+
+def test_una_keyword_de_diferencia_no_es_ganador_claro():
+    assert wl.ganador_claro([_candidato("a", 3), _candidato("b", 2)]) is None
+
+
+def test_margen_de_keywords_o_has_type_decide_sin_llm():
+    primero = _candidato("a", 4)
+    assert wl.ganador_claro([primero, _candidato("b", 2)]) is primero
+    primero = _candidato("a", 2, has_type=1)
+    assert wl.ganador_claro([primero, _candidato("b", 2, has_type=0)]) is primero
+
+
+def test_conteo_de_rutas_desde_varios_hilos():
+    antes = wl.estadisticas_seleccion().get("prueba_hilos", {"conteo": 0})["conteo"]
+    hilos = [threading.Thread(target=lambda: [wl._contar_ruta("prueba_hilos") for _ in range(1000)]) for _ in range(8)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert wl.estadisticas_seleccion()["prueba_hilos"]["conteo"] == antes + 8000
@@ -0,0 +1,109 @@
+import gzip
+import json
+import os
+import time
+import multiprocessing
+import pytest
+from sink_resultados import SinkResultados, SinkCola, ReceptorResultados
+
+
+def test_escribe_en_lotes_y_cierra_vaciando(tmp_path):
+    ruta = tmp_path / "resultados.json"
+    sink = SinkResultados(ruta=str(ruta), formato="jsonl", tam_lote=3, intervalo_s=10)
+    for i in range(7):
+        assert sink.registrar({"test_id": i})
+    sink.cerrar()
+    lineas = [json.loads(l) for l in ruta.read_text().splitlines()]
+    assert [r["test_id"] for r in lineas] == list(range(7))
+    assert sink.estadisticas()["escritos"] == 7
+
+
+def test_cola_llena_descarta_y_cuenta(tmp_path):
+    sink = SinkResultados(ruta=str(tmp_path / "r.json"), formato="jsonl", max_cola=1, tam_lote=1000, intervalo_s=10)
+    aceptados = sum(sink.registrar({"i": i}) for i in range(500))
+    sink.cerrar()
+    stats = sink.estadisticas()
+    assert stats["descartados"] == 500 - aceptados > 0
+
+
+def test_rota_y_comprime(tmp_path):
+    ruta = tmp_path / "resultados.json"
+    sink = SinkResultados(ruta=str(ruta), formato="jsonl", tam_lote=1, intervalo_s=0.01, max_bytes=200, backups=2)
+    for i in range(40):
+        sink.registrar({"respuesta": "x" * 50, "i": i})
+    sink.cerrar()
+    assert sink.estadisticas()["rotaciones"] > 0
+    with gzip.open(f"{ruta}.1.gz", "rt") as f:
+        assert json.loads(f.readline())["respuesta"] == "x" * 50
+    assert not os.path.exists(f"{ruta}.3.gz")
+
+
+def test_formato_jsonl_gz(tmp_path):
+    ruta = tmp_path / "r.jsonl.gz"
+    sink = SinkResultados(ruta=str(ruta), formato="jsonl.gz", tam_lote=2, intervalo_s=10)
+    for i in range(5):
+        sink.registrar({"i": i})
+    sink.cerrar()
+    with gzip.open(ruta, "rt") as f:
+        assert [json.loads(l)["i"] for l in f] == list(range(5))
+
+
+def test_formato_parquet_opcional(tmp_path):
+    import pytest
+    pq = pytest.importorskip("pyarrow.parquet")
+    ruta = tmp_path / "r.parquet"
+    sink = SinkResultados(ruta=str(ruta), formato="parquet", tam_lote=2, intervalo_s=10)
+    for i in range(3):
+        sink.registrar({"test_id": str(i), "confianza_ml": 0.5, "plan": {"x": i}, "nuevo": 1})
+    sink.cerrar()
+    tabla = pq.read_table(ruta)
+    assert tabla.num_rows == 3
+    assert json.loads(tabla.column("extra")[0].as_py()) == {"nuevo": 1}
+
+
+def test_intervalo_cero_explicito_no_usa_el_default(tmp_path, monkeypatch):
+    monkeypatch.setenv("WEVENTLY_SINK_INTERVALO", "5")
+    ruta = tmp_path / "r.jsonl"
+    sink = SinkResultados(ruta=str(ruta), formato="jsonl", intervalo_s=0, tam_lote=1000)
+    try:
+        assert sink.intervalo_s == 0
+        # inactivo no consume CPU: el hilo escritor queda bloqueado en la cola
+        cpu = time.process_time()
+        time.sleep(0.3)
+        assert time.process_time() - cpu < 0.1
+        sink.registrar({"i": 1})
+        for _ in range(100):
+            if ruta.exists() and ruta.read_text():
+                break
+            time.sleep(0.01)
+        assert json.loads(ruta.read_text()) == {"i": 1}
+    finally:
+        sink.cerrar()
+
+
+def test_cola_de_tamano_cero_se_rechaza(tmp_path):
+    with pytest.raises(ValueError):
+        SinkResultados(ruta=str(tmp_path / "r.jsonl"), formato="jsonl", max_cola=0)
+
+
+def _registrar_desde_worker(cola, n):
+    sink = SinkCola(cola)
+    for i in range(n):
+        sink.registrar({"pid": os.getpid(), "i": i})
+
+
+def test_workers_escriben_por_el_sink_del_proceso_padre(tmp_path):
+    contexto = multiprocessing.get_context("fork")
+    cola = contexto.Queue()
+    ruta = tmp_path / "resultados.json"
+    sink = SinkResultados(ruta=str(ruta), formato="jsonl", tam_lote=10, intervalo_s=0.05)
+    receptor = ReceptorResultados(cola, sink)
+    workers = [contexto.Process(target=_registrar_desde_worker, args=(cola, 50)) for _ in range(3)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    receptor.cerrar()
+    sink.cerrar()
+    lineas = [json.loads(l) for l in ruta.read_text().splitlines()]
+    assert len(lineas) == 150 and len({r["pid"] for r in lineas}) == 3
@@ -0,0 +1,98 @@
+from snapshot_kg import (
+    SnapshotConocimiento,
+    RecuperadorConSnapshot,
+    CYPHER_SNAPSHOT_DISPARA,
+    CYPHER_SNAPSHOT_CATEGORIAS,
+    huella_contenido,
+)
+
+FILAS_DISPARA = [
+    {"palabra": "Pago", "categoria": "c1"},
+    {"palabra": "acreditar", "categoria": "c1"},
+    {"palabra": "tarjeta", "categoria": "c2"},
+    {"palabra": "pago", "categoria": "c2"},
+]
+FILAS_CATEGORIAS = [
+    {"categoria": "c1", "confianza": 0.8, "soluciones": [["Demora en acreditación", "Esperar 48hs"]]},
+    {"categoria": "c2", "confianza": 0.9, "soluciones": [["Tarjeta rechazada", "Verificar datos"], ["Tarjeta rechazada", "Reintentar"]]},
+    {"categoria": "c3", "confianza": 0.5, "soluciones": [[None, None]]},
+]
+FILAS_TIPOS = [{"categoria": "c2", "tipos_usuario": ["Organizador"]}]
+
+
+def _snapshot():
+    snapshot = SnapshotConocimiento(graph=None, ttl_s=60)
+    snapshot.cargar_desde_filas(FILAS_DISPARA, FILAS_CATEGORIAS, FILAS_TIPOS)
+    return snapshot
+
+
+def test_snapshot_ordena_como_la_consulta_cypher():
+    filas = _snapshot().consultar(["pago", "acreditar"], "Prestador")
+    assert [(f["tipo_problema"], f["matched_count"], f["has_type"]) for f in filas] == [
+        ("Demora en acreditación", 2, 0),
+        ("Tarjeta rechazada", 1, 0),
+        ("Tarjeta rechazada", 1, 0),
+    ]
+    assert filas[0]["matched_keywords"] == ["Pago", "acreditar"]
+
+
+def test_snapshot_prioriza_tipo_de_usuario():
+    filas = _snapshot().consultar(["pago", "acreditar"], "Organizador")
+    assert filas[0]["tipo_problema"] == "Tarjeta rechazada" and filas[0]["has_type"] == 1
+    assert filas[0]["matched_keywords"] == ["pago"]
+
+
+class RecuperadorVivoFalso:
+    def __init__(self):
+        self.llamadas = 0
+
+    def consultar(self, keywords, tipo_usuario):
+        self.llamadas += 1
+        return [{"tipo_problema": "vivo"}]
+
+    def estadisticas(self):
+        return {}
+
+
+def test_snapshot_vencido_cae_a_neo4j_en_vivo():
+    snapshot = _snapshot()
+    snapshot.ttl_s = 0
+    snapshot.refrescar_en_segundo_plano = lambda: None
+    vivo = RecuperadorVivoFalso()
+    recuperador = RecuperadorConSnapshot(snapshot, vivo)
+    assert recuperador.consultar(["pago"], "Prestador") == [{"tipo_problema": "vivo"}]
+    snapshot.ttl_s = 60
+    assert recuperador.consultar(["pago"], "Prestador")[0]["tipo_problema"] != "vivo"
+    assert vivo.llamadas == 1
+
+
+class GrafoFalso:
+    def __init__(self, filas_categorias):
+        self.filas_categorias = filas_categorias
+
+    def query(self, cypher, params=None):
+        if cypher == CYPHER_SNAPSHOT_DISPARA:
+            return FILAS_DISPARA
+        if cypher == CYPHER_SNAPSHOT_CATEGORIAS:
+            return self.filas_categorias
+        return FILAS_TIPOS
+
+
+def test_verificar_detecta_edicion_de_contenido_con_los_mismos_conteos():
+    grafo = GrafoFalso(FILAS_CATEGORIAS)
+    snapshot = SnapshotConocimiento(grafo, ttl_s=60)
+    snapshot.cargar()
+    versiones = []
+    snapshot.observadores.append(versiones.append)
+    snapshot.verificar()
+    assert versiones == []
+    # misma cantidad de nodos y relaciones, otra acción
+    grafo.filas_categorias = [dict(FILAS_CATEGORIAS[0], soluciones=[["Demora en acreditación", "Esperar 72hs"]])] + FILAS_CATEGORIAS[1:]
+    snapshot.verificar()
+    assert versiones == [snapshot.version]
+    assert snapshot.consultar(["acreditar"], "Prestador")[0]["solucion"] == "Esperar 72hs"
+
+
+def test_huella_no_depende_del_orden_de_las_filas():
+    assert huella_contenido(FILAS_DISPARA, FILAS_CATEGORIAS, FILAS_TIPOS) == \
+        huella_contenido(FILAS_DISPARA[::-1], FILAS_CATEGORIAS[::-1], FILAS_TIPOS)
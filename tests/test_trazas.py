@@ -0,0 +1,54 @@
+import time
+import urllib.request
+from trazas import RegistroMetricas, Histograma, METRICAS, iniciar_traza, traza_actual, span, instrumentar, iniciar_servidor_metricas
+
+
+def test_instrumentar_conserva_el_retorno_y_registra_el_span():
+    @instrumentar("etapa_prueba")
+    def sumar(a, b):
+        time.sleep(0.01)
+        return a + b
+
+    with iniciar_traza("t-1") as traza:
+        assert sumar(1, 2) == 3
+        assert traza_actual() is traza
+    assert traza_actual() is None
+    assert traza.duracion_s("etapa_prueba") >= 0.01
+    etapas = [s["etapa"] for s in traza.resumen()["spans"]]
+    assert etapas == ["etapa_prueba", "total"]
+    assert METRICAS.resumen()["etapa_prueba"]["conteo"] >= 1
+
+
+def test_span_fuera_de_traza_solo_alimenta_el_histograma():
+    with span("sin_traza") as s:
+        pass
+    assert s.trace_id is None and s.duracion_s >= 0
+
+
+def test_percentil_interpolado_dentro_del_bucket():
+    h = Histograma(buckets=(0.1, 0.2))
+    for v in (0.05, 0.15, 0.15, 0.15):
+        h.observar(v)
+    assert h.percentil(25) == 0.1
+    assert 0.1 < h.percentil(50) <= 0.2
+
+
+def test_exportacion_prometheus_y_endpoint():
+    metricas = RegistroMetricas()
+    metricas.observar("latencia_segundos", 0.003, etapa="neo4j")
+    metricas.contar("solicitudes_total", ruta="deterministica")
+    texto = metricas.exportar_prometheus()
+    assert "# TYPE latencia_segundos histogram" in texto
+    assert 'latencia_segundos_bucket{etapa="neo4j",le="0.005"} 1' in texto
+    assert 'latencia_segundos_bucket{etapa="neo4j",le="+Inf"} 1' in texto
+    assert 'solicitudes_total{ruta="deterministica"} 1' in texto
+
+    with span("endpoint_prueba"):
+        pass
+    servidor = iniciar_servidor_metricas(0)
+    try:
+        url = f"http://127.0.0.1:{servidor.server_address[1]}/metrics"
+        cuerpo = urllib.request.urlopen(url, timeout=5).read().decode("utf-8")
+        assert 'etapa="endpoint_prueba"' in cuerpo
+    finally:
+        servidor.shutdown()